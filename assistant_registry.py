@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from openai import NotFoundError
+
+from profiling import span
+
+DEFAULT_REGISTRY_PATH = ".assistant_registry.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600  # 7 天未使用的遠端物件視為過期
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assistants (
+    key TEXT PRIMARY KEY,
+    assistant_id TEXT NOT NULL,
+    name TEXT,
+    model TEXT,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    filename TEXT,
+    bytes INTEGER,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def _sha256_file(file_path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def assistant_key(name, instructions, model, tools):
+    """由 Assistant 設定 (名稱、instructions、模型、工具) 計算雜湊鍵"""
+    payload = json.dumps({"name": name, "instructions": instructions, "model": model, "tools": tools},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AssistantRegistry:
+    """
+    本地 SQLite 登錄表：記錄已建立的 Assistant 與已上傳的檔案，讓每次執行都能重複使用
+
+    - Assistant 以 instructions / model / tools 的雜湊為鍵
+    - 檔案以內容雜湊 + purpose 為鍵
+    - cleanup() 會刪除超過 TTL 未使用的遠端物件
+    """
+
+    def __init__(self, client, path=DEFAULT_REGISTRY_PATH, verify=True):
+        """
+        :param client: OpenAI client
+        :param path: SQLite 檔案路徑
+        :param verify: 重複使用前是否先向 API 確認遠端物件仍存在
+        """
+        self.client = client
+        self.verify = verify
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _lookup(self, table, id_column, key):
+        row = self.conn.execute(f"SELECT {id_column} FROM {table} WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _touch(self, table, key):
+        with self.conn:
+            self.conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def _forget(self, table, key):
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+
+    def _exists(self, retrieve, object_id):
+        if not self.verify:
+            return True
+        try:
+            retrieve(object_id)
+            return True
+        except NotFoundError:
+            return False
+
+    def get_or_create_assistant(self, name, instructions, model, tools):
+        """
+        取得相同設定的 Assistant，不存在時才建立
+
+        :return: assistant_id
+        """
+        key = assistant_key(name, instructions, model, tools)
+        assistant_id = self._lookup("assistants", "assistant_id", key)
+        if assistant_id and self._exists(self.client.beta.assistants.retrieve, assistant_id):
+            self._touch("assistants", key)
+            print(f"Assistant Reused: {assistant_id}")
+            return assistant_id
+
+        assistant = self.client.beta.assistants.create(
+            name=name, instructions=instructions, tools=tools, model=model
+        )
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO assistants VALUES (?, ?, ?, ?, ?, ?)",
+                (key, assistant.id, name, model, now, now),
+            )
+        print(f"Assistant Created: {assistant.id}")
+        return assistant.id
+
+    def get_or_upload_file(self, file_path, purpose="assistants"):
+        """
+        取得內容相同的已上傳檔案，不存在時才上傳
+
+        :return: file_id
+        """
+        key = f"{_sha256_file(file_path)}:{purpose}"
+        file_id = self._lookup("files", "file_id", key)
+        if file_id and self._exists(self.client.files.retrieve, file_id):
+            self._touch("files", key)
+            print(f"File Reused: {file_id}")
+            return file_id
+
+        with open(file_path, "rb") as f, span("files.create", file=os.path.basename(file_path),
+                                              bytes=os.path.getsize(file_path)):
+            uploaded = self.client.files.create(file=f, purpose=purpose)
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (key, uploaded.id, os.path.basename(file_path), os.path.getsize(file_path), now, now),
+            )
+        print(f"File Uploaded: {uploaded.id}")
+        return uploaded.id
+
+    def cleanup(self, ttl=DEFAULT_TTL):
+        """
+        刪除超過 ttl 秒未使用的遠端 Assistant 與檔案，並移除登錄紀錄
+
+        :param ttl: 存活秒數
+        :return: (刪除的 Assistant 數, 刪除的檔案數)
+        """
+        cutoff = time.time() - ttl
+        removed = []
+        for table, id_column, delete in (
+            ("assistants", "assistant_id", self.client.beta.assistants.delete),
+            ("files", "file_id", self.client.files.delete),
+        ):
+            rows = self.conn.execute(
+                f"SELECT key, {id_column} FROM {table} WHERE last_used < ?", (cutoff,)
+            ).fetchall()
+            count = 0
+            for key, object_id in rows:
+                try:
+                    delete(object_id)
+                except NotFoundError:
+                    pass  # 遠端已不存在，直接移除紀錄
+                except Exception as e:
+                    print(f"[WARN] 無法刪除 {object_id}: {e}")
+                    continue
+                self._forget(table, key)
+                count += 1
+            removed.append(count)
+        return tuple(removed)
@@ -0,0 +1,225 @@
+import asyncio
+import functools
+import os
+import time
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from profiling import record, span
+
+# Run 結束 (不會再變動) 的狀態
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+
+def _api_key(api_key=None):
+    if api_key is None:
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        raise ValueError("API key is not set.")
+    return api_key
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """
+    共用的同步 OpenAI client，第一次使用時才讀取 .env 並建立 (匯入模組時沒有副作用)
+
+    :return: OpenAI
+    """
+    return OpenAI(api_key=_api_key())
+
+
+def create_async_client(api_key=None, base_url=None):
+    """
+    建立 AsyncOpenAI client
+
+    :param api_key: API Key；None 時從 .env / 環境變數 OPENAI_API_KEY 讀取
+    :param base_url: API 位址，可指向本地的假 Assistants 伺服器 (fake_assistants_server.py)
+    :return: AsyncOpenAI
+    """
+    return AsyncOpenAI(api_key=_api_key(api_key), base_url=base_url)
+
+
+def _server_timings(run):
+    """由伺服器端時間戳記計算排隊與執行秒數 (欄位不存在時略過)"""
+    created = getattr(run, "created_at", None)
+    started = getattr(run, "started_at", None)
+    ended = next((t for t in (getattr(run, name, None) for name in
+                              ("completed_at", "failed_at", "cancelled_at")) if t), None)
+    timings = {}
+    if isinstance(created, (int, float)) and isinstance(started, (int, float)):
+        timings["queued_s"] = started - created
+    if isinstance(started, (int, float)) and isinstance(ended, (int, float)):
+        timings["executed_s"] = ended - started
+    return timings
+
+
+class RunManager:
+    """
+    非阻塞的 Assistant Run 管理器
+
+    以指數退避 (exponential backoff) 輪詢 Run 狀態，支援多個 thread / run 同時進行、
+    逾時與取消；等待中的 task 被取消或逾時時，會一併向伺服器取消該 Run。
+    """
+
+    def __init__(self, client=None, initial_delay=0.5, max_delay=8.0, backoff=2.0, timeout=600.0,
+                 max_concurrency=8, verbose=True):
+        """
+        :param client: AsyncOpenAI client，None 時由 create_async_client() 建立
+        :param initial_delay: 第一次輪詢前等待的秒數
+        :param max_delay: 輪詢間隔上限 (秒)
+        :param backoff: 每次輪詢後間隔乘上的倍數
+        :param timeout: 單一 Run 的預設逾時秒數，None 表示不限
+        :param max_concurrency: 同時進行中的 Run 數量上限
+        :param verbose: 是否印出狀態變化
+        """
+        self.client = client or create_async_client()
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self.verbose = verbose
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _log(self, message):
+        if self.verbose:
+            print(message, flush=True)
+
+    async def cancel(self, thread_id, run_id):
+        """向伺服器取消 Run (Run 已結束時忽略錯誤)"""
+        try:
+            return await self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            self._log(f"[WARN] 無法取消 Run {run_id}: {e}")
+            return None
+
+    async def _poll(self, thread_id, run_id):
+        delay = self.initial_delay
+        last_status = None
+        status_since = time.perf_counter()
+        while True:
+            with span("run.retrieve"):
+                run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+            if run.status != last_status:
+                self._log(f"Run {run_id} Status: {run.status}")
+                # 以輪詢觀察到的狀態變化記錄各階段 (queued、in_progress ...) 的大約時間
+                now = time.perf_counter()
+                if last_status is not None:
+                    record(f"run.{last_status}", status_since, now - status_since, run_id=run_id)
+                last_status, status_since = run.status, now
+            if run.status in TERMINAL_STATUSES or run.status == "requires_action":
+                return run
+            await asyncio.sleep(delay)
+            delay = min(delay * self.backoff, self.max_delay)
+
+    async def wait(self, thread_id, run_id, timeout=None, cancel_on_timeout=True):
+        """
+        等待 Run 結束 (或進入 requires_action)
+
+        :param thread_id: Thread ID
+        :param run_id: Run ID
+        :param timeout: 逾時秒數，None 時使用 self.timeout
+        :param cancel_on_timeout: 逾時或被取消時是否向伺服器取消 Run
+        :return: 最終的 Run 物件
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        with span("run.wait", run_id=run_id) as s:
+            try:
+                run = await asyncio.wait_for(self._poll(thread_id, run_id), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                if cancel_on_timeout:
+                    await asyncio.shield(self.cancel(thread_id, run_id))
+                raise
+            s.set(status=run.status, **_server_timings(run))
+        self._log(f"Run {run_id} finished in {time.perf_counter() - started:.1f}s")
+        return run
+
+    async def create_and_wait(self, thread_id, assistant_id, timeout=None, **run_kwargs):
+        """
+        在既有 Thread 上建立 Run 並等待完成 (受 max_concurrency 限制)
+
+        :return: 最終的 Run 物件
+        """
+        async with self._semaphore:
+            run = await self.client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, **run_kwargs
+            )
+            self._log(f"Run Created: {run.id}")
+            return await self.wait(thread_id, run.id, timeout)
+
+    async def stream(self, thread_id, assistant_id, event_handler=None, timeout=None, cancel_on_timeout=True,
+                     **run_kwargs):
+        """
+        以串流方式執行 Run，串流結束即代表完成，不需輪詢
+
+        :param event_handler: openai.AsyncAssistantEventHandler，None 表示不處理事件
+        :param timeout: 逾時秒數，None 時使用 self.timeout
+        :param cancel_on_timeout: 逾時或被取消時是否向伺服器取消 Run (關閉串流不會停止伺服器上的 Run)
+        :return: 最終的 Run 物件
+        """
+        opened = []  # 已開啟的串流，逾時時由此取得 Run ID
+
+        async def _run():
+            kwargs = dict(run_kwargs)
+            if event_handler is not None:
+                kwargs["event_handler"] = event_handler
+            async with self.client.beta.threads.runs.stream(
+                thread_id=thread_id, assistant_id=assistant_id, **kwargs
+            ) as stream:
+                opened.append(stream)
+                await stream.until_done()
+                return await stream.get_final_run()
+
+        async with self._semaphore:
+            timeout = self.timeout if timeout is None else timeout
+            with span("run.stream") as s:
+                try:
+                    run = await asyncio.wait_for(_run(), timeout)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    current = opened[0].current_run if opened else None
+                    if cancel_on_timeout and current is not None and current.status not in TERMINAL_STATUSES:
+                        await asyncio.shield(self.cancel(thread_id, current.id))
+                    raise
+                s.set(status=run.status, **_server_timings(run))
+                return run
+
+    async def run_thread(self, assistant_id, messages, timeout=None, **run_kwargs):
+        """
+        建立新的 Thread (帶入 messages) 並執行到完成
+
+        :return: (thread, run)
+        """
+        thread = await self.client.beta.threads.create(messages=messages)
+        self._log(f"Thread Created: {thread.id}")
+        run = await self.create_and_wait(thread.id, assistant_id, timeout, **run_kwargs)
+        return thread, run
+
+    async def run_many(self, jobs, timeout=None):
+        """
+        同時執行多個分析
+
+        :param jobs: [(assistant_id, messages), ...]
+        :param timeout: 每個 Run 的逾時秒數
+        :return: 與 jobs 同順序的 [(thread, run) 或 Exception]
+        """
+        tasks = [self.run_thread(assistant_id, messages, timeout) for assistant_id, messages in jobs]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def wait_for_run(thread_id, run_id, timeout=600.0, **manager_kwargs):
+    """
+    同步程式使用的便利函式：以非阻塞的退避輪詢等待單一 Run 完成
+
+    :return: 最終的 Run 物件
+    """
+    async def _main():
+        manager = RunManager(timeout=timeout, **manager_kwargs)
+        try:
+            return await manager.wait(thread_id, run_id)
+        finally:
+            await manager.client.close()
+
+    return asyncio.run(_main())
@@ -0,0 +1,203 @@
+"""
+INP 解析與 SHP 輸出主要流程的基準測試
+
+以 synthetic_data 產生指定規模的 INP / SHP 壓縮檔，每個項目在獨立的子 process 中執行，
+記錄耗時、吞吐量 (彎曲點 / 秒、輸出 MB/s) 與峰值 RSS；前置步驟 (例如 save_to_json 需要的解析結果)
+不計入耗時。
+
+結果以 JSON 寫入 --output，可用 --compare 與先前的結果比較 (列出耗時與峰值 RSS 的變化比例)。
+
+使用方式：
+    python benchmarks/bench_pipeline.py --vertices 10000 100000 --output bench.json
+    python benchmarks/bench_pipeline.py --vertices 10000 100000 --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_data import DEFAULT_VERTICES_PER_PIPE, generate
+
+# 項目 -> 需要的輸入 ("inp" 或 "shp")
+TARGETS = {
+    "parse_inp": "inp",
+    "save_to_json": "inp",
+    "load_shapefiles": "shp",
+    "plot_shapefiles": "shp",
+    "save_individual_geojson": "shp",
+    "merge_all_to_single_geojson": "shp",
+}
+
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux 單位為 KiB
+
+
+def _output_bytes(path):
+    if path is None or not os.path.exists(path):
+        return 0
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _prepare(target, source):
+    """執行不計時的前置步驟，回傳要計時的函式 (接收輸出路徑)"""
+    # 重量級套件在第一次使用時才匯入，先在這裡匯入，避免匯入時間計入耗時
+    from parse_inp import get_transformer
+    get_transformer()
+    if TARGETS[target] == "shp":
+        import geopandas  # noqa: F401
+        import matplotlib.pyplot  # noqa: F401
+
+    if target == "parse_inp":
+        from parse_inp import parse_inp
+        return lambda out: parse_inp(source)
+    if target == "save_to_json":
+        from parse_inp import parse_inp_network, save_to_json
+        network = parse_inp_network(source)
+        return lambda out: save_to_json(network, out)
+    if target == "load_shapefiles":
+        from parse_shp import load_shapefiles
+        return lambda out: load_shapefiles(source)
+
+    from parse_shp import LayerCache, load_shapefiles, merge_all_to_single_geojson, plot_shapefiles, \
+        save_individual_geojson
+    shapefiles = load_shapefiles(source)
+    if target == "plot_shapefiles":
+        # 包含座標轉換 (LayerCache 第一次取用時轉換)
+        return lambda out: plot_shapefiles(LayerCache(shapefiles), out)
+    layers = LayerCache(shapefiles)
+    for name in layers.names():
+        layers.get(name)  # 座標轉換不計入輸出耗時
+    if target == "save_individual_geojson":
+        return lambda out: save_individual_geojson(layers, out)
+    return lambda out: merge_all_to_single_geojson(layers, out)
+
+
+def _output_path(target, tmp):
+    if target == "parse_inp" or target == "load_shapefiles":
+        return None
+    if target == "plot_shapefiles":
+        return os.path.join(tmp, "map.png")
+    if target == "save_individual_geojson":
+        return os.path.join(tmp, "geojson_output")
+    return os.path.join(tmp, target + ".json" if target == "save_to_json" else "all_in_one.geojson")
+
+
+def run_child(target, source, n_vertices):
+    """在子 process 中執行單一項目並以 JSON 印出結果"""
+    import matplotlib
+    matplotlib.use("Agg")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = _output_path(target, tmp)
+        func = _prepare(target, source)
+        rss_before = _max_rss_bytes()
+        started = time.perf_counter()
+        func(out)
+        elapsed = time.perf_counter() - started
+        size = _output_bytes(out)
+    print(json.dumps({
+        "target": target,
+        "vertices": n_vertices,
+        "seconds": elapsed,
+        "vertices_per_s": n_vertices / elapsed if elapsed > 0 else None,
+        "output_bytes": size,
+        "output_mb_per_s": size / elapsed / 1e6 if size and elapsed > 0 else None,
+        "input_bytes": os.path.getsize(source),
+        "peak_rss_mb": _max_rss_bytes() / 1e6,
+        "peak_rss_delta_mb": (_max_rss_bytes() - rss_before) / 1e6,
+    }))
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    """與先前的結果比較，回傳 [(target, vertices, 耗時比例, 峰值 RSS 比例), ...] (>1 表示變慢 / 變大)"""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(r["target"], r["vertices"]): r for r in json.load(f)["results"]}
+    rows = []
+    for r in results:
+        base = baseline.get((r["target"], r["vertices"]))
+        if base is None:
+            continue
+        rows.append((r["target"], r["vertices"], r["seconds"] / base["seconds"],
+                     r["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else None))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--vertices-per-pipe", type=int, default=DEFAULT_VERTICES_PER_PIPE)
+    parser.add_argument("--targets", nargs="*", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--data-dir", default=None, help="合成資料目錄 (可重複使用)；預設為暫存目錄")
+    parser.add_argument("--repeat", type=int, default=1, help="每個項目執行次數，取最快的一次")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--compare", help="與先前 --output 的結果比較")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        target, source, n_vertices = args.child
+        run_child(target, source, int(n_vertices))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        for n_vertices in args.vertices:
+            needs_shp = any(TARGETS[t] == "shp" for t in args.targets)
+            paths = generate(data_dir, n_vertices, args.vertices_per_pipe, shp=needs_shp)
+            for target in args.targets:
+                runs = []
+                for _ in range(max(args.repeat, 1)):
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--child", target, paths[TARGETS[target]],
+                         str(n_vertices)],
+                        capture_output=True, text=True, check=True, env=dict(os.environ, MPLBACKEND="Agg"),
+                    )
+                    runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+                result = min(runs, key=lambda r: r["seconds"])
+                results.append(result)
+                print(f"{target:28s} {n_vertices:>9d} v  {result['seconds']:8.2f} s  "
+                      f"{result['vertices_per_s'] or 0:12.0f} v/s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+
+    if args.compare:
+        for target, n_vertices, t_ratio, rss_ratio in compare(results, args.compare):
+            flag = "  <-- slower" if t_ratio > 1.1 else ""
+            print(f"{target:28s} {n_vertices:>9d} v  time x{t_ratio:.2f}  "
+                  f"RSS x{rss_ratio if rss_ratio is not None else float('nan'):.2f}{flag}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "git_revision": _git_revision(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "vertices_per_pipe": args.vertices_per_pipe,
+                "results": results,
+            }, f, indent=2)
+        print(f"[INFO] results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
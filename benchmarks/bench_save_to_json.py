@@ -0,0 +1,121 @@
+"""
+比較 save_to_json 各寫出方式的吞吐量與峰值記憶體 (RSS)
+
+每個方式在獨立的子 process 中執行，峰值 RSS 以寫出前後的 ru_maxrss 差值計算。
+
+使用方式：
+    python benchmarks/bench_save_to_json.py --pipes 50000 --vertices-per-pipe 10
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from network_model import Network
+from parse_inp import save_to_json
+
+VARIANTS = {
+    # 原本的實作：先建立整份 dict 再 json.dump(indent=4)
+    "legacy": None,
+    "stream-indent4": {"indent": 4, "backend": "json"},
+    "stream-compact-json": {"indent": None, "backend": "json"},
+    "stream-compact-orjson": {"indent": None, "backend": "orjson"},
+}
+
+
+def synthetic_network(n_pipes, vertices_per_pipe, seed=0):
+    """建立一條鏈狀的合成管網 (WGS84)，用於基準測試"""
+    rng = np.random.default_rng(seed)
+    n_nodes = n_pipes + 1
+    node_xy = np.column_stack((120.6 + rng.random(n_nodes) * 0.1, 24.2 + rng.random(n_nodes) * 0.1))
+    n_vertices = n_pipes * vertices_per_pipe
+    return Network(
+        node_ids=np.array([f"J{i}" for i in range(n_nodes)]),
+        node_xy=node_xy,
+        node_listed=np.ones(n_nodes, dtype=bool),
+        node_elevation=rng.random(n_nodes) * 50,
+        node_base_demand=rng.random(n_nodes) * 5,
+        node_pattern=np.full(n_nodes, ""),
+        pipe_ids=np.array([f"P{i}" for i in range(n_pipes)]),
+        pipe_start=np.arange(n_pipes, dtype=np.int32),
+        pipe_end=np.arange(1, n_nodes, dtype=np.int32),
+        pipe_length=rng.random(n_pipes) * 100,
+        pipe_diameter=np.full(n_pipes, 100.0),
+        pipe_roughness=np.full(n_pipes, 120.0),
+        vertex_offsets=np.arange(0, n_vertices + 1, vertices_per_pipe, dtype=np.int64),
+        vertex_xy=np.column_stack((120.6 + rng.random(n_vertices) * 0.1, 24.2 + rng.random(n_vertices) * 0.1)),
+    )
+
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux 單位為 KiB
+
+
+def run_child(variant, n_pipes, vertices_per_pipe, output_file):
+    """在子 process 中執行單一方式並以 JSON 印出結果"""
+    network = synthetic_network(n_pipes, vertices_per_pipe)
+    rss_before = _max_rss_bytes()
+    started = time.perf_counter()
+    if VARIANTS[variant] is None:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(network.to_dict(), f, indent=4, ensure_ascii=False)
+    else:
+        save_to_json(network, output_file, **VARIANTS[variant])
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(output_file)
+    print(json.dumps({
+        "variant": variant,
+        "seconds": elapsed,
+        "bytes": size,
+        "mb_per_s": size / elapsed / 1e6,
+        "peak_rss_delta_mb": (_max_rss_bytes() - rss_before) / 1e6,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipes", type=int, default=50_000)
+    parser.add_argument("--vertices-per-pipe", type=int, default=10)
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS))
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.pipes, args.vertices_per_pipe, args.child_output)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in args.variants:
+            out = os.path.join(tmp, f"{variant}.json")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", variant,
+                 "--pipes", str(args.pipes), "--vertices-per-pipe", str(args.vertices_per_pipe),
+                 "--child-output", out],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{variant:24s} {result['seconds']:8.2f} s  {result['mb_per_s']:8.1f} MB/s  "
+                  f"peak RSS +{result['peak_rss_delta_mb']:8.1f} MB  ({result['bytes'] / 1e6:.1f} MB)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"pipes": args.pipes, "vertices_per_pipe": args.vertices_per_pipe,
+                       "results": results}, f, indent=2)
+        print(f"[INFO] results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+產生指定規模的合成 EPANET INP 檔與對應的 SHP 壓縮檔，供基準測試使用
+
+管網為 TWD97 座標上的格狀網 (節點間距 spacing 公尺)，管線沿格線連接相鄰節點，
+每條管線帶 vertices_per_pipe 個彎曲點；SHP 壓縮檔包含 pipe / valve / hydrant / manhole 四個圖層
+(EPSG:3826)，管線幾何與 INP 相同。
+
+使用方式：
+    python benchmarks/synthetic_data.py --vertices 1000000 --out-dir bench_data
+"""
+import argparse
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+ORIGIN = (250000.0, 2700000.0)  # TWD97 (台中附近)
+DEFAULT_VERTICES_PER_PIPE = 8
+WRITE_BATCH = 200_000  # 每次格式化寫出的列數
+
+
+def synthetic_layout(n_vertices, vertices_per_pipe=DEFAULT_VERTICES_PER_PIPE, spacing=100.0, seed=0):
+    """
+    建立格狀管網的座標與連接關係
+
+    :param n_vertices: [VERTICES] 彎曲點總數 (決定管線數 = n_vertices / vertices_per_pipe)
+    :param vertices_per_pipe: 每條管線的彎曲點數
+    :param spacing: 節點間距 (公尺)
+    :param seed: 亂數種子
+    :return: dict：node_xy (N, 2)、pipe_start、pipe_end、vertex_offsets、vertex_xy (皆為 TWD97)
+    """
+    rng = np.random.default_rng(seed)
+    vertices_per_pipe = max(int(vertices_per_pipe), 1)
+    n_pipes = max(int(n_vertices) // vertices_per_pipe, 1)
+    # 邊長 w 的格網有 2 * w * (w - 1) 條邊
+    w = 2
+    while 2 * w * (w - 1) < n_pipes:
+        w = int(w * 1.5) + 1
+    grid = np.arange(w * w).reshape(w, w)
+    start = np.concatenate((grid[:, :-1].ravel(), grid[:-1, :].ravel()))[:n_pipes]
+    end = np.concatenate((grid[:, 1:].ravel(), grid[1:, :].ravel()))[:n_pipes]
+    used = np.unique(np.concatenate((start, end)))
+    remap = np.full(w * w, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    gy, gx = np.divmod(used, w)
+    jitter = rng.normal(0, spacing * 0.05, (len(used), 2))
+    node_xy = np.column_stack((ORIGIN[0] + gx * spacing, ORIGIN[1] + gy * spacing)) + jitter
+
+    pipe_start = remap[start]
+    pipe_end = remap[end]
+    t = np.arange(1, vertices_per_pipe + 1) / (vertices_per_pipe + 1)
+    a = node_xy[pipe_start][:, None, :]
+    b = node_xy[pipe_end][:, None, :]
+    vertex_xy = a + (b - a) * t[None, :, None] + rng.normal(0, spacing * 0.02, (n_pipes, vertices_per_pipe, 2))
+    return {
+        "node_xy": node_xy,
+        "pipe_start": pipe_start,
+        "pipe_end": pipe_end,
+        "vertex_offsets": np.arange(0, n_pipes * vertices_per_pipe + 1, vertices_per_pipe, dtype=np.int64),
+        "vertex_xy": vertex_xy.reshape(-1, 2),
+    }
+
+
+def _write_rows(f, fmt, n, columns):
+    """分批格式化並寫出 n 列，暫存字串的記憶體不隨檔案大小成長"""
+    for lo in range(0, n, WRITE_BATCH):
+        hi = min(lo + WRITE_BATCH, n)
+        rows = [fmt % row for row in zip(*(c[lo:hi].tolist() for c in columns))]
+        f.write("\n".join(rows))
+        f.write("\n")
+
+
+def write_synthetic_inp(path, layout, seed=0):
+    """
+    將 synthetic_layout 的結果寫成 EPANET INP 檔
+
+    :return: 檔案大小 (bytes)
+    """
+    rng = np.random.default_rng(seed + 1)
+    node_xy = layout["node_xy"]
+    n_nodes = len(node_xy)
+    n_pipes = len(layout["pipe_start"])
+    node_ids = np.array([f"J{i}" for i in range(n_nodes)], dtype=object)
+    pipe_ids = np.array([f"P{i}" for i in range(n_pipes)], dtype=object)
+    start_xy = node_xy[layout["pipe_start"]]
+    end_xy = node_xy[layout["pipe_end"]]
+    length = np.round(np.hypot(*(end_xy - start_xy).T), 2)
+    counts = np.diff(layout["vertex_offsets"])
+    vertex_owner = np.repeat(pipe_ids, counts)
+    vertex_xy = layout["vertex_xy"]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[TITLE]\nSynthetic network\n\n[JUNCTIONS]\n;ID\tElev\tDemand\tPattern\n")
+        _write_rows(f, "%s\t%.2f\t%.3f\t", n_nodes,
+                    (node_ids, np.round(rng.random(n_nodes) * 50, 2), np.round(rng.random(n_nodes) * 2, 3)))
+        f.write("\n[RESERVOIRS]\n;ID\tHead\nR0\t80\n")
+        f.write("\n[PIPES]\n;ID\tNode1\tNode2\tLength\tDiameter\tRoughness\tMinorLoss\tStatus\n")
+        _write_rows(f, "%s\t%s\t%s\t%.2f\t%d\t%d\t0\tOpen", n_pipes,
+                    (pipe_ids, node_ids[layout["pipe_start"]], node_ids[layout["pipe_end"]], length,
+                     rng.choice([80, 100, 150, 200, 300], n_pipes), np.full(n_pipes, 120)))
+        f.write("R0\tR0\tJ0\t1\t300\t120\t0\tOpen\n")
+        f.write("\n[COORDINATES]\n;Node\tX-Coord\tY-Coord\n")
+        _write_rows(f, "%s\t%.3f\t%.3f", n_nodes, (node_ids, node_xy[:, 0], node_xy[:, 1]))
+        f.write(f"R0\t{node_xy[0, 0] - 10:.3f}\t{node_xy[0, 1] - 10:.3f}\n")
+        f.write("\n[VERTICES]\n;Link\tX-Coord\tY-Coord\n")
+        _write_rows(f, "%s\t%.3f\t%.3f", len(vertex_xy), (vertex_owner, vertex_xy[:, 0], vertex_xy[:, 1]))
+        f.write("\n[END]\n")
+    return os.path.getsize(path)
+
+
+def write_synthetic_shp_zip(path, layout, seed=0):
+    """
+    將 synthetic_layout 的結果寫成 SHP 壓縮檔 (pipe / valve / hydrant / manhole，EPSG:3826)
+
+    :return: 檔案大小 (bytes)
+    """
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed + 2)
+    node_xy = layout["node_xy"]
+    n_pipes = len(layout["pipe_start"])
+    counts = np.diff(layout["vertex_offsets"]) + 2
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    coords = np.empty((int(offsets[-1]), 2))
+    coords[offsets[:-1]] = node_xy[layout["pipe_start"]]
+    coords[offsets[1:] - 1] = node_xy[layout["pipe_end"]]
+    inner = np.ones(len(coords), dtype=bool)
+    inner[offsets[:-1]] = inner[offsets[1:] - 1] = False
+    coords[inner] = layout["vertex_xy"]
+    pipes = shapely.linestrings(coords, indices=np.repeat(np.arange(n_pipes), counts))
+
+    def points(fraction, prefix):
+        pick = np.flatnonzero(rng.random(len(node_xy)) < fraction)
+        return gpd.GeoDataFrame({
+            "ID": [f"{prefix}{i}" for i in range(len(pick))],
+            "NODE": [f"J{i}" for i in pick.tolist()],
+        }, geometry=shapely.points(node_xy[pick] + rng.normal(0, 1.0, (len(pick), 2))), crs="EPSG:3826")
+
+    layers = {
+        "pipe": gpd.GeoDataFrame({
+            "ID": [f"P{i}" for i in range(n_pipes)],
+            "DIAMETER": rng.choice([80, 100, 150, 200, 300], n_pipes),
+            "MATERIAL": rng.choice(["DIP", "PVC", "HDPE", "SP"], n_pipes),
+            "LENGTH": np.round(shapely.length(pipes), 2),
+        }, geometry=pipes, crs="EPSG:3826"),
+        "valve": points(0.2, "V"),
+        "hydrant": points(0.05, "H"),
+        "manhole": points(0.1, "M"),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, gdf in layers.items():
+            gdf.to_file(os.path.join(tmp, f"{name}.shp"), engine="pyogrio")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name in sorted(os.listdir(tmp)):
+                zf.write(os.path.join(tmp, name), name)
+    return os.path.getsize(path)
+
+
+def generate(out_dir, n_vertices, vertices_per_pipe=DEFAULT_VERTICES_PER_PIPE, seed=0, shp=True, overwrite=False):
+    """
+    產生 (或沿用已存在的) 指定規模的 INP 與 SHP 壓縮檔
+
+    :param out_dir: 輸出目錄
+    :param n_vertices: 彎曲點總數
+    :param shp: 是否一併產生 SHP 壓縮檔
+    :param overwrite: 已存在時是否重新產生
+    :return: {"inp": 路徑, "shp": 路徑或 None}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stem = f"synthetic-{n_vertices}-v{vertices_per_pipe}-s{seed}"
+    paths = {"inp": os.path.join(out_dir, stem + ".inp"), "shp": os.path.join(out_dir, stem + ".zip") if shp else None}
+    if not overwrite and all(p is None or os.path.exists(p) for p in paths.values()):
+        return paths
+    layout = synthetic_layout(n_vertices, vertices_per_pipe, seed=seed)
+    write_synthetic_inp(paths["inp"], layout, seed)
+    if shp:
+        write_synthetic_shp_zip(paths["shp"], layout, seed)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--vertices-per-pipe", type=int, default=DEFAULT_VERTICES_PER_PIPE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out-dir", default="bench_data")
+    parser.add_argument("--no-shp", action="store_true", help="只產生 INP 檔")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    for n in args.vertices:
+        paths = generate(args.out_dir, n, args.vertices_per_pipe, args.seed, not args.no_shp, args.overwrite)
+        for kind, path in paths.items():
+            if path:
+                print(f"[INFO] {kind}: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,110 @@
-import os
-
-from dotenv import load_dotenv
 from typing_extensions import override
-from openai import AssistantEventHandler, OpenAI
+from openai import AssistantEventHandler
 
 # First, we create a EventHandler class to define
 # how we want to handle the events in the response stream.
 
-import base64
-from io import BytesIO
-from PIL import Image
-
-load_dotenv()
-key = os.getenv("OPENAI_API_KEY")
-if key is None:
-    raise ValueError("API key is not set.")
-
-client = OpenAI(api_key=key)
+from assistant_runner import get_client
+from image_extractor import DataUriExtractor, ImageStore
+from stream_sinks import DEBUG, NORMAL, QUIET, JsonlSink, StreamBuffer, TerminalSink
 
 
 class EventHandler(AssistantEventHandler):
+    """
+    串流事件處理：所有輸出都經過 stream_sinks.StreamBuffer 合併、批次寫出，並記錄事件時間
+
+    用法：
+        EventHandler()                                     # 終端機輸出 (NORMAL)
+        EventHandler(verbosity="debug", log_file="run.jsonl")  # 另寫一份 JSONL 紀錄
+        EventHandler(sinks=[MemorySink()])                 # 自訂 sink
+    """
+
+    def __init__(self, sinks=None, verbosity=NORMAL, log_file=None, flush_interval=0.05, max_chars=4096,
+                 image_dir=".", show_images=True):
+        """
+        :param sinks: sink 列表；None 時為 TerminalSink(verbosity)
+        :param verbosity: 終端機輸出等級 (QUIET / NORMAL / DEBUG)
+        :param log_file: 另外寫入 JSONL 紀錄的檔案路徑
+        :param flush_interval: 合併 delta 的最長時間 (秒)
+        :param max_chars: 合併 delta 的最大字元數
+        :param image_dir: 圖片輸出目錄 (檔名依內容雜湊，相同圖片只寫一次)
+        :param show_images: 是否在背景開啟新圖片
+        """
+        super().__init__()
+        sinks = list(sinks) if sinks is not None else [TerminalSink(verbosity=verbosity)]
+        if log_file:
+            sinks.append(JsonlSink(log_file))
+        self.buffer = StreamBuffer(sinks, flush_interval, max_chars)
+        self.images = ImageStore(image_dir, prefix="leak_detection", show=show_images)
+        self.extractor = DataUriExtractor(store=self.images)
+
     @override
     def on_text_created(self, text) -> None:
-        print(f"\nassistant > ", end="", flush=True)
+        self.buffer.emit("text_created")
 
     @override
     def on_text_delta(self, delta, snapshot):
-        print(f"DEBUG: Received delta: {delta}", flush=True)  # 記錄變更內容
         if delta.value:
-            print(delta.value, end="", flush=True)
-            # 檢查是否為 base64 圖片
-            if "base64" in delta.value:
-                self.handle_base64_image(delta.value)
+            self.buffer.delta("text_delta", delta.value)
+            # 跨 delta 累積並解碼 data URI 圖片
+            for path in self.extractor.feed(delta.value):
+                self.buffer.emit("image_saved", path=path)
+        else:
+            self.buffer.delta("text_delta", level=DEBUG)
 
+    @override
     def on_tool_call_created(self, tool_call):
-        print(f"\nDEBUG: Tool call detected: {tool_call.type} (id: {tool_call.id})", flush=True)
-        print(f"\nassistant > {tool_call.type}\n", flush=True)
+        self.buffer.emit("tool_call_created", type=tool_call.type, id=tool_call.id)
 
+    @override
     def on_tool_call_delta(self, delta, snapshot):
         if delta.type == 'code_interpreter':
-            print(f"DEBUG: Received code_interpreter delta: {delta}", flush=True)
             if delta.code_interpreter.input:
-                print(delta.code_interpreter.input, end="", flush=True)
+                self.buffer.delta("code_input", delta.code_interpreter.input, key=delta.index)
             if delta.code_interpreter.outputs:
-                print(f"\n\noutput >", flush=True)
                 for output in delta.code_interpreter.outputs:
                     if output.type == "logs":
-                        print(f"\n{output.logs}", flush=True)
+                        self.buffer.emit("code_output", text=output.logs)
         elif delta.type == "file":
             # 偵測到文件附件
             file_id = delta.file_id
-            print(f"DEBUG: Detected image file (File ID: {file_id})", flush=True)
+            self.buffer.emit("image_file", level=DEBUG, file_id=file_id)
+            self.buffer.flush()
             self.download_and_display_image(file_id)
 
+    @override
     def on_run_step_created(self, run_step):
-        print(f"DEBUG: Run step created: {run_step.type}", flush=True)
+        self.buffer.emit("run_step_created", level=DEBUG, type=run_step.type, id=run_step.id)
 
+    @override
     def on_run_step_delta(self, delta, snapshot):
-        print(f"DEBUG: Run step delta: {delta}", flush=True)
+        self.buffer.delta("run_step_delta", level=DEBUG)
+
+    @override
+    def on_exception(self, exception):
+        self.buffer.emit("error", level=QUIET, text=repr(exception))
+        self.buffer.flush()
+
+    @override
+    def on_end(self):
+        for path in self.extractor.close():
+            self.buffer.emit("image_saved", path=path)
+        self.buffer.close()
+
+    def stats(self):
+        """串流時間統計 (time-to-first-token、總延遲等)，見 StreamBuffer.stats"""
+        return self.buffer.stats()
 
     def download_and_display_image(self, file_id):
-        """ 下載並顯示 Assistant 回傳的圖片 """
-        image_response = client.files.content(file_id=file_id)
+        """ 下載 Assistant 回傳的圖片 (依內容去除重複) 並在背景顯示 """
+        image_response = get_client().files.content(file_id=file_id)
         if image_response:
             try:
                 image_bytes = image_response.read() if hasattr(image_response, "read") else bytes(image_response)
-                with open("leak_detection_result.png", "wb") as f:
-                    f.write(image_bytes)
-                im = Image.open(BytesIO(image_bytes))
-                im.show()
-                print(f"圖片已成功顯示 (File ID: {file_id})")
+                path, new = self.images.save_bytes(image_bytes)
+                if new:
+                    self.buffer.emit("image_saved", path=path, file_id=file_id)
             except Exception as e:
-                print(f"無法處理圖片文件 (File ID: {file_id}): {e}")
+                self.buffer.emit("error", level=QUIET, text=f"無法處理圖片文件 (File ID: {file_id}): {e}")
         else:
-            print(f"無法下載圖片 (File ID: {file_id})")
-
-    def handle_base64_image(self, base64_string):
-        """ 解析 Base64 圖片並顯示 """
-        try:
-            encoded_data = base64_string.split(",")[-1].strip()
-            image_data = base64.b64decode(encoded_data)
-            with open("leak_detection_base64.png", "wb") as f:
-                f.write(image_data)
-            im = Image.open(BytesIO(image_data))
-            im.show()
-            print("Base64 圖片已成功顯示")
-        except Exception as e:
-            print(f"無法解碼 Base64 圖片: {e}")
-
-
-
+            self.buffer.emit("error", level=QUIET, text=f"無法下載圖片 (File ID: {file_id})")
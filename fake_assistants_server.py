@@ -0,0 +1,155 @@
+"""
+本地的假 Assistants API 伺服器，用於測試 assistant_runner 而不需連線 OpenAI
+
+只實作 RunManager 用到的端點：建立 thread、建立 / 查詢 / 取消 run，以及串流 run (stream=true)。
+每個 run 被查詢 steps 次後才會變成 completed；串流時每隔 stream_interval 秒推進一次。
+
+使用方式：
+    server = start_fake_server(steps=3)
+    client = create_async_client(api_key="test", base_url=server.base_url)
+    ...
+    server.shutdown()
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix):
+    return f"{prefix}_{next(_ids):06d}"
+
+
+class _FakeState:
+    def __init__(self, steps, final_status, stream_interval):
+        self.steps = steps
+        self.final_status = final_status
+        self.stream_interval = stream_interval
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.runs = {}  # run_id -> {"run": dict, "polls": int}
+
+    def create_thread(self):
+        thread = {"id": _new_id("thread"), "object": "thread", "created_at": int(time.time()),
+                  "metadata": {}, "tool_resources": None}
+        with self.lock:
+            self.threads[thread["id"]] = thread
+        return thread
+
+    def create_run(self, thread_id, body):
+        run = {
+            "id": _new_id("run"), "object": "thread.run", "created_at": int(time.time()),
+            "thread_id": thread_id, "assistant_id": body.get("assistant_id"), "status": "queued",
+            "instructions": body.get("instructions") or "", "model": body.get("model") or "gpt-4o",
+            "tools": [], "metadata": {}, "parallel_tool_calls": True,
+        }
+        with self.lock:
+            self.runs[run["id"]] = {"run": run, "polls": 0}
+        return run
+
+    def retrieve_run(self, run_id):
+        with self.lock:
+            entry = self.runs.get(run_id)
+            if entry is None:
+                return None
+            run = entry["run"]
+            if run["status"] in ("queued", "in_progress"):
+                entry["polls"] += 1
+                run["status"] = self.final_status if entry["polls"] >= self.steps else "in_progress"
+            return dict(run)
+
+    def cancel_run(self, run_id):
+        with self.lock:
+            entry = self.runs.get(run_id)
+            if entry is None:
+                return None
+            if entry["run"]["status"] in ("queued", "in_progress"):
+                entry["run"]["status"] = "cancelled"
+            return dict(entry["run"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    state = None  # 由 start_fake_server 設定
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_run(self, run):
+        """以 server-sent events 推送 run 的狀態，直到結束或 client 斷線"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            self._event("thread.run.created", run)
+            while run["status"] not in ("completed", "failed", "cancelled", "expired", "incomplete"):
+                time.sleep(self.state.stream_interval)
+                run = self.state.retrieve_run(run["id"])
+                self._event(f"thread.run.{run['status']}", run)
+            self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _not_found(self):
+        self._send(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/threads"):
+            return self._send(200, self.state.create_thread())
+        if path.endswith("/threads/runs"):
+            thread = self.state.create_thread()
+            return self._send(200, self.state.create_run(thread["id"], body))
+        m = re.search(r"/threads/([^/]+)/runs/([^/]+)/cancel$", path)
+        if m:
+            run = self.state.cancel_run(m.group(2))
+            return self._send(200, run) if run else self._not_found()
+        m = re.search(r"/threads/([^/]+)/runs$", path)
+        if m:
+            run = self.state.create_run(m.group(1), body)
+            return self._stream_run(run) if body.get("stream") else self._send(200, run)
+        self._not_found()
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        m = re.search(r"/threads/([^/]+)/runs/([^/]+)$", path)
+        if m:
+            run = self.state.retrieve_run(m.group(2))
+            return self._send(200, run) if run else self._not_found()
+        self._not_found()
+
+
+def start_fake_server(steps=3, final_status="completed", stream_interval=0.01, host="127.0.0.1", port=0):
+    """
+    在背景執行緒啟動假伺服器
+
+    :param steps: run 被查詢幾次 (或串流推進幾次) 後結束
+    :param final_status: run 結束時的狀態
+    :param stream_interval: 串流 run 每次推進狀態的間隔秒數
+    :return: ThreadingHTTPServer (附加 base_url 屬性；用 shutdown() 停止)
+    """
+    handler = type("FakeAssistantsHandler", (_Handler,), {"state": _FakeState(steps, final_status, stream_interval)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,298 @@
+"""
+從串流文字中擷取 data URI 圖片 (data:image/png;base64,....)
+
+圖片的 base64 內容通常分散在很多個 text delta 中；DataUriExtractor 逐段接收文字，
+只保留比對標頭所需的少量字元與不滿 4 個字元的 base64 尾巴，邊收邊解碼寫入暫存檔，
+結束時依內容 SHA-256 命名，相同內容的圖片只會寫入一次。
+
+使用方式：
+    extractor = DataUriExtractor("images", prefix="leak_detection")
+    for delta in deltas:
+        for path in extractor.feed(delta):
+            print("saved", path)
+    extractor.close()
+"""
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024  # 單張圖片解碼後的大小上限
+_HEADER = re.compile(r"data:image/([A-Za-z0-9.+-]+);base64,")
+_HEADER_MAX = 40  # 標頭可能被切在兩個 delta 之間，保留的最大字元數
+_B64_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/")
+_WRAP_SPACE = frozenset(" \t\r\n")
+_WRAP_MIN = 16  # 換行後至少要有這麼多個 base64 字元才視為折行的續行 (避免把後面的文字當成內容)
+_WRAP_GAP_MAX = 32  # 折行處最多容許的空白字元數 (含縮排)
+_CLOSERS = frozenset(")]>\"'")  # 緊接在內容後面、表示 data URI 結束的字元
+_EXTENSIONS = {"jpeg": "jpg", "svg+xml": "svg"}
+
+
+def show_image(path):
+    """在背景執行緒中以系統檢視器開啟圖片，不阻塞串流處理"""
+    def run():
+        try:
+            from PIL import Image
+            with Image.open(path) as im:
+                im.show()
+        except Exception as e:
+            print(f"無法顯示圖片 {path}: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+class ImageStore:
+    """依內容雜湊去除重複的圖片輸出目錄"""
+
+    def __init__(self, output_dir=".", prefix="image", show=False):
+        """
+        :param output_dir: 輸出目錄
+        :param prefix: 檔名前綴，檔名為 {prefix}-{sha256 前 12 碼}.{副檔名}
+        :param show: 寫入新圖片後是否在背景開啟檢視器
+        """
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.show = show
+        self.saved = {}  # sha256 -> 路徑
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.output_dir, f"{self.prefix}-{digest[:12]}.{ext}")
+
+    def commit(self, tmp_path, digest, ext):
+        """
+        將已寫好的暫存檔改名為正式檔名；內容重複時刪除暫存檔
+
+        :return: (路徑, 是否為新圖片)
+        """
+        path = self.saved.get(digest) or self.path_for(digest, ext)
+        if digest in self.saved or os.path.exists(path):
+            os.remove(tmp_path)
+            self.saved[digest] = path
+            return path, False
+        os.replace(tmp_path, path)
+        self.saved[digest] = path
+        if self.show:
+            show_image(path)
+        return path, True
+
+    def save_bytes(self, data, ext="png"):
+        """
+        寫入一張已完整取得的圖片 (例如 Assistant 回傳的 image_file)
+
+        :return: (路徑, 是否為新圖片)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.saved:
+            return self.saved[digest], False
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.commit(tmp_path, digest, ext)
+
+
+class DataUriExtractor:
+    """
+    逐段接收文字並增量解碼其中的 data URI 圖片
+
+    記憶體用量固定：標頭比對最多保留 _HEADER_MAX 個字元，解碼中只保留不滿 4 個字元的 base64 尾巴；
+    解碼後的內容直接寫入暫存檔並累計 SHA-256。超過 max_bytes 的圖片會被捨棄。
+    """
+
+    def __init__(self, output_dir=".", prefix="image", max_bytes=DEFAULT_MAX_BYTES, show=False, store=None):
+        """
+        :param output_dir: 輸出目錄
+        :param prefix: 檔名前綴
+        :param max_bytes: 單張圖片解碼後的大小上限
+        :param show: 寫入新圖片後是否在背景開啟檢視器
+        :param store: 共用的 ImageStore (例如與 image_file 下載共用去重)；None 時自行建立
+        """
+        self.store = store or ImageStore(output_dir, prefix, show)
+        self.max_bytes = max_bytes
+        self.paths = []  # 本次串流寫入的新圖片
+        self.n_duplicates = 0
+        self.n_dropped = 0
+        self._tail = ""  # 尚未確定是否為標頭開頭的文字
+        self._file = None  # 解碼中圖片的暫存檔
+        self._tmp_path = None
+        self._ext = None
+        self._hash = None
+        self._size = 0
+        self._rest = ""  # 不滿 4 個字元的 base64
+        self._gap = ""  # 內容後面的空白 (可能是折行)
+        self._cont = ""  # 折行後尚未確定是否為續行的 base64 字元
+
+    @property
+    def in_image(self):
+        return self._file is not None
+
+    def feed(self, text):
+        """
+        接收一段文字
+
+        :return: 這段文字中完成的新圖片路徑列表
+        """
+        done = []
+        pos = 0
+        n = len(text)
+        while pos < n:
+            if self._file is not None:
+                pos, finished = self._consume(text, pos)
+                if finished:
+                    self._finish(done)
+                continue
+            buf = self._tail + text[pos:]
+            m = _HEADER.search(buf)
+            if m is None:
+                # 只保留可能是標頭開頭的尾端
+                k = buf.rfind("data:", max(0, len(buf) - _HEADER_MAX))
+                self._tail = buf[k:] if k >= 0 else buf[-4:]
+                break
+            self._start(m.group(1).lower())
+            pos += m.end() - len(self._tail)
+            self._tail = ""
+        return done
+
+    def close(self):
+        """串流結束：完成仍在解碼中的圖片 (內容剛好在結尾時)"""
+        done = []
+        if self._file is not None:
+            self._gap = self._cont = ""  # 結尾未確定的續行不算在內容中
+            self._finish(done)
+        self._tail = ""
+        return done
+
+    def _start(self, subtype):
+        self._ext = _EXTENSIONS.get(subtype, subtype)
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.store.output_dir, prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._rest = ""
+        self._gap = self._cont = ""
+
+    def _consume(self, text, pos):
+        """
+        解碼 text[pos:] 開頭的 base64 字元
+
+        只接受換行折行：換行 (前後可有空白與縮排) 後緊接至少 _WRAP_MIN 個 base64 字元，
+        或較短但以 padding / 結束符號 (例如 ')') 收尾的最後一行。
+        空行、沒有換行的空白、換行後的短字或其他字元都表示內容已結束。
+
+        :return: (下一個位置, 圖片是否已結束)
+        """
+        n = len(text)
+        i = pos
+        while i < n:
+            if self._cont:
+                # 折行後的候選續行：湊滿 _WRAP_MIN 個字元或遇到結尾才能判斷
+                end = i
+                limit = i + _WRAP_MIN - len(self._cont)
+                while end < n and end < limit and text[end] in _B64_CHARS:
+                    end += 1
+                self._cont += text[i:end]
+                i = end
+                if len(self._cont) < _WRAP_MIN:
+                    if i == n:
+                        return i, False
+                    if text[i] != "=" and text[i] not in _CLOSERS:
+                        return self._reject(i)
+                self._decode(self._cont)
+                self._gap = self._cont = ""
+                if self._file is None:
+                    return i, False
+            elif self._gap:
+                c = text[i]
+                if c in _WRAP_SPACE:
+                    self._gap += c
+                    if self._gap.count("\n") > 1 or len(self._gap) > _WRAP_GAP_MAX:
+                        return self._reject(i)  # 空行或過多空白
+                    i += 1
+                elif c in _B64_CHARS and "\n" in self._gap:
+                    self._cont = c
+                    i += 1
+                else:
+                    return self._reject(i)
+            else:
+                end = i
+                while end < n and text[end] in _B64_CHARS:
+                    end += 1
+                self._decode(text[i:end])
+                i = end
+                if self._file is None or i == n:
+                    return i, False
+                if text[i] in _WRAP_SPACE:
+                    self._gap = text[i]
+                    i += 1
+                    continue
+                while i < n and text[i] == "=":
+                    i += 1
+                return i, True
+        return i, False
+
+    def _reject(self, pos):
+        """折行候選不屬於內容：圖片在此之前結束，候選字元交回標頭比對"""
+        self._tail = self._cont
+        self._gap = self._cont = ""
+        return pos, True
+
+    def _decode(self, chars):
+        chunk = self._rest + chars
+        usable = len(chunk) // 4 * 4
+        self._write(chunk[:usable])
+        self._rest = chunk[usable:]
+
+    def _write(self, chunk):
+        if not chunk or self._file is None:
+            return
+        try:
+            data = base64.b64decode(chunk, validate=True)
+        except ValueError:
+            self._abort()
+            return
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            print(f"[WARN] 圖片超過 {self.max_bytes} bytes，已捨棄")
+            self._abort()
+            return
+        self._hash.update(data)
+        self._file.write(data)
+
+    def _abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+        self._file = None
+        self.n_dropped += 1
+
+    def _finish(self, done):
+        if self._file is None:
+            return
+        if len(self._rest) > 1:
+            self._write(self._rest + "=" * (4 - len(self._rest)))  # 補上省略或被截斷的 padding
+            if self._file is None:
+                return
+        self._rest = ""
+        self._file.close()
+        self._file = None
+        if self._size == 0:
+            os.remove(self._tmp_path)
+            self.n_dropped += 1
+            return
+        path, new = self.store.commit(self._tmp_path, self._hash.hexdigest(), self._ext)
+        if new:
+            self.paths.append(path)
+            done.append(path)
+        else:
+            self.n_duplicates += 1
+
+
+def extract_data_uri_images(text, output_dir=".", prefix="image", show=False, store=None):
+    """
+    從完整文字 (例如整則訊息) 擷取所有 data URI 圖片
+
+    :return: 新寫入的圖片路徑列表
+    """
+    extractor = DataUriExtractor(output_dir, prefix, show=show, store=store)
+    return extractor.feed(text) + extractor.close()
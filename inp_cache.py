@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from network_model import Network
+from parse_inp import TWD97_PROJ, parse_inp_network
+
+DEFAULT_CACHE_DIR = ".inp_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB
+CACHE_VERSION = 1  # 快取格式變動時遞增，舊的快取會自動失效
+META_FILE = "meta.json"
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """以區塊方式計算檔案內容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(content_hash, reproject):
+    """由檔案內容雜湊與座標轉換設定組成快取鍵"""
+    settings = f"v{CACHE_VERSION}|reproject={bool(reproject)}|{TWD97_PROJ}|EPSG:4326"
+    return hashlib.sha256(f"{content_hash}|{settings}".encode("utf-8")).hexdigest()
+
+
+def _entry_size(entry_dir):
+    return sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+
+
+def _iter_entries(cache_dir):
+    """逐一產出 (entry_dir, meta, 最後使用時間)"""
+    if not os.path.isdir(cache_dir):
+        return
+    for e in os.scandir(cache_dir):
+        meta_path = os.path.join(e.path, META_FILE)
+        if not e.is_dir() or not os.path.exists(meta_path):
+            continue
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            yield e.path, meta, os.stat(meta_path).st_mtime
+        except (OSError, ValueError):
+            continue
+
+
+def load_arrays(entry_dir, names, mmap=True):
+    """
+    從快取目錄載入多個 .npy 陣列
+
+    :param entry_dir: 快取項目目錄
+    :param names: 陣列名稱
+    :param mmap: 是否以 memory map 方式開啟
+    :return: (meta dict, {名稱: ndarray})
+    """
+    with open(os.path.join(entry_dir, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(entry_dir, name + ".npy"), mmap_mode=mode) for name in names}
+    return meta, arrays
+
+
+def save_arrays(arrays, entry_dir, meta=None):
+    """
+    將多個陣列以每欄一個 .npy 的格式寫入目錄 (先寫入暫存目錄再整批改名，避免寫到一半的快取)
+
+    :param arrays: {名稱: ndarray}
+    :param entry_dir: 目標目錄
+    :param meta: 寫入 meta.json 的資訊
+    """
+    parent = os.path.dirname(os.path.abspath(entry_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(arr), allow_pickle=False)
+        meta = dict(meta or {}, created=time.time())
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_network(entry_dir, mmap=True):
+    """
+    從快取目錄載入 Network；mmap=True 時陣列以 memory map 方式開啟，不會整份讀入記憶體
+
+    :param entry_dir: 快取項目目錄
+    :param mmap: 是否使用 memory map
+    :return: Network
+    """
+    meta, arrays = load_arrays(entry_dir, Network.ARRAY_FIELDS, mmap)
+    return Network.from_arrays(arrays, crs=meta["crs"])
+
+
+def save_network(network, entry_dir, meta=None):
+    """
+    將 Network 以每欄一個 .npy 的格式寫入目錄
+
+    :param network: Network
+    :param entry_dir: 目標目錄
+    :param meta: 額外寫入 meta.json 的資訊
+    """
+    save_arrays(network.to_arrays(), entry_dir, dict(meta or {}, crs=network.crs))
+
+
+def evict(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, keep=None):
+    """
+    依最近使用時間 (LRU) 刪除快取，直到總大小不超過 max_bytes
+
+    :param cache_dir: 快取目錄
+    :param max_bytes: 快取大小上限
+    :param keep: 不可刪除的項目目錄 (例如剛寫入的項目)
+    :return: 被刪除的項目數
+    """
+    entries = [(used, path, _entry_size(path)) for path, _, used in _iter_entries(cache_dir)]
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate(file_path=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    使快取失效
+
+    :param file_path: 只刪除此 INP 檔案 (依路徑或目前內容雜湊比對) 的快取；None 表示清空全部
+    :param cache_dir: 快取目錄
+    :return: 被刪除的項目數
+    """
+    source = os.path.abspath(file_path) if file_path else None
+    content_hash = file_sha256(file_path) if file_path and os.path.exists(file_path) else None
+    removed = 0
+    for path, meta, _ in list(_iter_entries(cache_dir)):
+        if source is None or meta.get("source") == source or meta.get("content_hash") == content_hash:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def latest_network(file_path, reproject=True, cache_dir=DEFAULT_CACHE_DIR, exclude_hash=None, mmap=True):
+    """
+    取得此 INP 檔案 (依路徑比對) 最近一次快取的 Network，例如同一檔案編輯前的版本
+
+    :param file_path: INP 檔案路徑
+    :param reproject: 座標轉換設定需相同
+    :param cache_dir: 快取目錄
+    :param exclude_hash: 略過此內容雜湊的項目
+    :param mmap: 是否以 memory map 載入
+    :return: (Network, content_hash)；沒有快取時為 (None, None)
+    """
+    source = os.path.abspath(file_path)
+    candidates = [(used, path, meta) for path, meta, used in _iter_entries(cache_dir)
+                  if meta.get("kind", "network") == "network" and meta.get("source") == source
+                  and meta.get("reproject") == bool(reproject) and meta.get("version") == CACHE_VERSION
+                  and meta.get("content_hash") != exclude_hash]
+    for _, path, meta in sorted(candidates, key=lambda c: c[0], reverse=True):
+        try:
+            return load_network(path, mmap=mmap), meta.get("content_hash")
+        except (OSError, ValueError, KeyError):
+            continue
+    return None, None
+
+
+def cached_parse_inp_network(file_path, reproject=True, cache_dir=DEFAULT_CACHE_DIR,
+                             max_bytes=DEFAULT_MAX_BYTES, mmap=True):
+    """
+    帶有磁碟快取的 parse_inp_network
+
+    快取鍵為 INP 檔案內容雜湊加上座標轉換設定；命中時直接 mmap 讀取 .npy 陣列，不再解析文字。
+
+    :param file_path: INP 檔案路徑
+    :param reproject: 是否將座標轉換為 WGS84
+    :param cache_dir: 快取目錄
+    :param max_bytes: 快取大小上限，超過時以 LRU 淘汰
+    :param mmap: 命中時是否以 memory map 載入
+    :return: network_model.Network
+    """
+    content_hash = file_sha256(file_path)
+    entry_dir = os.path.join(cache_dir, cache_key(content_hash, reproject))
+    meta_path = os.path.join(entry_dir, META_FILE)
+
+    if os.path.exists(meta_path):
+        try:
+            network = load_network(entry_dir, mmap=mmap)
+            os.utime(meta_path)  # 更新最後使用時間 (LRU)
+            return network
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] 快取讀取失敗，重新解析: {e}")
+
+    network = parse_inp_network(file_path, reproject)
+    save_network(network, entry_dir, meta={
+        "source": os.path.abspath(file_path),
+        "content_hash": content_hash,
+        "reproject": bool(reproject),
+        "version": CACHE_VERSION,
+    })
+    evict(cache_dir, max_bytes, keep=entry_dir)
+    return network
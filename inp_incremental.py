@@ -0,0 +1,454 @@
+"""
+INP 檔案的增量解析：只重新解析 / 轉換內容有變動的區段，並回傳前後版本的差異 (NetworkDiff)
+
+每個區段記錄其在檔案中的位元組範圍與 SHA-256；區段解析結果以內容雜湊為鍵存入
+inp_cache 的快取目錄 (與 Network 快取共用 LRU 淘汰)，所以跨執行也只需處理有變動的區段。
+
+使用方式：
+    parser = IncrementalParser("network.inp")
+    network = parser.network          # 第一次會完整解析 (或讀取區段快取)
+    ...                               # 編輯 INP 檔案
+    diff = parser.update()            # 只重新解析有變動的區段
+    print(diff.summary())
+"""
+import hashlib
+import io
+import mmap
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from inp_cache import (CACHE_VERSION, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, META_FILE, evict, file_sha256,
+                       latest_network, load_arrays, save_arrays, save_network, cache_key)
+from inp_tokenizer import Junction, Pipe, iter_inp_records
+from network_model import TWD97, WGS84, build_network
+from parse_inp import PARSED_SECTIONS, TWD97_PROJ, _report_invalid, convert_twd97_to_wgs84_batch
+from spatial_index import _expand_ranges
+
+# 與 inp_tokenizer 相同的區段標頭判斷：去掉註解後以 [ 開頭、] 結尾的一行
+_HEADER = re.compile(rb"^[ \t]*\[([^\]\r\n]*)\][ \t]*(?:;[^\r\n]*)?\r?$", re.MULTILINE)
+
+# 各區段快取的欄位
+SECTION_COLUMNS = {
+    "JUNCTIONS": ("id", "elevation", "base_demand", "pattern"),
+    "PIPES": ("id", "start", "end", "length", "diameter", "roughness"),
+    "COORDINATES": ("id", "xy", "valid"),
+    "VERTICES": ("id", "xy", "valid"),
+}
+COORDINATE_SECTIONS = ("COORDINATES", "VERTICES")
+
+SectionInfo = namedtuple("SectionInfo", ["name", "ranges", "sha256"])
+
+
+def scan_sections(file_path):
+    """
+    掃描 INP 檔案的區段位置與內容雜湊 (以 mmap + 正規表示式尋找標頭，不逐行解析)
+
+    同名區段出現多次時，範圍依檔案順序合併並計算同一個雜湊。
+
+    :param file_path: INP 檔案路徑
+    :return: {區段名稱: SectionInfo(name, ((offset, length), ...), sha256)}
+    """
+    ranges = {}
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            headers = list(_HEADER.finditer(mm))
+            for k, m in enumerate(headers):
+                name = m.group(1).strip().upper().decode("utf-8", "replace")
+                start = m.end() + 1 if mm[m.end():m.end() + 1] == b"\n" else m.end()
+                end = headers[k + 1].start() if k + 1 < len(headers) else size
+                ranges.setdefault(name, []).append((start, max(end - start, 0)))
+            sections = {}
+            view = memoryview(mm)
+            try:
+                for name, parts in ranges.items():
+                    h = hashlib.sha256()
+                    for offset, length in parts:
+                        h.update(view[offset:offset + length])
+                    sections[name] = SectionInfo(name, tuple(parts), h.hexdigest())
+            finally:
+                view.release()
+    return sections
+
+
+def _read_section_text(file_path, info):
+    with open(file_path, "rb") as f:
+        parts = []
+        for offset, length in info.ranges:
+            f.seek(offset)
+            parts.append(f.read(length))
+    return b"".join(parts).decode("utf-8")
+
+
+def parse_section(file_path, info, reproject=True):
+    """
+    只解析單一區段的位元組範圍 (座標區段會在此轉換為 WGS84)
+
+    :param file_path: INP 檔案路徑
+    :param info: scan_sections 回傳的 SectionInfo
+    :param reproject: 是否將座標轉換為 WGS84
+    :return: {欄位: ndarray}，欄位見 SECTION_COLUMNS
+    """
+    name = info.name
+    text = f"[{name}]\n" + _read_section_text(file_path, info)
+    records = [record for _, record in iter_inp_records(io.StringIO(text), {name})]
+    ids = np.array([r.id for r in records], dtype=str)
+    if name == "JUNCTIONS":
+        return {
+            "id": ids,
+            "elevation": np.array([r.elevation for r in records], dtype=np.float64),
+            "base_demand": np.array([r.base_demand for r in records], dtype=np.float64),
+            "pattern": np.array([r.pattern or "" for r in records], dtype=str),
+        }
+    if name == "PIPES":
+        return {
+            "id": ids,
+            "start": np.array([r.start for r in records], dtype=str),
+            "end": np.array([r.end for r in records], dtype=str),
+            "length": np.array([r.length for r in records], dtype=np.float64),
+            "diameter": np.array([r.diameter for r in records], dtype=np.float64),
+            "roughness": np.array([r.roughness for r in records], dtype=np.float64),
+        }
+    xs = np.array([r.x for r in records], dtype=np.float64)
+    ys = np.array([r.y for r in records], dtype=np.float64)
+    if reproject:
+        lng, lat, valid = convert_twd97_to_wgs84_batch(xs, ys)
+        xy = np.column_stack((lng, lat))
+    else:
+        valid = np.isfinite(xs) & np.isfinite(ys)
+        xy = np.column_stack((xs, ys))
+    _report_invalid("節點" if name == "COORDINATES" else "彎曲點", ids, xs, ys, valid)
+    return {"id": ids, "xy": xy.reshape(-1, 2), "valid": valid}
+
+
+def _section_key(info, reproject):
+    settings = f"v{CACHE_VERSION}|section={info.name}"
+    if info.name in COORDINATE_SECTIONS:
+        settings += f"|reproject={bool(reproject)}|{TWD97_PROJ}|EPSG:4326"
+    return "section-" + hashlib.sha256(f"{info.sha256}|{settings}".encode("utf-8")).hexdigest()
+
+
+def load_section(file_path, info, reproject=True, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    取得區段解析結果：內容雜湊命中快取時直接讀取，否則解析後寫入快取
+
+    :param cache_dir: 快取目錄，None 表示不使用快取
+    :return: ({欄位: ndarray}, 是否命中快取)
+    """
+    names = SECTION_COLUMNS[info.name]
+    entry_dir = os.path.join(cache_dir, _section_key(info, reproject)) if cache_dir else None
+    if entry_dir and os.path.exists(os.path.join(entry_dir, META_FILE)):
+        try:
+            _, columns = load_arrays(entry_dir, names, mmap=False)
+            os.utime(os.path.join(entry_dir, META_FILE))  # 更新最後使用時間 (LRU)
+            return columns, True
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] 區段快取讀取失敗，重新解析: {e}")
+
+    columns = parse_section(file_path, info, reproject)
+    if entry_dir:
+        save_arrays(columns, entry_dir, meta={
+            "kind": "section",
+            "section": info.name,
+            "source": os.path.abspath(file_path),
+            "sha256": info.sha256,
+            "version": CACHE_VERSION,
+        })
+    return columns, False
+
+
+def _empty_section(name):
+    columns = {}
+    for column in SECTION_COLUMNS[name]:
+        if column == "xy":
+            columns[column] = np.empty((0, 2))
+        elif column == "valid":
+            columns[column] = np.empty(0, dtype=bool)
+        elif column in ("id", "start", "end", "pattern"):
+            columns[column] = np.empty(0, dtype=str)
+        else:
+            columns[column] = np.empty(0)
+    return columns
+
+
+def build_from_sections(parts, crs):
+    """由各區段的欄位組成 Network (與 parse_inp_network 的結果相同)"""
+    junctions = parts["JUNCTIONS"]
+    pipes = parts["PIPES"]
+    coords = parts["COORDINATES"]
+    vertices = parts["VERTICES"]
+    return build_network(
+        coords["id"].tolist(), coords["xy"], coords["valid"],
+        list(map(Junction._make, zip(junctions["id"].tolist(), junctions["elevation"].tolist(),
+                                     junctions["base_demand"].tolist(), junctions["pattern"].tolist()))),
+        [Pipe(*row, None, None) for row in zip(pipes["id"].tolist(), pipes["start"].tolist(),
+                                                pipes["end"].tolist(), pipes["length"].tolist(),
+                                                pipes["diameter"].tolist(), pipes["roughness"].tolist())],
+        vertices["id"].tolist(), vertices["xy"], vertices["valid"],
+        crs=crs,
+    )
+
+
+def _match(old_index, new_ids):
+    """new_ids 在舊版本中的索引，不存在為 -1"""
+    return np.fromiter((old_index.get(i, -1) for i in new_ids.tolist()), dtype=np.int64, count=len(new_ids))
+
+
+def _same(a, b):
+    """逐列比較 (NaN 視為相等)"""
+    equal = (a == b)
+    if np.issubdtype(np.asarray(a).dtype, np.floating):
+        equal |= np.isnan(a) & np.isnan(b)
+    return equal.all(axis=1) if equal.ndim > 1 else equal
+
+
+class NetworkDiff:
+    """
+    兩個 Network 版本之間的差異
+
+    node_map[i] / pipe_map[i] 為舊版本第 i 個節點 / 管線在新版本中的索引 (已刪除為 -1)，
+    可用 remap_node_values / remap_pipe_values 把依舊索引排列的數值 (例如 leak_engine 用的
+    時段 × 節點陣列) 搬到新索引，不必重新讀取所有快照。
+    """
+
+    NODE_FIELDS = ("xy", "elevation", "base_demand", "pattern", "listed")
+    PIPE_FIELDS = ("endpoints", "length", "diameter", "roughness", "vertices")
+
+    def __init__(self, old, new, changed_sections=()):
+        self.old = old
+        self.new = new
+        self.changed_sections = list(changed_sections)
+        self.node_changes = {}  # 欄位 -> 有變動的節點 ID 列表
+        self.pipe_changes = {}  # 欄位 -> 有變動的管線 ID 列表
+        n_old_nodes = old.n_nodes if old is not None else 0
+        n_old_pipes = old.n_pipes if old is not None else 0
+        if old is new:
+            self.node_map = np.arange(n_old_nodes)
+            self.pipe_map = np.arange(n_old_pipes)
+            self._new_nodes = np.zeros(new.n_nodes, dtype=bool)
+            self._new_pipes = np.zeros(new.n_pipes, dtype=bool)
+            return
+
+        old_nodes = _match(old.node_index, new.node_ids) if old is not None else np.full(new.n_nodes, -1)
+        old_pipes = _match(old.pipe_index, new.pipe_ids) if old is not None else np.full(new.n_pipes, -1)
+        self._new_nodes = old_nodes < 0
+        self._new_pipes = old_pipes < 0
+        self.node_map = np.full(n_old_nodes, -1, dtype=np.int64)
+        self.node_map[old_nodes[old_nodes >= 0]] = np.flatnonzero(old_nodes >= 0)
+        self.pipe_map = np.full(n_old_pipes, -1, dtype=np.int64)
+        self.pipe_map[old_pipes[old_pipes >= 0]] = np.flatnonzero(old_pipes >= 0)
+        if old is None:
+            return
+
+        ni = np.flatnonzero(old_nodes >= 0)
+        oi = old_nodes[ni]
+        node_columns = {
+            "xy": (old.node_xy, new.node_xy),
+            "elevation": (old.node_elevation, new.node_elevation),
+            "base_demand": (old.node_base_demand, new.node_base_demand),
+            "pattern": (old.node_pattern, new.node_pattern),
+            "listed": (old.node_listed, new.node_listed),
+        }
+        for field, (a, b) in node_columns.items():
+            changed = ~_same(np.asarray(a)[oi], np.asarray(b)[ni])
+            if changed.any():
+                self.node_changes[field] = new.node_ids[ni[changed]].tolist()
+
+        pi = np.flatnonzero(old_pipes >= 0)
+        po = old_pipes[pi]
+        endpoints = ((old.node_ids[old.pipe_start[po]] != new.node_ids[new.pipe_start[pi]]) |
+                     (old.node_ids[old.pipe_end[po]] != new.node_ids[new.pipe_end[pi]]))
+        pipe_changed = {
+            "endpoints": endpoints,
+            "length": ~_same(old.pipe_length[po], new.pipe_length[pi]),
+            "diameter": ~_same(old.pipe_diameter[po], new.pipe_diameter[pi]),
+            "roughness": ~_same(old.pipe_roughness[po], new.pipe_roughness[pi]),
+            "vertices": self._vertices_changed(po, pi),
+        }
+        for field, changed in pipe_changed.items():
+            if changed.any():
+                self.pipe_changes[field] = new.pipe_ids[pi[changed]].tolist()
+
+    def _vertices_changed(self, po, pi):
+        old, new = self.old, self.new
+        old_counts = np.diff(old.vertex_offsets)[po]
+        new_counts = np.diff(new.vertex_offsets)[pi]
+        changed = old_counts != new_counts
+        same = np.flatnonzero(~changed)
+        owner, old_pos = _expand_ranges(old.vertex_offsets[po[same]], old.vertex_offsets[po[same] + 1])
+        _, new_pos = _expand_ranges(new.vertex_offsets[pi[same]], new.vertex_offsets[pi[same] + 1])
+        moved = ~_same(old.vertex_xy[old_pos], new.vertex_xy[new_pos])
+        changed[same] = np.bincount(owner, weights=moved, minlength=len(same)) > 0
+        return changed
+
+    def __repr__(self):
+        return (f"NetworkDiff(nodes +{len(self.added_nodes)} -{len(self.removed_nodes)} "
+                f"~{len(self.modified_nodes)}, pipes +{len(self.added_pipes)} -{len(self.removed_pipes)} "
+                f"~{len(self.modified_pipes)})")
+
+    @property
+    def added_nodes(self):
+        return self.new.node_ids[self._new_nodes].tolist()
+
+    @property
+    def removed_nodes(self):
+        return self.old.node_ids[self.node_map < 0].tolist() if self.old is not None else []
+
+    @property
+    def modified_nodes(self):
+        return sorted({i for ids in self.node_changes.values() for i in ids})
+
+    @property
+    def added_pipes(self):
+        return self.new.pipe_ids[self._new_pipes].tolist()
+
+    @property
+    def removed_pipes(self):
+        return self.old.pipe_ids[self.pipe_map < 0].tolist() if self.old is not None else []
+
+    @property
+    def modified_pipes(self):
+        return sorted({i for ids in self.pipe_changes.values() for i in ids})
+
+    @property
+    def is_empty(self):
+        return not (self._new_nodes.any() or self._new_pipes.any() or (self.node_map < 0).any()
+                    or (self.pipe_map < 0).any() or self.node_changes or self.pipe_changes)
+
+    @property
+    def same_order(self):
+        """新舊版本的節點與管線索引完全一致 (沒有新增、刪除或重新排序)"""
+        return (len(self.node_map) == self.new.n_nodes and len(self.pipe_map) == self.new.n_pipes
+                and np.array_equal(self.node_map, np.arange(len(self.node_map)))
+                and np.array_equal(self.pipe_map, np.arange(len(self.pipe_map))))
+
+    @property
+    def geometry_changed(self):
+        """座標、彎曲點或拓撲是否有變動 (需要重建空間索引 / 圖結構)"""
+        return (not self.same_order or "xy" in self.node_changes
+                or "endpoints" in self.pipe_changes or "vertices" in self.pipe_changes)
+
+    def _remap(self, values, mapping, n_new, fill):
+        values = np.asarray(values)
+        out = np.full(values.shape[:-1] + (n_new,), fill, dtype=np.result_type(values.dtype, type(fill)))
+        keep = mapping >= 0
+        out[..., mapping[keep]] = values[..., keep]
+        return out
+
+    def remap_node_values(self, values, fill=np.nan):
+        """把最後一維依舊節點索引排列的陣列轉成新節點索引，新增的節點填 fill"""
+        return self._remap(values, self.node_map, self.new.n_nodes, fill)
+
+    def remap_pipe_values(self, values, fill=np.nan):
+        """把最後一維依舊管線索引排列的陣列轉成新管線索引，新增的管線填 fill"""
+        return self._remap(values, self.pipe_map, self.new.n_pipes, fill)
+
+    def summary(self, limit=20):
+        """
+        產生精簡摘要 (每類最多列出 limit 個 ID)
+
+        :return: 可直接 json.dump 的 dict
+        """
+        def clip(ids):
+            return {"count": len(ids), "ids": ids[:limit]}
+
+        return {
+            "changed_sections": self.changed_sections,
+            "nodes": {"added": clip(self.added_nodes), "removed": clip(self.removed_nodes),
+                      "modified": {field: clip(ids) for field, ids in self.node_changes.items()}},
+            "pipes": {"added": clip(self.added_pipes), "removed": clip(self.removed_pipes),
+                      "modified": {field: clip(ids) for field, ids in self.pipe_changes.items()}},
+        }
+
+
+class IncrementalParser:
+    """
+    持有一個 INP 檔案的解析狀態；update() 只重新解析有變動的區段並回傳 NetworkDiff
+    """
+
+    def __init__(self, file_path, reproject=True, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 previous=None):
+        """
+        :param file_path: INP 檔案路徑
+        :param reproject: 是否將座標轉換為 WGS84
+        :param cache_dir: 區段快取目錄，None 表示不使用磁碟快取
+        :param max_bytes: 快取大小上限
+        :param previous: 第一次 update() 時用來比較的舊版 Network (例如 inp_cache.latest_network 的結果)
+        """
+        self.file_path = file_path
+        self.reproject = reproject
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.sections = {}
+        self.parts = {}
+        self.network = previous
+        self.last_diff = None
+        self.stats = {"parsed": [], "cached": [], "reused": []}
+        self.update()
+
+    def update(self):
+        """
+        重新掃描檔案；只有內容雜湊改變的區段會被重新解析 (與轉換座標)
+
+        :return: NetworkDiff (相對於上一次 update 的結果)
+        """
+        sections = scan_sections(self.file_path)
+        changed = sorted(name for name in set(sections) | set(self.sections)
+                         if getattr(sections.get(name), "sha256", None)
+                         != getattr(self.sections.get(name), "sha256", None))
+        self.stats = {"parsed": [], "cached": [], "reused": []}
+        if self.parts and not set(changed) & set(PARSED_SECTIONS):
+            self.sections = sections
+            self.last_diff = NetworkDiff(self.network, self.network, changed)
+            return self.last_diff
+
+        for name in PARSED_SECTIONS:
+            info = sections.get(name)
+            if name in self.parts and name not in changed:
+                self.stats["reused"].append(name)
+                continue
+            if info is None:
+                self.parts[name] = _empty_section(name)
+                continue
+            self.parts[name], hit = load_section(self.file_path, info, self.reproject, self.cache_dir)
+            self.stats["cached" if hit else "parsed"].append(name)
+
+        network = build_from_sections(self.parts, WGS84 if self.reproject else TWD97)
+        diff = NetworkDiff(self.network, network, changed)
+        self.network = network
+        self.sections = sections
+        if self.cache_dir:
+            evict(self.cache_dir, self.max_bytes)
+        self.last_diff = diff
+        return diff
+
+
+def parse_inp_incremental(file_path, reproject=True, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    增量版的 parse_inp_network：與此檔案上一次快取的版本比較，只解析有變動的區段
+
+    結果會寫入 inp_cache 的 Network 快取，下一次呼叫 (或 cached_parse_inp_network) 即可直接使用。
+
+    :param file_path: INP 檔案路徑
+    :param reproject: 是否將座標轉換為 WGS84
+    :param cache_dir: 快取目錄
+    :param max_bytes: 快取大小上限
+    :return: (Network, NetworkDiff)；沒有舊版本時 diff 中所有元素皆為新增
+    """
+    content_hash = file_sha256(file_path)
+    entry_dir = os.path.join(cache_dir, cache_key(content_hash, reproject))
+    previous, _ = latest_network(file_path, reproject, cache_dir, exclude_hash=content_hash)
+    parser = IncrementalParser(file_path, reproject, cache_dir, max_bytes, previous=previous)
+    save_network(parser.network, entry_dir, meta={
+        "source": os.path.abspath(file_path),
+        "content_hash": content_hash,
+        "reproject": bool(reproject),
+        "version": CACHE_VERSION,
+    })
+    evict(cache_dir, max_bytes, keep=entry_dir)
+    return parser.network, parser.last_diff
@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from inp_cache import DEFAULT_CACHE_DIR, cached_parse_inp_network
+from inp_tokenizer import iter_inp_records
+
+# 各時段快照之間會變動的數值欄位；拓撲與座標只取第一份快照
+NODE_FIELDS = ("elevation", "base_demand")
+PIPE_FIELDS = ("length", "diameter", "roughness")
+SNAPSHOT_SECTIONS = ("JUNCTIONS", "PIPES")
+
+
+class NetworkSeries:
+    """
+    多個時段 INP 快照的集合：共用一份 Network (拓撲 + 已轉換座標)，
+    數值欄位則以 (時段 × 節點)、(時段 × 管線) 陣列保存，缺少的值為 NaN。
+    """
+
+    def __init__(self, network, paths, node_fields, pipe_fields):
+        self.network = network
+        self.paths = list(paths)
+        self.node_fields = node_fields  # {欄位: (T, n_nodes) ndarray}
+        self.pipe_fields = pipe_fields  # {欄位: (T, n_pipes) ndarray}
+
+    def __repr__(self):
+        return f"NetworkSeries(snapshots={len(self.paths)}, network={self.network!r})"
+
+    def node_values(self, field):
+        """回傳 (時段 × 節點) 陣列"""
+        return self.node_fields[field]
+
+    def pipe_values(self, field):
+        """回傳 (時段 × 管線) 陣列"""
+        return self.pipe_fields[field]
+
+
+def read_snapshot_columns(file_path):
+    """
+    只讀取單一快照的數值欄位 (不解析、不轉換座標)，讀完 JUNCTIONS 與 PIPES 即停止
+
+    :param file_path: INP 檔案路徑
+    :return: {"node_ids": [...], "pipe_ids": [...], 欄位名稱: ndarray, ...}
+    """
+    node_ids, elevation, base_demand = [], [], []
+    pipe_ids, length, diameter, roughness = [], [], [], []
+    for section, record in iter_inp_records(file_path, SNAPSHOT_SECTIONS, stop_early=True):
+        if section == "JUNCTIONS":
+            node_ids.append(record.id)
+            elevation.append(record.elevation)
+            base_demand.append(record.base_demand)
+        else:
+            pipe_ids.append(record.id)
+            length.append(record.length)
+            diameter.append(record.diameter)
+            roughness.append(record.roughness)
+    return {
+        "node_ids": node_ids,
+        "pipe_ids": pipe_ids,
+        "elevation": np.array(elevation, dtype=np.float64),
+        "base_demand": np.array(base_demand, dtype=np.float64),
+        "length": np.array(length, dtype=np.float64),
+        "diameter": np.array(diameter, dtype=np.float64),
+        "roughness": np.array(roughness, dtype=np.float64),
+    }
+
+
+def _align(index, ids, file_path, kind):
+    """將單一快照的 ID 對應到基準拓撲的索引，回報拓撲中不存在的 ID"""
+    pos = np.fromiter((index.get(i, -1) for i in ids), dtype=np.int64, count=len(ids))
+    known = pos >= 0
+    if not known.all():
+        print(f"[WARN] {file_path}: {int((~known).sum())} 個{kind}不在基準拓撲中，已略過")
+    return pos[known], known
+
+
+def parse_many(paths, reproject=True, max_workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    以 process pool 平行解析多個同一管網的 INP 快照
+
+    拓撲與座標只由第一份快照解析並轉換一次 (經由 inp_cache)，
+    其餘工作只讀取各快照的數值欄位，最後依節點 / 管線 ID 對齊成 (時段 × 元素) 陣列。
+
+    :param paths: INP 檔案路徑列表 (依時間排序)
+    :param reproject: 是否將座標轉換為 WGS84
+    :param max_workers: 平行工作數；1 表示在目前的 process 中依序執行
+    :param cache_dir: inp_cache 快取目錄
+    :return: NetworkSeries
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("paths 不可為空")
+
+    network = cached_parse_inp_network(paths[0], reproject, cache_dir=cache_dir)
+
+    if max_workers == 1 or len(paths) == 1:
+        snapshots = [read_snapshot_columns(p) for p in paths]
+    else:
+        workers = min(max_workers or os.cpu_count() or 1, len(paths))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            snapshots = list(pool.map(read_snapshot_columns, paths))
+
+    n_times = len(paths)
+    node_fields = {f: np.full((n_times, network.n_nodes), np.nan) for f in NODE_FIELDS}
+    pipe_fields = {f: np.full((n_times, network.n_pipes), np.nan) for f in PIPE_FIELDS}
+    node_index = network.node_index
+    pipe_index = network.pipe_index
+    for t, (file_path, snap) in enumerate(zip(paths, snapshots)):
+        pos, known = _align(node_index, snap["node_ids"], file_path, "節點")
+        for f in NODE_FIELDS:
+            node_fields[f][t, pos] = snap[f][known]
+        pos, known = _align(pipe_index, snap["pipe_ids"], file_path, "管線")
+        for f in PIPE_FIELDS:
+            pipe_fields[f][t, pos] = snap[f][known]
+
+    return NetworkSeries(network, paths, node_fields, pipe_fields)
@@ -0,0 +1,169 @@
+from collections import namedtuple
+
+# 每個區段對應的紀錄型別 (欄位依 EPANET INP 格式順序)
+Junction = namedtuple("Junction", ["id", "elevation", "base_demand", "pattern"])
+Reservoir = namedtuple("Reservoir", ["id", "head", "pattern"])
+Tank = namedtuple("Tank", ["id", "elevation", "init_level", "min_level", "max_level",
+                           "diameter", "min_volume", "volume_curve"])
+Pipe = namedtuple("Pipe", ["id", "start", "end", "length", "diameter", "roughness",
+                           "minor_loss", "status"])
+Pump = namedtuple("Pump", ["id", "start", "end", "parameters"])
+Valve = namedtuple("Valve", ["id", "start", "end", "diameter", "type", "setting", "minor_loss"])
+Pattern = namedtuple("Pattern", ["id", "multipliers"])
+Coordinate = namedtuple("Coordinate", ["id", "x", "y"])
+Vertex = namedtuple("Vertex", ["id", "x", "y"])
+
+DEFAULT_CHUNK_SIZE = 1 << 20  # 每次讀取 1 MiB
+
+
+def _opt(parts, i, cast=None):
+    """取第 i 個欄位，不存在時回傳 None"""
+    if len(parts) <= i:
+        return None
+    return cast(parts[i]) if cast else parts[i]
+
+
+def _junction(parts):
+    if len(parts) >= 3:
+        return Junction(parts[0], float(parts[1]), float(parts[2]), _opt(parts, 3))
+
+
+def _reservoir(parts):
+    if len(parts) >= 2:
+        return Reservoir(parts[0], float(parts[1]), _opt(parts, 2))
+
+
+def _tank(parts):
+    if len(parts) >= 6:
+        return Tank(parts[0], float(parts[1]), float(parts[2]), float(parts[3]), float(parts[4]),
+                    float(parts[5]), _opt(parts, 6, float), _opt(parts, 7))
+
+
+def _pipe(parts):
+    if len(parts) >= 6:
+        return Pipe(parts[0], parts[1], parts[2], float(parts[3]), float(parts[4]), float(parts[5]),
+                    _opt(parts, 6, float), _opt(parts, 7))
+
+
+def _pump(parts):
+    if len(parts) >= 3:
+        return Pump(parts[0], parts[1], parts[2], tuple(parts[3:]))
+
+
+def _valve(parts):
+    if len(parts) >= 6:
+        return Valve(parts[0], parts[1], parts[2], float(parts[3]), parts[4], parts[5],
+                     _opt(parts, 6, float))
+
+
+def _pattern(parts):
+    if len(parts) >= 2:
+        return Pattern(parts[0], tuple(float(p) for p in parts[1:]))
+
+
+def _coordinate(parts):
+    if len(parts) >= 3:
+        return Coordinate(parts[0], float(parts[1]), float(parts[2]))
+
+
+def _vertex(parts):
+    if len(parts) >= 3:
+        return Vertex(parts[0], float(parts[1]), float(parts[2]))
+
+
+# 區段名稱 -> 紀錄建構函式；不在表中的區段會被略過
+SECTION_PARSERS = {
+    "JUNCTIONS": _junction,
+    "RESERVOIRS": _reservoir,
+    "TANKS": _tank,
+    "PIPES": _pipe,
+    "PUMPS": _pump,
+    "VALVES": _valve,
+    "PATTERNS": _pattern,
+    "COORDINATES": _coordinate,
+    "VERTICES": _vertex,
+}
+
+
+def iter_lines(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    以固定大小的區塊讀取檔案並逐行產出，記憶體用量只與 chunk_size 有關
+
+    :param f: 已開啟的文字檔案物件
+    :param chunk_size: 每次讀取的字元數
+    """
+    remainder = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split("\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def _iter_records(f, sections, chunk_size, stop_early):
+    section = None
+    parser = None
+    remaining = set(sections) if sections is not None else None
+    for line in iter_lines(f, chunk_size):
+        line = line.partition(";")[0].strip()  # 去掉註解
+        if not line:
+            continue
+
+        # 檢測新區段
+        if line[0] == "[" and line[-1] == "]":
+            if stop_early and parser is not None:
+                remaining.discard(section)
+                if not remaining:
+                    return
+            section = line[1:-1].strip().upper()
+            parser = SECTION_PARSERS.get(section)
+            if sections is not None and section not in sections:
+                parser = None
+            continue
+
+        if parser is None:
+            continue
+        record = parser(line.split())
+        if record is not None:
+            yield section, record
+
+
+def iter_inp_records(source, sections=None, chunk_size=DEFAULT_CHUNK_SIZE, stop_early=False):
+    """
+    串流解析 EPANET INP 檔案，逐筆產出 (區段名稱, 紀錄)
+
+    檔案以區塊方式讀取，不會一次載入整個檔案；呼叫端可隨時中斷迭代。
+
+    :param source: INP 檔案路徑或已開啟的文字檔案物件
+    :param sections: 只解析指定的區段 (例如 {"PIPES"})，None 表示全部
+    :param chunk_size: 每次讀取的字元數
+    :param stop_early: 指定的區段都讀完後立即停止讀檔 (需搭配 sections)
+    :return: 產生 (section, record) 的 generator
+    """
+    if sections is not None:
+        sections = {s.upper() for s in sections}
+    elif stop_early:
+        raise ValueError("stop_early 需要指定 sections")
+    if hasattr(source, "read"):
+        yield from _iter_records(source, sections, chunk_size, stop_early)
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        yield from _iter_records(f, sections, chunk_size, stop_early)
+
+
+def iter_section(source, name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    只產出單一區段的紀錄，並在該區段結束後立即停止讀檔
+
+    :param source: INP 檔案路徑或已開啟的文字檔案物件
+    :param name: 區段名稱，例如 "PIPES"
+    :param chunk_size: 每次讀取的字元數
+    :return: 產生紀錄的 generator
+    """
+    name = name.upper()
+    for section, record in iter_inp_records(source, {name}, chunk_size, stop_early=True):
+        yield record
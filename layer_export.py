@@ -0,0 +1,294 @@
+"""
+以串流方式逐圖層、逐批輸出 SHP 圖層，不會在記憶體中組出合併後的 GeoDataFrame
+
+支援的格式 (依副檔名判斷)：
+    - .geojson：GeoJSON FeatureCollection
+    - .geojsonl / .geojsons：GeoJSON Lines (每行一個 Feature)
+    - .fgb：FlatGeobuf (內建空間索引；經由 pyogrio.write_arrow 以 Arrow 串流寫入)
+    - .parquet：GeoParquet 1.0 (WKB 幾何，pyarrow.parquet.ParquetWriter 逐批寫入)
+
+圖層以 (圖層名稱, GeoDataFrame) 的序列傳入 (例如 parse_shp.LayerCache.items())，
+各圖層欄位不同時，FlatGeobuf / GeoParquet 會使用所有圖層欄位的聯集。
+"""
+import json
+import os
+
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 10_000
+SRC_COLUMN = "src_layer"
+FORMATS = {
+    ".geojson": "geojson",
+    ".json": "geojson",
+    ".geojsonl": "geojsonl",
+    ".geojsons": "geojsonl",
+    ".fgb": "fgb",
+    ".parquet": "parquet",
+}
+EXTENSIONS = {"geojson": ".geojson", "geojsonl": ".geojsonl", "fgb": ".fgb", "parquet": ".parquet"}
+_GEOMETRY_TYPES = {0: "Point", 1: "LineString", 2: "LineString", 3: "Polygon", 4: "MultiPoint",
+                   5: "MultiLineString", 6: "MultiPolygon", 7: "GeometryCollection"}
+
+
+def format_from_path(path):
+    """由副檔名判斷輸出格式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"無法由副檔名判斷格式: {path} (支援 {', '.join(FORMATS)})")
+    return FORMATS[ext]
+
+
+def round_geometries(geoms, precision):
+    """
+    將座標四捨五入到 precision 位小數 (WGS84 取 6 位約 0.1 m)
+
+    :param geoms: shapely 幾何陣列
+    :param precision: 小數位數，None 表示不處理
+    """
+    if precision is None or len(geoms) == 0:
+        return geoms
+    import shapely
+    return shapely.transform(geoms, lambda coords: np.round(coords, precision),
+                             include_z=bool(shapely.has_z(geoms).any()))
+
+
+def iter_batches(layers, batch_size=DEFAULT_BATCH_SIZE, precision=None):
+    """
+    逐圖層、逐批產出 (圖層名稱, 屬性 DataFrame, 幾何陣列)
+
+    :param layers: (圖層名稱, GeoDataFrame) 的序列
+    :param batch_size: 每批的圖徵數
+    :param precision: 座標小數位數
+    """
+    for name, gdf in layers:
+        attrs = gdf.drop(columns=gdf.geometry.name)
+        geoms = np.asarray(gdf.geometry.values)
+        for start in range(0, len(gdf), batch_size):
+            stop = start + batch_size
+            yield name, attrs.iloc[start:stop], round_geometries(geoms[start:stop], precision)
+
+
+def _feature_lines(name, attrs, geoms):
+    """一批圖徵轉成 GeoJSON Feature 字串列表；name 為 None 時不加 src_layer 欄位"""
+    import shapely
+
+    if name is not None:
+        attrs = attrs.assign(**{SRC_COLUMN: name})
+    # 只以 "\n" 切開：字串中的 U+2028 / U+2029 / U+0085 不會被跳脫，splitlines() 會把它們也當成換行；
+    # double_precision 預設只有 10 位，與 GDAL 輸出相比會失去精度
+    props = attrs.to_json(
+        orient="records", lines=True, force_ascii=False, date_format="iso", default_handler=str,
+        double_precision=15,
+    ).split("\n")
+    if props and not props[-1]:
+        props.pop()
+    geometry = shapely.to_geojson(geoms)
+    return [f'{{"type":"Feature","properties":{p},"geometry":{g if g is not None else "null"}}}'
+            for p, g in zip(props, geometry.tolist())]
+
+
+def write_geojson(layers, path, seq=False, batch_size=DEFAULT_BATCH_SIZE, precision=None, source_column=True):
+    """
+    串流寫出 GeoJSON FeatureCollection 或 GeoJSON Lines
+
+    :param layers: (圖層名稱, GeoDataFrame) 的序列
+    :param path: 輸出路徑
+    :param seq: True 時輸出 GeoJSON Lines
+    :param source_column: 是否加上 src_layer 欄位
+    :return: 寫出的圖徵數
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        if not seq:
+            f.write('{"type":"FeatureCollection","features":[\n')
+        for name, attrs, geoms in iter_batches(layers, batch_size, precision):
+            lines = _feature_lines(name if source_column else None, attrs, geoms)
+            if seq:
+                f.write("\n".join(lines))
+                f.write("\n")
+            else:
+                if count:
+                    f.write(",\n")
+                f.write(",\n".join(lines))
+            count += len(lines)
+        if not seq:
+            f.write("\n]}\n")
+    return count
+
+
+def _arrow_table(attrs):
+    """屬性轉成 Arrow table；無法自動轉換的 object 欄位改存成字串"""
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(attrs, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        fixed = attrs.copy()
+        for column in fixed.columns[fixed.dtypes == object]:
+            fixed[column] = fixed[column].map(lambda v: None if v is None or v != v else str(v))
+        return pa.Table.from_pandas(fixed, preserve_index=False)
+
+
+def union_schema(layers, source_column=True):
+    """
+    所有圖層屬性欄位的聯集 (source_column 時另加 src_layer 欄位)；同名欄位型態無法合併時改為字串
+
+    :return: pyarrow.Schema (不含幾何欄位)
+    """
+    import pyarrow as pa
+
+    types = {}
+    for _, gdf in layers:
+        schema = _arrow_table(gdf.drop(columns=gdf.geometry.name).head(0)).schema
+        for field in schema:
+            if pa.types.is_null(field.type) or str(gdf[field.name].dtype) == "object":
+                field = pa.field(field.name, pa.string())  # object 欄位一律視為字串
+            if field.name not in types:
+                types[field.name] = field.type
+            elif types[field.name] != field.type:
+                try:
+                    merged = pa.unify_schemas([pa.schema([pa.field(field.name, types[field.name])]),
+                                               pa.schema([field])], promote_options="permissive")
+                    types[field.name] = merged.field(field.name).type
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    types[field.name] = pa.string()
+    if not source_column:
+        return pa.schema([pa.field(k, v) for k, v in types.items()])
+    types.pop(SRC_COLUMN, None)
+    return pa.schema([pa.field(SRC_COLUMN, pa.string())] + [pa.field(k, v) for k, v in types.items()])
+
+
+def _record_batch(schema, name, attrs, geoms, geometry_field):
+    """一批圖徵轉成符合聯集 schema 的 Arrow RecordBatch；name 為 None 時不加 src_layer 欄位"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import shapely
+
+    table = _arrow_table(attrs)
+    n = len(attrs)
+    columns = [] if name is None else [pa.array([name] * n, pa.string())]
+    for field in schema:
+        if field.name == SRC_COLUMN and name is not None:
+            continue
+        if field.name in table.column_names:
+            column = table.column(field.name)
+            columns.append(column if column.type == field.type else pc.cast(column, field.type))
+        else:
+            columns.append(pa.nulls(n, field.type))
+    columns.append(pa.array(shapely.to_wkb(geoms), pa.binary()))
+    return pa.RecordBatch.from_arrays([c.combine_chunks() if isinstance(c, pa.ChunkedArray) else c
+                                       for c in columns], schema=schema.append(geometry_field))
+
+
+def _geometry_types(layers):
+    import shapely
+
+    kinds = set()
+    for _, gdf in layers:
+        kinds.update(shapely.get_type_id(np.asarray(gdf.geometry.values)).tolist())
+    return sorted(_GEOMETRY_TYPES[k] for k in kinds if k in _GEOMETRY_TYPES)
+
+
+def _bounds(layers):
+    bounds = np.array([gdf.total_bounds for _, gdf in layers if not gdf.empty])
+    bounds = bounds[np.isfinite(bounds).all(axis=1)] if len(bounds) else bounds
+    if len(bounds) == 0:
+        return None
+    return [float(bounds[:, 0].min()), float(bounds[:, 1].min()),
+            float(bounds[:, 2].max()), float(bounds[:, 3].max())]
+
+
+def write_geoparquet(layers, path, batch_size=DEFAULT_BATCH_SIZE, precision=None, compression="zstd",
+                     source_column=True):
+    """
+    串流寫出 GeoParquet (每批一個 row group)
+
+    :param source_column: 是否加上 src_layer 欄位
+    :return: 寫出的圖徵數
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("GeoParquet 輸出需要安裝 pyarrow") from e
+
+    layers = list(layers)
+    schema = union_schema(layers, source_column)
+    column = {"encoding": "WKB", "geometry_types": _geometry_types(layers)}
+    bbox = _bounds(layers)
+    if bbox is not None:
+        column["bbox"] = bbox
+    crs = next((gdf.crs for _, gdf in layers if gdf.crs is not None), None)
+    if crs is not None:
+        column["crs"] = crs.to_json_dict()
+    geo = {"version": "1.0.0", "primary_column": "geometry", "columns": {"geometry": column}}
+    geometry_field = pa.field("geometry", pa.binary())
+    full_schema = schema.append(geometry_field).with_metadata({"geo": json.dumps(geo)})
+
+    count = 0
+    with pq.ParquetWriter(path, full_schema, compression=compression) as writer:
+        for name, attrs, geoms in iter_batches(layers, batch_size, precision):
+            batch = _record_batch(schema, name if source_column else None, attrs, geoms, geometry_field)
+            writer.write_batch(batch.replace_schema_metadata(full_schema.metadata))
+            count += batch.num_rows
+    return count
+
+
+def write_flatgeobuf(layers, path, batch_size=DEFAULT_BATCH_SIZE, precision=None, spatial_index=True,
+                     source_column=True):
+    """
+    串流寫出 FlatGeobuf：所有批次組成一個 Arrow 串流，由 GDAL 一次寫入單一圖層
+
+    FlatGeobuf 不支援附加寫入，因此不能逐圖層呼叫 to_file(mode="a")。
+
+    :param spatial_index: 是否建立 FlatGeobuf 內建的空間索引 (packed Hilbert R-tree)
+    :param source_column: 是否加上 src_layer 欄位
+    :return: 寫出的圖徵數
+    """
+    import pyarrow as pa
+    from pyogrio import write_arrow
+
+    layers = list(layers)
+    schema = union_schema(layers, source_column)
+    geometry_field = pa.field("geometry", pa.binary(), metadata={"ARROW:extension:name": "geoarrow.wkb"})
+    types = _geometry_types(layers)
+    crs = next((gdf.crs for _, gdf in layers if gdf.crs is not None), None)
+    count = 0
+
+    def batches():
+        nonlocal count
+        for name, attrs, geoms in iter_batches(layers, batch_size, precision):
+            batch = _record_batch(schema, name if source_column else None, attrs, geoms, geometry_field)
+            count += batch.num_rows
+            yield batch
+
+    reader = pa.RecordBatchReader.from_batches(schema.append(geometry_field), batches())
+    if os.path.exists(path):
+        os.remove(path)
+    write_arrow(reader, path, driver="FlatGeobuf", geometry_name="geometry",
+                geometry_type=types[0] if len(types) == 1 else "Unknown",
+                crs=crs.to_wkt() if crs is not None else None,
+                layer_options={"SPATIAL_INDEX": "YES" if spatial_index else "NO"})
+    return count
+
+
+def export_layers(layers, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, precision=6, source_column=True):
+    """
+    將多個圖層串流輸出成單一檔案 (預設每個圖徵附帶 src_layer 欄位)
+
+    :param layers: (圖層名稱, GeoDataFrame) 的序列
+    :param path: 輸出路徑
+    :param fmt: "geojson"、"geojsonl"、"fgb" 或 "parquet"；None 時由副檔名判斷
+    :param batch_size: 每批的圖徵數
+    :param precision: 座標小數位數，None 表示不處理
+    :param source_column: 是否加上 src_layer 欄位 (單一圖層輸出時可關閉)
+    :return: 寫出的圖徵數
+    """
+    fmt = fmt or format_from_path(path)
+    if fmt in ("geojson", "geojsonl"):
+        return write_geojson(layers, path, fmt == "geojsonl", batch_size, precision, source_column)
+    if fmt == "fgb":
+        return write_flatgeobuf(layers, path, batch_size, precision, source_column=source_column)
+    if fmt == "parquet":
+        return write_geoparquet(layers, path, batch_size, precision, source_column=source_column)
+    raise ValueError(f"未知的格式: {fmt}")
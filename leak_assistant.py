@@ -1,29 +1,22 @@
 import json
 import os
-import base64
-import time
 
-from dotenv import load_dotenv
-from openai import OpenAI
-from PIL import Image
-from io import BytesIO
-from parse_inp import parse_inp, save_to_json
-
-# **1️⃣ 載入 API Key**
-load_dotenv()
-key = os.getenv("OPENAI_API_KEY")
-if key is None:
-    raise ValueError("API key is not set.")
-
-client = OpenAI(api_key=key)
+from assistant_registry import AssistantRegistry
+from assistant_runner import get_client, wait_for_run
+from image_extractor import ImageStore, extract_data_uri_images
+from inp_series import parse_many
+from leak_engine import detect_demand_outliers, detect_series_leaks
+from payload_encoder import write_payload
+from profiling import enabled as profiling_enabled, print_summary, span, traced
 
 ######################################################################
 # 下載檔案函式
 ######################################################################
+@traced("download_file")
 def download_file(file_id, output_path):
     """下載 OpenAI API 中的 file_id 檔案並儲存為 output_path"""
     try:
-        response = client.files.content(file_id=file_id)
+        response = get_client().files.content(file_id=file_id)
         file_content = response.read()
         with open(output_path, 'wb') as f:
             f.write(file_content)
@@ -32,12 +25,13 @@ def download_file(file_id, output_path):
         print(f"下載文件時發生錯誤：{e}")
 
 
+@traced("download_sandbox_file")
 def download_sandbox_file(file_path, output_path):
     """下載 sandbox 路徑檔案 (例如 sandbox:/mnt/data/xxx)，解析其中的 file_id 後下載"""
     try:
         # sandbox:/mnt/data/... => 取得最後段
         file_id = file_path.split("/")[-1]  # 解析 sandbox 文件 ID
-        response = client.files.content(file_id=file_id)
+        response = get_client().files.content(file_id=file_id)
         file_content = response.read()
         with open(output_path, 'wb') as f:
             f.write(file_content)
@@ -45,145 +39,176 @@ def download_sandbox_file(file_path, output_path):
     except Exception as e:
         print(f"下載 Sandbox 文件時發生錯誤：{e}")
 
-######################################################################
-# 讀取 system_prompt.md 作為 Assistant 的 instructions
-######################################################################
-with open("system_prompt.md", "r", encoding="utf-8") as file:
-    system_prompt = file.read()
-
-# **2️⃣ 創建 Assistant**
-assistant = client.beta.assistants.create(
-    name="Leak Detection Assistant",
-    instructions=system_prompt,
-    tools=[{"type": "code_interpreter"}],  # 重要！確保 Assistant 有權限解析數據
-    model="gpt-4o"
-)
-print(f"Assistant Created: {assistant.id}")
 
-######################################################################
-# 解析 EPANET .inp 文件並打包成 JSON
-######################################################################
-file_path = "0401-13-01-12.inp"
-parsed_data = parse_inp(file_path)
-json_file_path = "parsed_network.json"
-save_to_json(parsed_data, json_file_path)
-print(f"JSON data saved to: {json_file_path}")
-
-# 檢視 JSON
-with open(json_file_path, "r", encoding="utf-8") as rj:
-    raw_json = rj.read()
-print("Parsed Data below (from JSON file):")
-print(raw_json)
+def main(inp_files=("0401-13-01-12.inp",), prompt_file="system_prompt.md", attach_network=False):
+    """
+    在本地計算漏水異常後交給 Assistant 解讀，並下載回傳的圖片 / 檔案
+
+    :param inp_files: INP 檔案路徑；多個時段的快照請依時間順序列出
+    :param prompt_file: Assistant instructions 檔案
+    :param attach_network: 是否另外上傳精簡管網拓撲 (network_compact.json，最多約 20 萬 token)；
+                           預設只上傳異常摘要 (被標記的節點已附座標)
+    """
+    # **1️⃣ 載入 API Key (第一次使用時才讀取 .env 並建立 client)**
+    client = get_client()
+    inp_files = list(inp_files)
+
+    ######################################################################
+    # 讀取 system_prompt.md 作為 Assistant 的 instructions
+    ######################################################################
+    with open(prompt_file, "r", encoding="utf-8") as file:
+        system_prompt = file.read()
+
+    ######################################################################
+    # 解析 EPANET .inp 文件，在本地計算異常並打包成精簡摘要 JSON
+    ######################################################################
+    with span("parse_many", files=len(inp_files)):
+        series = parse_many(inp_files)  # 拓撲與座標只解析一次 (內容未變時直接讀取快取)
+    with span("detect_series_leaks"):
+        if len(series.paths) >= 2:
+            # INP 沒有壓力與流量：以最後兩個時段的節點需水量變化代替，管線不判斷
+            report = detect_series_leaks(series, node_field="base_demand")
+            finding = ("已依 1.5 倍平均值規則，比較最後兩個時段的節點基本需水量變化 (以需水量變化代替壓力；"
+                       "INP 不含流量，因此未判斷管線)，標記可能的漏水節點")
+        else:
+            report = detect_demand_outliers(series.network)
+            finding = ("只有單一時段，無法計算變化量；摘要 (method = demand_outlier) 列出的是基本需水量"
+                       "超過平均值 1.5 倍的節點，只是需水量偏高，並非漏水判斷，也未判斷管線")
+    print(f"Local leak detection: {report}")
+
+    json_file_path = "leak_summary.json"
+    with open(json_file_path, "w", encoding="utf-8") as f:
+        json.dump(report.summary(), f, ensure_ascii=False)
+    print(f"Anomaly summary saved to: {json_file_path}")
+
+    # 精簡的管網拓撲 (量化座標 + 差分路徑)，超過 token 預算時自動簡化幾何，供繪製拓撲圖；
+    # 檔案很大，只在 attach_network 時產生並上傳
+    network_file_path = "network_compact.json" if attach_network else None
+    if network_file_path:
+        with span("write_payload"):
+            write_payload(series.network, network_file_path, max_tokens=200_000)
+
+    # **2️⃣ 取得 Assistant 並上傳摘要 JSON (設定 / 內容相同時重複使用，登錄表用完即關閉)**
+    with AssistantRegistry(client) as registry:
+        registry.cleanup()  # 清除超過 TTL 未使用的遠端 Assistant 與檔案
+        assistant_id = registry.get_or_create_assistant(
+            name="Leak Detection Assistant",
+            instructions=system_prompt,
+            tools=[{"type": "code_interpreter"}],  # 重要！確保 Assistant 有權限解析數據
+            model="gpt-4o"
+        )
+        file_ids = [registry.get_or_upload_file(json_file_path)]  # 內容相同時重複使用已上傳的檔案
+        if network_file_path:
+            file_ids.append(registry.get_or_upload_file(network_file_path))
+
+    if network_file_path:
+        data_text = ("另附精簡管網拓撲 (network-compact-v1：座標為整數，除以 scale 得到經緯度；"
+                     "pipes.path 為相對起點節點的差分座標)。\n"
+                     "請說明可能的漏水區域，並繪製管網拓撲結構圖標示漏水區域 (圖片附件或 Base64)。\n")
+    else:
+        data_text = ("摘要中被標記的節點附有座標 (lat、lng)。\n"
+                     "請說明可能的漏水區域，並依座標繪製標示漏水節點的分布圖 (圖片附件或 Base64)。\n")
+
+    ######################################################################
+    # 建立對話環境（Thread），並帶上 JSON 檔案
+    ######################################################################
+    thread = client.beta.threads.create(
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": (
+                            "這是從 EPANET .inp 文件在本地計算出的異常摘要 (JSON)，"
+                            f"{finding}，請加以解讀。\n"
+                            f"{data_text}"
+                            "若產生檔案，請使用 sandbox 路徑或附件返回也可以\n"
+                        )
+                    }
+                ],
+                "attachments": [
+                    {
+                        "file_id": file_id,
+                        "tools": [{"type": "code_interpreter"}]
+                    }
+                    for file_id in file_ids
+                ]
+            }
+        ]
+    )
+    print(f"Thread Created: {thread.id}")
+
+    ######################################################################
+    # 啟動 Assistant (非串流) or 串流
+    ######################################################################
+    with span("run.create"):
+        run = client.beta.threads.runs.create(
+            thread_id=thread.id,
+            assistant_id=assistant_id
+            # stream=True # 如要串流則加此參數
+        )
+    print(f"Run Created: {run.id}")
+
+    # 以指數退避輪詢狀態 (逾時會自動取消 Run)
+    run_status = wait_for_run(thread.id, run.id)
+    print(f"Run Status: {run_status.status}")
 
-######################################################################
-# 上傳 JSON 檔案給 Assistant
-######################################################################
-json_file_upload = client.files.create(
-    file=open(json_file_path, "rb"),
-    purpose="assistants"
-)
-print(f"JSON File Uploaded: {json_file_upload.id}")
+    ######################################################################
+    # 讀取最終回應  (示範解析 sandbox 路徑、base64)
+    ######################################################################
+    print("\n--- Final Messages ---")
+    with span("messages.list"):
+        messages = client.beta.threads.messages.list(thread_id=thread.id)
+    sorted_messages = sorted(messages, key=lambda m: m.created_at)
+
+    image_store = ImageStore(prefix="leak_detection", show=True)  # 相同內容的圖片只寫入一次
+    for msg in sorted_messages:
+        print(f"{msg.role}: {msg.content}")
+
+        # 處理 sandbox 路徑檔案
+        if hasattr(msg, 'content') and isinstance(msg.content, list):
+            for content_block in msg.content:
+                if hasattr(content_block, 'annotations'):
+                    for annotation in content_block.annotations:
+                        if annotation.type == 'file_path' and 'sandbox' in annotation.text:
+                            sandbox_path = annotation.text.split(':')[-1]
+                            output_file = os.path.basename(sandbox_path)
+                            download_sandbox_file(sandbox_path, output_file)
+                            print(f"已成功下載 Sandbox 文件: {output_file}")
+                # 處理圖片附件
+                if hasattr(content_block, 'image_file') and content_block.image_file:
+                    image_file_id = content_block.image_file.file_id
+                    with span("files.content", file_id=image_file_id):
+                        image_response = client.files.content(file_id=image_file_id)
+                    if image_response:
+                        image_bytes = None
+                        if hasattr(image_response, 'read'):
+                            image_bytes = image_response.read()
+                        else:
+                            try:
+                                image_bytes = bytes(image_response)
+                            except TypeError:
+                                if isinstance(image_response, str):
+                                    image_bytes = image_response.encode("utf-8")
+
+                        if image_bytes:
+                            path, new = image_store.save_bytes(image_bytes)
+                            print(f"圖片已儲存至 {path} (File ID: {image_file_id}{'' if new else '，內容重複'})")
+                        else:
+                            print(f"無法取得圖片 bytes (File ID: {image_file_id})")
+                    else:
+                        print(f"無法下載圖片 (File ID: {image_file_id})")
+                # 若 Assistant 在文字中回傳 Base64 (data URI) 圖片
+                if hasattr(content_block, 'text') and content_block.text:
+                    for path in extract_data_uri_images(content_block.text.value, store=image_store):
+                        print(f"Base64 圖片已儲存至 {path}")
 
-######################################################################
-# 建立對話環境（Thread），並帶上 JSON 檔案
-######################################################################
-thread = client.beta.threads.create(
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": (
-                        "這是從 EPANET .inp 文件解析出的管網數據，已打包為 JSON 檔案，請加以解析。\n"
-                        "請找出可能的漏水區域，並繪製管網拓撲結構圖 (圖片附件或 Base64)。\n"
-                        "若產生檔案，請使用 sandbox 路徑或附件返回也可以\n"
-                    )
-                }
-            ],
-            "attachments": [
-                {
-                    "file_id": json_file_upload.id,
-                    "tools": [{"type": "code_interpreter"}]
-                }
-            ]
-        }
-    ]
-)
-print(f"Thread Created: {thread.id}")
+    # 有設定 LEAK_PROFILE 時印出各階段耗時 (完整紀錄於程式結束時輸出)
+    if profiling_enabled():
+        print("\n--- Stage Timings ---")
+        print_summary()
 
-######################################################################
-# 啟動 Assistant (非串流) or 串流
-######################################################################
-run = client.beta.threads.runs.create(
-    thread_id=thread.id,
-    assistant_id=assistant.id
-    # stream=True # 如要串流則加此參數
-)
-print(f"Run Created: {run.id}")
-
-# 輪詢狀態
-while True:
-    run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-    print(f"Run Status: {run_status.status}")
-    if run_status.status in ["completed", "failed", "cancelled"]:
-        break
-    time.sleep(5)
 
-######################################################################
-# 讀取最終回應  (示範解析 sandbox 路徑、base64)
-######################################################################
-print("\n--- Final Messages ---")
-messages = client.beta.threads.messages.list(thread_id=thread.id)
-sorted_messages = sorted(messages, key=lambda m: m.created_at)
-
-for msg in sorted_messages:
-    print(f"{msg.role}: {msg.content}")
-
-    # 處理 sandbox 路徑檔案
-    if hasattr(msg, 'content') and isinstance(msg.content, list):
-        for content_block in msg.content:
-            if hasattr(content_block, 'annotations'):
-                for annotation in content_block.annotations:
-                    if annotation.type == 'file_path' and 'sandbox' in annotation.text:
-                        sandbox_path = annotation.text.split(':')[-1]
-                        output_file = os.path.basename(sandbox_path)
-                        download_sandbox_file(sandbox_path, output_file)
-                        print(f"已成功下載 Sandbox 文件: {output_file}")
-            # 處理圖片附件
-            if hasattr(content_block, 'image_file') and content_block.image_file:
-                image_file_id = content_block.image_file.file_id
-                image_response = client.files.content(file_id=image_file_id)
-                if image_response:
-                    image_bytes = None
-                    if hasattr(image_response, 'read'):
-                        image_bytes = image_response.read()
-                    else:
-                        try:
-                            image_bytes = bytes(image_response)
-                        except TypeError:
-                            if isinstance(image_response, str):
-                                image_bytes = image_response.encode("utf-8")
-
-                    if image_bytes:
-                        with open("leak_detection_result.png", "wb") as outimg:
-                            outimg.write(image_bytes)
-                        im = Image.open(BytesIO(image_bytes))
-                        im.show()
-                        print(f"圖片已成功顯示 (File ID: {image_file_id})")
-                    else:
-                        print(f"無法取得圖片 bytes (File ID: {image_file_id})")
-                else:
-                    print(f"無法下載圖片 (File ID: {image_file_id})")
-
-    # 若 Assistant 回傳 Base64 圖片
-    if isinstance(msg.content, str) and "base64" in msg.content:
-        try:
-            encoded_data = msg.content.split(",")[-1].strip()
-            image_data = base64.b64decode(encoded_data)
-            with open("leak_detection_base64.png", "wb") as f:
-                f.write(image_data)
-            im = Image.open(BytesIO(image_data))
-            im.show()
-        except Exception as e:
-            print(f"無法解碼 base64 圖片: {e}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import warnings
+
+import numpy as np
+
+# system_prompt.md 的規則：變化量超過 1.5 倍平均值即標記為可能漏水
+DEFAULT_FACTOR = 1.5
+DEFAULT_Z_THRESHOLD = 3.0
+DEFAULT_WINDOW = 3
+
+
+def ratio_anomalies(delta, factor=DEFAULT_FACTOR):
+    """
+    |變化量| 超過 factor 倍的平均 |變化量| 即標記為異常 (system_prompt.md 規則)
+
+    :param delta: 變化量陣列 (NaN 會被忽略)
+    :param factor: 倍數
+    :return: (異常遮罩, 分數 = |變化量| / 平均 |變化量|)
+    """
+    magnitude = np.abs(np.asarray(delta, dtype=np.float64))
+    finite = np.isfinite(magnitude)
+    mean = magnitude[finite].mean() if finite.any() else 0.0
+    if mean == 0:
+        return np.zeros(magnitude.shape, dtype=bool), np.zeros(magnitude.shape)
+    score = np.where(finite, magnitude / mean, 0.0)
+    return score > factor, score
+
+
+def zscore_anomalies(delta, threshold=DEFAULT_Z_THRESHOLD):
+    """
+    以 z-score 判斷異常：|(變化量 - 平均) / 標準差| 超過 threshold
+
+    :param delta: 變化量陣列 (NaN 會被忽略)
+    :param threshold: z-score 門檻
+    :return: (異常遮罩, |z|)
+    """
+    delta = np.asarray(delta, dtype=np.float64)
+    finite = np.isfinite(delta)
+    if not finite.any():
+        return np.zeros(delta.shape, dtype=bool), np.zeros(delta.shape)
+    std = delta[finite].std()
+    if std == 0:
+        return np.zeros(delta.shape, dtype=bool), np.zeros(delta.shape)
+    score = np.where(finite, np.abs(delta - delta[finite].mean()) / std, 0.0)
+    return score > threshold, score
+
+
+def rolling_anomalies(values, window=DEFAULT_WINDOW, threshold=DEFAULT_Z_THRESHOLD):
+    """
+    以滾動基準線判斷最後一個時段是否異常：
+    與前 window 個時段的平均值相比，偏差超過 threshold 倍的標準差即標記
+
+    :param values: (時段 × 元素) 陣列
+    :param window: 基準線使用的時段數
+    :param threshold: 標準差倍數
+    :return: (異常遮罩, 偏差 / 標準差)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim != 2 or values.shape[0] < 2:
+        raise ValueError("rolling 需要至少兩個時段的 (時段 × 元素) 陣列")
+    history = values[-window - 1:-1]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # 全為 NaN 的欄位
+        baseline = np.nanmean(history, axis=0)
+        spread = np.nanstd(history, axis=0)
+    deviation = np.abs(values[-1] - baseline)
+    # 基準期間沒有波動時，以全體偏差的平均值作為尺度，避免除以 0
+    finite = np.isfinite(deviation)
+    fallback = deviation[finite].mean() if finite.any() else 0.0
+    scale = np.where(spread > 0, spread, fallback)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(finite & (scale > 0), deviation / scale, 0.0)
+    return score > threshold, score
+
+
+def _detect(values, method, t1, t2, factor, threshold, window):
+    """單一元素類型 (節點或管線) 的異常判斷"""
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    if method == "rolling":
+        return rolling_anomalies(values, window, threshold)
+    # 規則針對的是「變化量」；只有一個時段時無法計算，不可拿原始數值代替
+    if values.shape[0] < 2:
+        raise ValueError(f"{method} 需要至少兩個時段的 (時段 × 元素) 陣列；"
+                         "單一快照請改用 detect_demand_outliers")
+    delta = values[t1] - values[t2]
+    if method == "ratio":
+        return ratio_anomalies(delta, factor)
+    if method == "zscore":
+        return zscore_anomalies(delta, threshold)
+    raise ValueError(f"未知的 method: {method}")
+
+
+class LeakReport:
+    """異常判斷結果：被標記的節點 / 管線 ID 與其分數"""
+
+    def __init__(self, network, method, params, node_mask=None, node_score=None,
+                 pipe_mask=None, pipe_score=None):
+        self.network = network
+        self.method = method
+        self.params = params
+        self.node_mask = node_mask
+        self.node_score = node_score
+        self.pipe_mask = pipe_mask
+        self.pipe_score = pipe_score
+
+    def __repr__(self):
+        return (f"LeakReport(method={self.method!r}, nodes={len(self.node_ids)}, "
+                f"pipes={len(self.pipe_ids)})")
+
+    @property
+    def node_ids(self):
+        if self.node_mask is None:
+            return []
+        return self.network.node_ids[self.node_mask].tolist()
+
+    @property
+    def pipe_ids(self):
+        if self.pipe_mask is None:
+            return []
+        return self.network.pipe_ids[self.pipe_mask].tolist()
+
+    def _top(self, mask, score, ids, top, with_xy):
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(-score[idx], kind="stable")][:top]
+        rows = []
+        for i in idx.tolist():
+            row = {"id": str(ids[i]), "score": round(float(score[i]), 3)}
+            if with_xy is not None:
+                x, y = with_xy[i]
+                if np.isfinite(x) and np.isfinite(y):
+                    row["lat"], row["lng"] = round(float(y), 6), round(float(x), 6)
+            rows.append(row)
+        return rows
+
+    def summary(self, top=50):
+        """
+        產生給 Assistant 的精簡摘要 (只含被標記的元素，依分數排序取前 top 筆)
+
+        :param top: 每類最多列出的元素數
+        :return: 可直接 json.dump 的 dict
+        """
+        net = self.network
+        result = {
+            "method": self.method,
+            "params": self.params,
+            "network": {"nodes": int(net.n_nodes), "pipes": int(net.n_pipes), "crs": net.crs},
+        }
+        if self.node_mask is not None:
+            result["flagged_nodes"] = int(self.node_mask.sum())
+            result["nodes"] = self._top(self.node_mask, self.node_score, net.node_ids, top, net.node_xy)
+        if self.pipe_mask is not None:
+            result["flagged_pipes"] = int(self.pipe_mask.sum())
+            result["pipes"] = self._top(self.pipe_mask, self.pipe_score, net.pipe_ids, top, None)
+        return result
+
+
+def detect_leaks(network, node_values=None, pipe_values=None, method="ratio", t1=-2, t2=-1,
+                 factor=DEFAULT_FACTOR, threshold=DEFAULT_Z_THRESHOLD, window=DEFAULT_WINDOW):
+    """
+    在本地以 NumPy 判斷可能的漏水節點與管線
+
+    :param network: network_model.Network
+    :param node_values: (時段 × 節點) 陣列 (至少兩個時段)，例如壓力
+    :param pipe_values: (時段 × 管線) 陣列 (至少兩個時段)，例如流量
+    :param method: "ratio" (1.5 倍平均值規則)、"zscore" 或 "rolling"
+    :param t1: ratio / zscore 時比較的第一個時段 (變化量 = values[t1] - values[t2])
+    :param t2: ratio / zscore 時比較的第二個時段
+    :param factor: ratio 的倍數
+    :param threshold: zscore / rolling 的門檻
+    :param window: rolling 的基準線時段數
+    :return: LeakReport
+    """
+    if method == "ratio":
+        params = {"factor": factor}
+    elif method == "zscore":
+        params = {"threshold": threshold}
+    elif method == "rolling":
+        params = {"window": window, "threshold": threshold}
+    else:
+        raise ValueError(f"未知的 method: {method}")
+
+    report = LeakReport(network, method, params)
+    if node_values is not None:
+        report.node_mask, report.node_score = _detect(node_values, method, t1, t2, factor, threshold, window)
+    if pipe_values is not None:
+        report.pipe_mask, report.pipe_score = _detect(pipe_values, method, t1, t2, factor, threshold, window)
+    return report
+
+
+def detect_series_leaks(series, node_field="base_demand", pipe_field=None, **kwargs):
+    """
+    對 inp_series.NetworkSeries 的欄位執行 detect_leaks (需要至少兩個時段)
+
+    INP 快照只有需水量等設計值，沒有壓力與流量；以 base_demand 的變化量代替壓力變化，
+    管線欄位 (長度、管徑、粗糙度) 不是漏水指標，因此 pipe_field 預設不判斷。
+
+    :param series: NetworkSeries
+    :param node_field: 節點欄位名稱，None 表示不判斷節點
+    :param pipe_field: 管線欄位名稱，None 表示不判斷管線
+    :return: LeakReport
+    """
+    node_values = series.node_values(node_field) if node_field else None
+    pipe_values = series.pipe_values(pipe_field) if pipe_field else None
+    report = detect_leaks(series.network, node_values, pipe_values, **kwargs)
+    report.params = dict(report.params, node_field=node_field, pipe_field=pipe_field)
+    return report
+
+
+def detect_demand_outliers(network, factor=DEFAULT_FACTOR):
+    """
+    單一快照時的替代分析：列出基本需水量超過 factor 倍平均值的節點
+
+    這是需水量的離群值，並非變化量，不能視為漏水判斷；
+    summary() 的 method 為 "demand_outlier"，params 內附說明，避免被誤讀為漏水結果。
+
+    :param network: network_model.Network
+    :param factor: 倍數
+    :return: LeakReport (只含節點)
+    """
+    values = np.where(network.node_listed, network.node_base_demand, np.nan)
+    mask, score = ratio_anomalies(values, factor)
+    return LeakReport(network, "demand_outlier", {
+        "factor": factor,
+        "field": "base_demand",
+        "note": "單一時段，無法計算變化量；列出的是基本需水量偏高的節點，並非漏水判斷",
+    }, node_mask=mask, node_score=score)
@@ -0,0 +1,456 @@
+"""
+將管網 (INP) 與 SHP 圖層切成 z/x/y 分級圖磚，讓地圖只需載入畫面內的圖磚
+
+每個縮放層級先把座標對齊到該層級的像素格 (tolerance_px 個像素)，並移除連續重複的點，
+所以低縮放層級的幾何會自動簡化；輸出格式：
+    - "png"：以 matplotlib Agg 繪製的 256×256 點陣圖磚
+    - "geojson"：每個圖磚一個 GeoJSON 檔 (WGS84)
+    - "mvt"：Mapbox Vector Tile (需要 mapbox_vector_tile)
+
+輸出目錄另有 metadata.json 記錄格式、縮放範圍與資料範圍，供 readinpmap.html 讀取。
+"""
+import functools
+import json
+import math
+import os
+
+import numpy as np
+
+from network_model import WGS84
+from parse_inp import TWD97_PROJ
+from spatial_index import _expand_ranges
+
+TILE_SIZE = 256
+MVT_EXTENT = 4096
+EARTH_RADIUS = 6378137.0
+WORLD_SIZE = 2 * math.pi * EARTH_RADIUS  # Web Mercator 全世界的寬度 (公尺)
+HALF_WORLD = WORLD_SIZE / 2
+MAX_LATITUDE = 85.0511287798
+
+# 圖層樣式：(顏色, 線寬或點大小)；與 parse_shp.plot_shapefiles 的配色一致
+STYLES = {
+    "pipes": ("blue", 1.0),
+    "nodes": ("red", 2.0),
+    "pipe": ("blue", 1.0),
+    "valve": ("red", 3.0),
+    "hydrant": ("green", 3.0),
+    "manhole": ("orange", 3.0),
+}
+DEFAULT_STYLE = ("gray", 1.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer(src, dst):
+    """第一次使用時才匯入 pyproj 並建立 Transformer"""
+    from pyproj import Transformer
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+
+class TileSource:
+    """
+    一個要切圖磚的圖層 (Web Mercator 公尺座標)
+
+    線圖層的第 i 條線為 xy[offsets[i]:offsets[i + 1]]；點圖層的 offsets 為 None。
+    """
+
+    def __init__(self, name, xy, ids, offsets=None, properties=None):
+        self.name = name
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.ids = np.asarray(ids, dtype=str)
+        self.offsets = None if offsets is None else np.asarray(offsets, dtype=np.int64)
+        self.properties = properties or {}  # 欄位名稱 -> 每個圖徵一個值的陣列
+        self.color, self.size = STYLES.get(name, DEFAULT_STYLE)
+
+    def __repr__(self):
+        kind = "lines" if self.is_line else "points"
+        return f"TileSource({self.name!r}, {kind}={len(self)})"
+
+    @property
+    def is_line(self):
+        return self.offsets is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def bounds(self):
+        """WGS84 範圍 (west, south, east, north)；沒有座標時為 None"""
+        xy = self.xy[np.isfinite(self.xy).all(axis=1)]
+        if len(xy) == 0:
+            return None
+        lng, lat = _transformer("EPSG:3857", "EPSG:4326").transform(xy[:, 0], xy[:, 1])
+        return float(np.min(lng)), float(np.min(lat)), float(np.max(lng)), float(np.max(lat))
+
+
+def to_mercator(lng, lat):
+    """WGS84 -> Web Mercator (EPSG:3857)，超出 Web Mercator 緯度範圍的點會被夾住"""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x, y = _transformer("EPSG:4326", "EPSG:3857").transform(np.asarray(lng, dtype=np.float64), lat, errcheck=False)
+    return np.column_stack((x, y))
+
+
+def _network_wgs84(network):
+    if network.crs == WGS84:
+        return network.node_xy, network.vertex_xy
+    to_wgs84 = _transformer(TWD97_PROJ, "EPSG:4326")
+
+    def convert(xy):
+        lng, lat = to_wgs84.transform(xy[:, 0], xy[:, 1], errcheck=False)
+        return np.column_stack((lng, lat))
+
+    return convert(network.node_xy), convert(network.vertex_xy)
+
+
+def network_sources(network):
+    """
+    由 network_model.Network 建立 "pipes" (線) 與 "nodes" (點) 兩個 TileSource
+
+    管線折線為起點節點 + 彎曲點 + 終點節點；沒有座標的點會被略過。
+    """
+    node_xy, vertex_xy = _network_wgs84(network)
+    node_m = to_mercator(node_xy[:, 0], node_xy[:, 1])
+    vertex_m = to_mercator(vertex_xy[:, 0], vertex_xy[:, 1])
+
+    counts = np.diff(network.vertex_offsets) + 2
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    line = np.empty((int(offsets[-1]), 2))
+    line[offsets[:-1]] = node_m[network.pipe_start]
+    line[offsets[1:] - 1] = node_m[network.pipe_end]
+    _, pos = _expand_ranges(offsets[:-1] + 1, offsets[1:] - 1)
+    line[pos] = vertex_m
+
+    # 移除沒有座標的點並重建 offsets
+    valid = np.isfinite(line).all(axis=1)
+    owner = np.repeat(np.arange(network.n_pipes), counts)[valid]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=network.n_pipes))))
+    pipes = TileSource("pipes", line[valid], network.pipe_ids, offsets,
+                       {"diameter": network.pipe_diameter, "length": network.pipe_length})
+    has_xy = np.isfinite(node_m).all(axis=1)
+    nodes = TileSource("nodes", node_m[has_xy], network.node_ids[has_xy],
+                       properties={"base_demand": network.node_base_demand[has_xy],
+                                   "elevation": network.node_elevation[has_xy]})
+    return [pipes, nodes]
+
+
+def shapefile_sources(shapefiles):
+    """
+    由 parse_shp.load_shapefiles 的結果或 LayerCache 建立 TileSource
+
+    線與面 (取外框) 圖層成為線圖層，點圖層成為點圖層；圖徵 ID 為列索引。
+    """
+    import shapely
+
+    from parse_shp import as_layer_cache
+
+    sources = []
+    for shp_name, gdf in as_layer_cache(shapefiles).items():
+        name = os.path.splitext(shp_name)[0]
+        parts, row = shapely.get_parts(np.asarray(gdf.geometry.values), return_index=True)
+        kind = shapely.get_type_id(parts)
+        polygons = kind == 3
+        parts[polygons] = shapely.get_exterior_ring(parts[polygons])
+        is_line = np.isin(kind, (1, 2, 3))
+        labels = gdf.index.astype(str).to_numpy()
+
+        if is_line.any():
+            coords, owner = shapely.get_coordinates(parts[is_line], return_index=True)
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=int(is_line.sum())))))
+            sources.append(TileSource(name, to_mercator(coords[:, 0], coords[:, 1]), labels[row[is_line]], offsets))
+        points = kind == 0
+        if points.any():
+            coords = shapely.get_coordinates(parts[points])
+            sources.append(TileSource(name if not is_line.any() else f"{name}_points",
+                                      to_mercator(coords[:, 0], coords[:, 1]), labels[row[points]]))
+    return sources
+
+
+def tile_bounds(z, x, y):
+    """圖磚的 Web Mercator 範圍 (minx, miny, maxx, maxy)"""
+    size = WORLD_SIZE / (1 << z)
+    return (x * size - HALF_WORLD, HALF_WORLD - (y + 1) * size,
+            (x + 1) * size - HALF_WORLD, HALF_WORLD - y * size)
+
+
+def _tile_range(minx, miny, maxx, maxy, z):
+    """bbox 覆蓋的圖磚範圍 (x0, y0, x1, y1)，含兩端"""
+    size = WORLD_SIZE / (1 << z)
+    last = (1 << z) - 1
+    x0 = np.clip(np.floor((minx + HALF_WORLD) / size), 0, last).astype(np.int64)
+    x1 = np.clip(np.floor((maxx + HALF_WORLD) / size), 0, last).astype(np.int64)
+    y0 = np.clip(np.floor((HALF_WORLD - maxy) / size), 0, last).astype(np.int64)
+    y1 = np.clip(np.floor((HALF_WORLD - miny) / size), 0, last).astype(np.int64)
+    return x0, y0, x1, y1
+
+
+def _assign_tiles(minx, miny, maxx, maxy, z):
+    """
+    把每個圖徵登記到 bbox 覆蓋的圖磚
+
+    :return: dict (x, y) -> 圖徵索引陣列
+    """
+    x0, y0, x1, y1 = _tile_range(minx, miny, maxx, maxy, z)
+    w, h = x1 - x0 + 1, y1 - y0 + 1
+    item, local = _expand_ranges(np.zeros(len(w), dtype=np.int64), w * h)
+    tx = x0[item] + local % w[item]
+    ty = y0[item] + local // w[item]
+    key = tx * (1 << z) + ty
+    order = np.argsort(key, kind="stable")
+    key, item = key[order], item[order]
+    keys, starts = np.unique(key, return_index=True)
+    ends = np.append(starts[1:], len(key))
+    n = 1 << z
+    return {(int(k) // n, int(k) % n): item[s:e] for k, s, e in zip(keys.tolist(), starts, ends)}
+
+
+class _SimplifiedLines:
+    """一個線圖層在某縮放層級簡化後的結果 (CSR)"""
+
+    def __init__(self, source, step):
+        xy = np.round(source.xy / step) * step
+        counts = np.diff(source.offsets)
+        owner = np.repeat(np.arange(len(counts)), counts)
+        # 保留每條線的第一個點，以及與前一點不同的點
+        keep = np.ones(len(xy), dtype=bool)
+        keep[1:] = (xy[1:] != xy[:-1]).any(axis=1) | (owner[1:] != owner[:-1])
+        xy, owner = xy[keep], owner[keep]
+        counts = np.bincount(owner, minlength=len(counts))
+        # 縮成一個點的線在此層級小於一個格子，直接略過
+        lines = counts >= 2
+        keep = lines[owner]
+        self.xy, self.owner = xy[keep], owner[keep]
+        self.feature = np.flatnonzero(lines)
+        counts = counts[lines]
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.vertices = len(xy)
+
+    def __len__(self):
+        return len(self.feature)
+
+    def bbox(self):
+        starts = self.offsets[:-1]
+        if len(starts) == 0:
+            empty = np.empty(0)
+            return empty, empty, empty, empty
+        return (np.minimum.reduceat(self.xy[:, 0], starts), np.minimum.reduceat(self.xy[:, 1], starts),
+                np.maximum.reduceat(self.xy[:, 0], starts), np.maximum.reduceat(self.xy[:, 1], starts))
+
+    def line(self, i):
+        return self.xy[self.offsets[i]:self.offsets[i + 1]]
+
+    def segments(self, lines):
+        """lines 的所有線段，去除重複 (低縮放層級很多管線會落在同樣的像素上)"""
+        if len(lines) == 0:
+            return np.empty((0, 2, 2))
+        _, pos = _expand_ranges(self.offsets[lines], self.offsets[lines + 1] - 1)
+        seg = np.stack((self.xy[pos], self.xy[pos + 1]), axis=1)
+        # 方向一致化後去除重複
+        flip = (seg[:, 0, 0] > seg[:, 1, 0]) | ((seg[:, 0, 0] == seg[:, 1, 0]) & (seg[:, 0, 1] > seg[:, 1, 1]))
+        seg[flip] = seg[flip, ::-1]
+        return np.unique(seg.reshape(-1, 4), axis=0).reshape(-1, 2, 2)
+
+
+class _PngRenderer:
+    """重複使用同一個 matplotlib Figure (Agg，不經過 pyplot) 繪製每個圖磚"""
+
+    def __init__(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(1, 1), dpi=TILE_SIZE)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_axes((0, 0, 1, 1))
+
+    def render(self, path, bounds, layers):
+        from matplotlib.collections import LineCollection
+
+        ax = self.ax
+        ax.clear()
+        ax.set_axis_off()
+        for source, kind, data in layers:
+            # 線寬 / 點大小以 point 為單位；dpi=256 時 1 px = 72 / 256 pt
+            px = 72 / TILE_SIZE
+            if kind == "lines":
+                ax.add_collection(LineCollection(data, colors=source.color, linewidths=source.size * px * 2))
+            else:
+                points, _ = data
+                ax.scatter(points[:, 0], points[:, 1], s=(source.size * px * 2) ** 2, c=source.color, linewidths=0)
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
+        self.figure.savefig(path, dpi=TILE_SIZE, transparent=True)
+
+
+def _geojson_coords(xy, digits):
+    lng, lat = _transformer("EPSG:3857", "EPSG:4326").transform(xy[:, 0], xy[:, 1])
+    return np.round(np.column_stack((lng, lat)), digits).tolist()
+
+
+def _feature_properties(source, i):
+    props = {"layer": source.name, "id": str(source.ids[i])}
+    for key, values in source.properties.items():
+        props[key] = round(float(values[i]), 3)
+    return props
+
+
+def _write_geojson(path, layers, detailed, digits):
+    features = []
+    for source, kind, data in layers:
+        if kind == "lines" and detailed:
+            simplified, lines = data
+            for i in lines.tolist():
+                features.append({"type": "Feature",
+                                 "properties": _feature_properties(source, simplified.feature[i]),
+                                 "geometry": {"type": "LineString",
+                                              "coordinates": _geojson_coords(simplified.line(i), digits)}})
+        elif kind == "lines":
+            # 低縮放層級：整個圖層合併成一個 MultiLineString (只保留不重複的線段)
+            coords = _geojson_coords(data.reshape(-1, 2), digits)
+            features.append({"type": "Feature", "properties": {"layer": source.name},
+                             "geometry": {"type": "MultiLineString",
+                                          "coordinates": [coords[k:k + 2] for k in range(0, len(coords), 2)]}})
+        else:
+            points, idx = data
+            coords = _geojson_coords(points, digits)
+            for c, i in zip(coords, idx.tolist()):
+                features.append({"type": "Feature", "properties": _feature_properties(source, i),
+                                 "geometry": {"type": "Point", "coordinates": c}})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"),
+                  ensure_ascii=False)
+
+
+def _write_mvt(path, bounds, layers, detailed):
+    try:
+        import mapbox_vector_tile
+        import shapely
+    except ImportError as e:
+        raise ImportError("mvt 輸出需要安裝 mapbox_vector_tile") from e
+
+    mvt_layers = []
+    for source, kind, data in layers:
+        features = []
+        if kind == "lines" and detailed:
+            simplified, lines = data
+            for i in lines.tolist():
+                features.append({"geometry": shapely.linestrings(simplified.line(i)),
+                                 "properties": _feature_properties(source, simplified.feature[i])})
+        elif kind == "lines":
+            features.append({"geometry": shapely.multilinestrings(shapely.linestrings(data)),
+                             "properties": {"layer": source.name}})
+        else:
+            points, idx = data
+            for p, i in zip(shapely.points(points), idx.tolist()):
+                features.append({"geometry": p, "properties": _feature_properties(source, i)})
+        mvt_layers.append({"name": source.name, "features": features})
+    data = mapbox_vector_tile.encode(mvt_layers, default_options={"quantize_bounds": bounds,
+                                                                   "extents": MVT_EXTENT})
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_tiles(sources, output_dir="tiles", min_zoom=12, max_zoom=18, fmt="png", tolerance_px=1.0,
+                   detail_zoom=16, point_min_zoom=16, buffer_px=4):
+    """
+    產生 z/x/y 分級圖磚
+
+    每個縮放層級：座標對齊到 tolerance_px 個像素的格子並去除連續重複點 (簡化)，
+    依 bbox 把圖徵分配到圖磚後逐一寫出；沒有資料的圖磚不會產生檔案。
+
+    :param sources: TileSource 列表 (network_sources / shapefile_sources 的結果)
+    :param output_dir: 輸出目錄，圖磚路徑為 {z}/{x}/{y}.{副檔名}
+    :param min_zoom: 最小縮放層級
+    :param max_zoom: 最大縮放層級 (地圖放大超過時由前端放大此層級的圖磚)
+    :param fmt: "png"、"geojson" 或 "mvt"
+    :param tolerance_px: 簡化的格子大小 (像素)
+    :param detail_zoom: 向量圖磚自此層級起輸出個別圖徵 (含 ID 與屬性)，之前每個圖層合併成一個圖徵
+    :param point_min_zoom: 點圖層自此層級起才輸出
+    :param buffer_px: 圖徵 bbox 外擴的像素數，避免線寬在圖磚邊界被切掉
+    :return: 每個縮放層級的統計 [{"zoom", "tiles", "features", "vertices"}, ...]
+    """
+    if fmt not in ("png", "geojson", "mvt"):
+        raise ValueError(f"未知的格式: {fmt}")
+    ext = {"png": "png", "geojson": "geojson", "mvt": "pbf"}[fmt]
+    renderer = _PngRenderer() if fmt == "png" else None
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats = []
+    for z in range(min_zoom, max_zoom + 1):
+        pixel = WORLD_SIZE / (1 << z) / TILE_SIZE
+        buffer = buffer_px * pixel
+        digits = max(0, min(7, math.ceil(-math.log10(pixel / 111_320)) + 1))  # 約 0.1 像素的小數位數
+        tiles = {}  # (x, y) -> [(source, kind, 圖徵索引)]
+        n_features = n_vertices = 0
+        for source in sources:
+            if source.is_line:
+                simplified = _SimplifiedLines(source, pixel * tolerance_px)
+                if len(simplified) == 0:
+                    continue
+                minx, miny, maxx, maxy = simplified.bbox()
+                data = simplified
+                n_features += len(simplified)
+                n_vertices += simplified.vertices
+            else:
+                if z < point_min_zoom or len(source) == 0:
+                    continue
+                minx, miny = maxx, maxy = source.xy[:, 0], source.xy[:, 1]
+                data = source
+                n_features += len(source)
+                n_vertices += len(source)
+            for key, idx in _assign_tiles(minx - buffer, miny - buffer, maxx + buffer, maxy + buffer, z).items():
+                tiles.setdefault(key, []).append((source, data, idx))
+
+        detailed = z >= detail_zoom
+        for (x, y), entries in tiles.items():
+            bounds = tile_bounds(z, x, y)
+            layers = []
+            for source, data, idx in entries:
+                if not source.is_line:
+                    points = source.xy[idx]
+                    if fmt == "png":
+                        # 同一像素只畫一個點
+                        _, first = np.unique(np.floor(points / pixel), axis=0, return_index=True)
+                        points, idx = points[first], idx[first]
+                    layers.append((source, "points", (points, idx)))
+                elif fmt != "png" and detailed:
+                    layers.append((source, "lines", (data, idx)))
+                else:
+                    layers.append((source, "lines", data.segments(idx)))
+
+            tile_dir = os.path.join(output_dir, str(z), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            path = os.path.join(tile_dir, f"{y}.{ext}")
+            if fmt == "png":
+                renderer.render(path, bounds, layers)
+            elif fmt == "geojson":
+                _write_geojson(path, layers, detailed, digits)
+            else:
+                _write_mvt(path, bounds, layers, detailed)
+        stats.append({"zoom": z, "tiles": len(tiles), "features": n_features, "vertices": n_vertices})
+        print(f"[INFO] zoom {z}: {len(tiles)} tiles, {n_features} features, {n_vertices} vertices")
+
+    bounds = [b for b in (s.bounds for s in sources) if b is not None]
+    bounds = [min(b[0] for b in bounds), min(b[1] for b in bounds),
+              max(b[2] for b in bounds), max(b[3] for b in bounds)] if bounds else None
+    metadata = {
+        "format": fmt,
+        "tiles": f"{{z}}/{{x}}/{{y}}.{ext}",
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "detail_zoom": detail_zoom,
+        "point_min_zoom": point_min_zoom,
+        "bounds": bounds,
+        "layers": [{"name": s.name, "type": "line" if s.is_line else "point", "color": s.color,
+                    "size": s.size} for s in sources],
+        "stats": stats,
+    }
+    with open(os.path.join(output_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    print(f"[INFO] tiles saved to {output_dir}")
+    return stats
+
+
+if __name__ == "__main__":
+    from inp_cache import cached_parse_inp_network
+
+    file_path = "0401-13-01-12.inp"  # 修改為你的 INP 檔案路徑
+    network = cached_parse_inp_network(file_path)
+    generate_tiles(network_sources(network), "tiles", fmt="png")
@@ -0,0 +1,439 @@
+import heapq
+
+import numpy as np
+
+from inp_tokenizer import iter_section
+from spatial_index import _expand_ranges
+
+_csgraph = None  # None: 尚未匯入；False: 沒有安裝 scipy
+
+
+def _scipy_csgraph():
+    """
+    scipy 為選用：有安裝時以 csgraph (C 實作) 計算連通元件與最短路徑
+
+    第一次使用時才匯入 (scipy 匯入需數百毫秒)，沒有安裝時回傳 None
+    """
+    global _csgraph
+    if _csgraph is None:
+        try:
+            from scipy.sparse import csgraph
+        except ImportError:
+            csgraph = False
+        _csgraph = csgraph
+    return _csgraph or None
+
+
+def read_valves(source):
+    """
+    讀取 INP 的 [VALVES] 區段
+
+    :param source: INP 檔案路徑或已開啟的文字檔案物件
+    :return: inp_tokenizer.Valve 紀錄列表
+    """
+    return list(iter_section(source, "VALVES"))
+
+
+def _union_find(n, u, v):
+    """
+    以向量化的 hooking + pointer jumping 計算連通元件
+
+    :param n: 頂點數
+    :param u: 邊的一端
+    :param v: 邊的另一端
+    :return: 每個頂點的代表頂點 (同一元件中最小的頂點索引)
+    """
+    parent = np.arange(n, dtype=np.int64)
+    while True:
+        pu, pv = parent[u], parent[v]
+        lo, hi = np.minimum(pu, pv), np.maximum(pu, pv)
+        diff = lo != hi
+        if not diff.any():
+            return parent
+        np.minimum.at(parent, hi[diff], lo[diff])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def _relabel(roots):
+    """把代表頂點轉成 0..k-1 的連續元件編號"""
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels.astype(np.int64)
+
+
+class NetworkGraph:
+    """
+    管網的 CSR 鄰接結構 (無向圖)，由 Network.pipe_start / pipe_end 建立一次後重複使用
+
+    節點 i 的鄰居為 indices[indptr[i]:indptr[i + 1]]，對應的管線索引為 edge 的同一段，
+    所以 BFS、連通元件與閥門分區都能以 NumPy 向量化運算完成。
+    """
+
+    def __init__(self, network):
+        self.network = network
+        n, m = network.n_nodes, network.n_pipes
+        start = np.asarray(network.pipe_start, dtype=np.int64)
+        end = np.asarray(network.pipe_end, dtype=np.int64)
+        # 每條管線存兩個方向
+        src = np.concatenate((start, end))
+        dst = np.concatenate((end, start))
+        pipe = np.concatenate((np.arange(m), np.arange(m)))
+        order = np.argsort(src, kind="stable")
+        self.indices = dst[order]
+        self.edge = pipe[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self.weight = np.asarray(network.pipe_length, dtype=np.float64)
+        self._matrix = None
+
+    def __repr__(self):
+        return f"NetworkGraph(nodes={self.n_nodes}, pipes={self.n_pipes})"
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_pipes(self):
+        return len(self.weight)
+
+    @property
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def _node(self, node):
+        """node 可以是節點 ID 或索引"""
+        return self.network.node_index[node] if isinstance(node, str) else int(node)
+
+    def _nodes(self, nodes):
+        return np.fromiter((self._node(n) for n in nodes), dtype=np.int64)
+
+    def neighbors(self, node):
+        """
+        :return: (鄰居節點索引, 連接的管線索引)
+        """
+        i = self._node(node)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.indices[lo:hi], self.edge[lo:hi]
+
+    def bfs(self, source, max_depth=None, blocked=None):
+        """
+        以整層 frontier 向量化的廣度優先搜尋
+
+        :param source: 起點節點 ID / 索引，或其列表
+        :param max_depth: 最多擴展幾層，None 表示不限
+        :param blocked: 會被走到但不再往外擴展的節點 (例如閥門節點) 之 ID / 索引列表
+        :return: (依走訪順序的節點索引, 每個節點的層數；未走到為 -1)
+        """
+        single = isinstance(source, (str, int, np.integer))
+        if single and max_depth is None and blocked is None and _scipy_csgraph() is not None:
+            return self._bfs_scipy(self._node(source))
+        frontier = np.unique(self._nodes([source] if single else source))
+        depth = np.full(self.n_nodes, -1, dtype=np.int64)
+        depth[frontier] = 0
+        stop = np.zeros(self.n_nodes, dtype=bool)
+        if blocked is not None:
+            stop[self._nodes(blocked)] = True
+        order = [frontier]
+        level = 0
+        while len(frontier) and (max_depth is None or level < max_depth):
+            frontier = frontier[~stop[frontier]]
+            _, pos = _expand_ranges(self.indptr[frontier], self.indptr[frontier + 1])
+            nbr = self.indices[pos]
+            nbr = np.unique(nbr[depth[nbr] < 0])
+            level += 1
+            depth[nbr] = level
+            order.append(nbr)
+            frontier = nbr
+        return np.concatenate(order), depth
+
+    def _bfs_scipy(self, source):
+        """
+        以 csgraph.breadth_first_order 走訪，層數由 BFS 樹以 pointer jumping 求得
+        (管網直徑很長時比逐層擴展快得多)
+        """
+        order, pred = _scipy_csgraph().breadth_first_order(self.matrix, source, directed=False)
+        depth = np.full(self.n_nodes, -1, dtype=np.int64)
+        parent = np.arange(self.n_nodes)
+        parent[order[1:]] = pred[order[1:]]
+        dist = (parent != np.arange(self.n_nodes)).astype(np.int64)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            dist += dist[parent] * (grand != parent)
+            parent = grand
+        depth[order] = dist[order]
+        return order, depth
+
+    def dfs(self, source):
+        """
+        深度優先搜尋 (有 scipy 時使用 csgraph.depth_first_order)
+
+        :return: 依走訪順序的節點索引
+        """
+        i = self._node(source)
+        csgraph = _scipy_csgraph()
+        if csgraph is not None:
+            return csgraph.depth_first_order(self.matrix, i, directed=False, return_predecessors=False)
+        indptr, indices = self.indptr.tolist(), self.indices.tolist()
+        seen = np.zeros(self.n_nodes, dtype=bool)
+        order, stack = [], [i]
+        while stack:
+            u = stack.pop()
+            if seen[u]:
+                continue
+            seen[u] = True
+            order.append(u)
+            # 反向壓入，讓鄰居依 CSR 順序被走訪
+            stack.extend(w for w in reversed(indices[indptr[u]:indptr[u + 1]]) if not seen[w])
+        return np.asarray(order, dtype=np.int64)
+
+    def connected_components(self):
+        """
+        :return: (元件數, 每個節點的元件編號)
+        """
+        csgraph = _scipy_csgraph()
+        if csgraph is not None:
+            n, labels = csgraph.connected_components(self.matrix, directed=False)
+            return int(n), labels.astype(np.int64)
+        labels = _relabel(_union_find(self.n_nodes, self.network.pipe_start, self.network.pipe_end))
+        return int(labels.max()) + 1 if len(labels) else 0, labels
+
+    @property
+    def matrix(self):
+        """
+        以管線長度為權重的 scipy CSR 矩陣 (需要 scipy；第一次使用時建立)
+
+        平行管線只保留最短的一條；長度為 0 的管線以極小值代替，避免被視為沒有連接。
+        """
+        if self._matrix is None:
+            if _scipy_csgraph() is None:
+                raise ImportError("需要安裝 scipy")
+            from scipy.sparse import csr_matrix
+
+            n = self.n_nodes
+            src = np.repeat(np.arange(n), self.degree)
+            w = np.maximum(self.weight[self.edge], np.finfo(np.float64).tiny)
+            order = np.lexsort((w, self.indices, src))
+            src, dst, w = src[order], self.indices[order], w[order]
+            first = np.ones(len(src), dtype=bool)
+            first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+            self._matrix = csr_matrix((w[first], (src[first], dst[first])), shape=(n, n))
+        return self._matrix
+
+    def _dijkstra(self, source, target=None):
+        """heapq 版 Dijkstra (沒有 scipy 時使用)；回傳 (距離, 前一個節點)"""
+        n = self.n_nodes
+        dist = np.full(n, np.inf)
+        pred = np.full(n, -9999, dtype=np.int64)  # 與 scipy 的 predecessors 相同的「無」值
+        indptr, indices = self.indptr.tolist(), self.indices.tolist()
+        weight = self.weight[self.edge].tolist()
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        done = set()
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            dist[u] = d
+            if u == target:
+                break
+            for k in range(indptr[u], indptr[u + 1]):
+                w, nd = indices[k], d + weight[k]
+                if w not in done and nd < best.get(w, np.inf):
+                    best[w] = nd
+                    pred[w] = u
+                    heapq.heappush(heap, (nd, w))
+        return dist, pred
+
+    def distances(self, source, limit=np.inf):
+        """
+        由 source 沿管線長度的最短距離
+
+        :param source: 起點節點 ID / 索引
+        :param limit: 超過此距離便不再搜尋
+        :return: (距離陣列，走不到為 inf, 前一個節點索引陣列，-9999 表示沒有)
+        """
+        i = self._node(source)
+        csgraph = _scipy_csgraph()
+        if csgraph is not None:
+            dist, pred = csgraph.dijkstra(self.matrix, directed=False, indices=i,
+                                          return_predecessors=True, limit=limit)
+            return dist, pred
+        dist, pred = self._dijkstra(i)
+        pred[dist > limit] = -9999
+        dist[dist > limit] = np.inf
+        return dist, pred
+
+    def shortest_path(self, source, target):
+        """
+        以管線長度為權重的最短路徑
+
+        :return: (節點 ID 列表, 管線 ID 列表, 總長度)；走不到時回傳 ([], [], inf)
+        """
+        i, j = self._node(source), self._node(target)
+        csgraph = _scipy_csgraph()
+        if csgraph is not None:
+            dist, pred = csgraph.dijkstra(self.matrix, directed=False, indices=i, return_predecessors=True)
+        else:
+            dist, pred = self._dijkstra(i, j)
+        if not np.isfinite(dist[j]):
+            return [], [], np.inf
+        path = [j]
+        while path[-1] != i:
+            path.append(int(pred[path[-1]]))
+        path.reverse()
+
+        pipes = []
+        for u, w in zip(path[:-1], path[1:]):
+            nbr, edges = self.neighbors(u)
+            cand = edges[nbr == w]
+            pipes.append(int(cand[np.argmin(self.weight[cand])]))  # 平行管線取最短的一條
+        net = self.network
+        return net.node_ids[path].tolist(), net.pipe_ids[pipes].tolist(), float(dist[j])
+
+    def isolation_segments(self, valves=(), valve_nodes=()):
+        """
+        計算閥門分區：關閉邊界上的閥門即可把分區內的管線與其餘管網隔離
+
+        :param valves: INP 的閥門 link (inp_tokenizer.Valve，或 (閥門 ID, 起點, 終點))；
+                       閥門不是管線，所以它兩端的節點就是相鄰分區的邊界
+        :param valve_nodes: 位於節點上的閥門 (例如 spatial_index.join_nodes_to_layer
+                            對應到的 SHP 閥門)，管線不會穿過這些節點連通
+        :return: IsolationSegments
+        """
+        return IsolationSegments(self, valves, valve_nodes)
+
+
+class IsolationSegments:
+    """
+    閥門分區的結果
+
+    pipe_segment[i] 為第 i 條管線所屬的分區編號；每個分區的邊界閥門存於 valves[s]，
+    valve_segments 則記錄每個閥門兩側的分區 (-1 代表管網外部)。
+    """
+
+    def __init__(self, graph, valves=(), valve_nodes=()):
+        net = graph.network
+        self.graph = graph
+        n, m = net.n_nodes, net.n_pipes
+        start = np.asarray(net.pipe_start, dtype=np.int64)
+        end = np.asarray(net.pipe_end, dtype=np.int64)
+
+        valve_nodes = [v for v in valve_nodes if not isinstance(v, str) or v in net.node_index]
+        is_valve_node = np.zeros(n, dtype=bool)
+        if valve_nodes:
+            is_valve_node[graph._nodes(valve_nodes)] = True
+
+        # 管線 (0..m-1) 與非閥門節點 (m..m+n-1) 組成的二部圖：兩條管線共用一個非閥門節點才連通
+        pipe = np.concatenate((np.arange(m), np.arange(m)))
+        node = np.concatenate((start, end))
+        link = ~is_valve_node[node]
+        roots = _union_find(m + n, pipe[link], m + node[link])
+        self.pipe_segment = _relabel(roots[:m])
+        self.n_segments = int(self.pipe_segment.max()) + 1 if m else 0
+
+        order = np.argsort(self.pipe_segment, kind="stable")
+        self._pipes = order
+        self._offsets = np.zeros(self.n_segments + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.pipe_segment, minlength=self.n_segments), out=self._offsets[1:])
+
+        # (節點, 分區) 配對：節點所接的管線屬於哪些分區
+        k = max(self.n_segments, 1)
+        pair = np.sort(node * k + np.concatenate((self.pipe_segment, self.pipe_segment)))
+        pair = pair[np.concatenate(([True], pair[1:] != pair[:-1]))] if len(pair) else pair
+        self._node_segment = pair % k
+        self._node_offsets = np.searchsorted(pair // k, np.arange(n + 1))
+
+        # 閥門 -> 相鄰的分區；-1 代表閥門另一端不在管網中 (外部)
+        self.valve_segments = {}
+        for v in np.flatnonzero(is_valve_node).tolist():
+            self.valve_segments[str(net.node_ids[v])] = set(self._segments_of_node(v).tolist())
+        for valve in valves:
+            valve_id, a, b = valve[:3]
+            adjacent = self.valve_segments.setdefault(str(valve_id), set())
+            for end_id in (a, b):
+                i = net.node_index.get(end_id)
+                if i is None:
+                    adjacent.add(-1)
+                else:
+                    adjacent.update(self._segments_of_node(i).tolist())
+        boundary = [[] for _ in range(self.n_segments)]
+        for valve_id, adjacent in self.valve_segments.items():
+            for s in adjacent:
+                if s >= 0:
+                    boundary[s].append(valve_id)
+        self.valves = [sorted(b) for b in boundary]
+
+    def __repr__(self):
+        return f"IsolationSegments(segments={self.n_segments})"
+
+    def __len__(self):
+        return self.n_segments
+
+    def _segments_of_node(self, i):
+        return self._node_segment[self._node_offsets[i]:self._node_offsets[i + 1]]
+
+    def pipes(self, segment):
+        """分區內的管線索引"""
+        return self._pipes[self._offsets[segment]:self._offsets[segment + 1]]
+
+    def segment_of_pipe(self, pipe_id):
+        return int(self.pipe_segment[self.graph.network.pipe_index[pipe_id]])
+
+    def segments_of_node(self, node_id):
+        """節點所在的分區 (閥門節點會同時屬於多個分區)"""
+        return self._segments_of_node(self.graph.network.node_index[node_id]).tolist()
+
+    def describe(self, segment):
+        net = self.graph.network
+        pipes = self.pipes(segment)
+        return {
+            "segment": int(segment),
+            "pipes": len(pipes),
+            "length": round(float(net.pipe_length[pipes].sum()), 3),
+            "valves": self.valves[segment],
+            "isolatable": bool(self.valves[segment]),
+        }
+
+    def group(self, pipe_ids=(), node_ids=()):
+        """
+        將可能漏水的管線 / 節點歸到需要關閉的最少分區
+
+        :param pipe_ids: 可能漏水的管線 ID
+        :param node_ids: 可能漏水的節點 ID (節點所接的管線所在的分區都需要關閉)
+        :return: dict，segments 為依候選數排序的分區列表；valves_to_close 為隔離所有分區
+                 需要關閉的閥門 (兩側分區都在列表中的閥門不必關閉)
+        """
+        net = self.graph.network
+        members = {}
+        for pipe_id in pipe_ids:
+            s = self.segment_of_pipe(pipe_id)
+            members.setdefault(s, {"pipes": [], "nodes": []})["pipes"].append(pipe_id)
+        for node_id in node_ids:
+            for s in self.segments_of_node(node_id):
+                members.setdefault(s, {"pipes": [], "nodes": []})["nodes"].append(node_id)
+
+        selected = set(members)
+        to_close = sorted({v for s in selected for v in self.valves[s]
+                           if not self.valve_segments[v] <= selected})
+
+        segments = [dict(self.describe(s), candidate_pipes=m["pipes"], candidate_nodes=m["nodes"])
+                    for s, m in members.items()]
+        segments.sort(key=lambda d: (-(len(d["candidate_pipes"]) + len(d["candidate_nodes"])), d["segment"]))
+        return {
+            "segments": segments,
+            "valves_to_close": to_close,
+            "isolated_pipes": int(sum(d["pipes"] for d in segments)),
+            "isolated_length": round(float(sum(d["length"] for d in segments)), 3),
+            "network_pipes": int(net.n_pipes),
+        }
+
+    def group_report(self, report):
+        """對 leak_engine.LeakReport 標記的節點 / 管線執行 group()"""
+        return self.group(report.pipe_ids, report.node_ids)
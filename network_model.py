@@ -0,0 +1,224 @@
+import numpy as np
+
+WGS84 = "EPSG:4326"
+TWD97 = "TWD97"
+
+
+class Network:
+    """
+    欄式 (struct-of-arrays) 管網模型
+
+    節點 ID 會被轉成整數索引，管線起迄點以 int32 索引陣列表示，
+    所有彎曲點存成一個扁平的座標陣列，並以 vertex_offsets (CSR) 切分給各管線：
+    第 i 條管線的彎曲點為 vertex_xy[vertex_offsets[i]:vertex_offsets[i + 1]]。
+
+    座標欄位為 (x, y)；WGS84 時 x 為經度 (lng)、y 為緯度 (lat)，無座標的節點為 NaN。
+    """
+
+    # 存檔 / 快取時需要保存的陣列欄位
+    ARRAY_FIELDS = (
+        "node_ids", "node_xy", "node_listed", "node_elevation", "node_base_demand", "node_pattern",
+        "pipe_ids", "pipe_start", "pipe_end", "pipe_length", "pipe_diameter", "pipe_roughness",
+        "vertex_offsets", "vertex_xy",
+    )
+
+    def __init__(self, node_ids, node_xy, node_listed, node_elevation, node_base_demand, node_pattern,
+                 pipe_ids, pipe_start, pipe_end, pipe_length, pipe_diameter, pipe_roughness,
+                 vertex_offsets, vertex_xy, crs=WGS84):
+        self.node_ids = node_ids
+        self.node_xy = node_xy
+        self.node_listed = node_listed  # 出現在 JUNCTIONS 或有效 COORDINATES 中的節點
+        self.node_elevation = node_elevation
+        self.node_base_demand = node_base_demand
+        self.node_pattern = node_pattern  # 空字串代表沒有 pattern
+        self.pipe_ids = pipe_ids
+        self.pipe_start = pipe_start
+        self.pipe_end = pipe_end
+        self.pipe_length = pipe_length
+        self.pipe_diameter = pipe_diameter
+        self.pipe_roughness = pipe_roughness
+        self.vertex_offsets = vertex_offsets
+        self.vertex_xy = vertex_xy
+        self.crs = crs
+        self._node_index = None
+        self._pipe_index = None
+
+    def __repr__(self):
+        return (f"Network(nodes={self.n_nodes}, pipes={self.n_pipes}, "
+                f"vertices={self.n_vertices}, crs={self.crs!r})")
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_pipes(self):
+        return len(self.pipe_ids)
+
+    @property
+    def n_vertices(self):
+        return len(self.vertex_xy)
+
+    @property
+    def node_index(self):
+        """節點 ID -> 索引 (第一次使用時建立)"""
+        if self._node_index is None:
+            self._node_index = {node_id: i for i, node_id in enumerate(self.node_ids.tolist())}
+        return self._node_index
+
+    @property
+    def pipe_index(self):
+        """管線 ID -> 索引 (第一次使用時建立)"""
+        if self._pipe_index is None:
+            self._pipe_index = {pipe_id: i for i, pipe_id in enumerate(self.pipe_ids.tolist())}
+        return self._pipe_index
+
+    def pipe_vertices(self, i):
+        """回傳第 i 條管線的彎曲點座標 (view，不複製)"""
+        return self.vertex_xy[self.vertex_offsets[i]:self.vertex_offsets[i + 1]]
+
+    def _point_dict(self, x, y):
+        if self.crs == WGS84:
+            return {"lat": y, "lng": x}
+        return {"x": x, "y": y}
+
+    def iter_nodes(self):
+        """
+        逐一產出 (節點 ID, 節點 dict)，格式與 parse_inp 的 "nodes" 相同
+
+        :return: 產生 (node_id, dict) 的 generator
+        """
+        point_key = "latlng" if self.crs == WGS84 else "xy"
+        listed = np.flatnonzero(self.node_listed)
+        node_ids = self.node_ids[listed].tolist()
+        xy = self.node_xy[listed].tolist()
+        elevation = self.node_elevation[listed].tolist()
+        base_demand = self.node_base_demand[listed].tolist()
+        pattern = self.node_pattern[listed].tolist()
+        for k, node_id in enumerate(node_ids):
+            x, y = xy[k]
+            yield node_id, {
+                point_key: None if x != x else self._point_dict(x, y),  # NaN 代表沒有座標
+                "elevation": elevation[k],
+                "base_demand": base_demand[k],
+                "pattern": pattern[k] or None,
+            }
+
+    def iter_pipes(self):
+        """
+        逐一產出 (管線 ID, 管線 dict)，格式與 parse_inp 的 "pipes" 相同
+
+        :return: 產生 (pipe_id, dict) 的 generator
+        """
+        node_ids = self.node_ids.tolist()
+        start = self.pipe_start.tolist()
+        end = self.pipe_end.tolist()
+        length = self.pipe_length.tolist()
+        diameter = self.pipe_diameter.tolist()
+        roughness = self.pipe_roughness.tolist()
+        offsets = self.vertex_offsets.tolist()
+        for i, pipe_id in enumerate(self.pipe_ids.tolist()):
+            path = self.vertex_xy[offsets[i]:offsets[i + 1]].tolist()
+            yield pipe_id, {
+                "start": node_ids[start[i]],
+                "end": node_ids[end[i]],
+                "length": length[i],
+                "diameter": diameter[i],
+                "roughness": roughness[i],
+                "path": [self._point_dict(x, y) for x, y in path],
+            }
+
+    def to_dict(self):
+        """
+        轉回 parse_inp 原本的巢狀 dict 格式 (供 save_to_json、leak_assistant 使用)
+
+        :return: {"nodes": {...}, "pipes": {...}}
+        """
+        return {"nodes": dict(self.iter_nodes()), "pipes": dict(self.iter_pipes())}
+
+    def to_arrays(self):
+        """回傳 {欄位名稱: ndarray}，可直接交給 np.savez 等函式"""
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays, crs=WGS84):
+        """由 to_arrays() 的結果重建 Network"""
+        return cls(**{name: arrays[name] for name in cls.ARRAY_FIELDS}, crs=crs)
+
+
+def build_network(coord_ids, coord_xy, coord_valid, junctions, pipes, vertex_ids, vertex_xy, vertex_valid,
+                  crs=WGS84):
+    """
+    由 tokenizer 收集到的原始資料組成 Network
+
+    :param coord_ids: [COORDINATES] 節點 ID 列表
+    :param coord_xy: (N, 2) 節點座標 (已轉換)
+    :param coord_valid: 節點座標是否有效
+    :param junctions: [JUNCTIONS] 紀錄列表 (inp_tokenizer.Junction)
+    :param pipes: [PIPES] 紀錄列表 (inp_tokenizer.Pipe)
+    :param vertex_ids: [VERTICES] 所屬管線 ID 列表
+    :param vertex_xy: (V, 2) 彎曲點座標 (已轉換)
+    :param vertex_valid: 彎曲點座標是否有效
+    :param crs: 座標系統，WGS84 或 TWD97
+    :return: Network
+    """
+    index = {}
+
+    def intern(node_id):
+        i = index.get(node_id)
+        if i is None:
+            i = index[node_id] = len(index)
+        return i
+
+    junction_idx = [intern(j.id) for j in junctions]
+    coord_idx = [intern(node_id) for node_id in coord_ids]
+    n_pipes = len(pipes)
+    pipe_start = np.fromiter((intern(p.start) for p in pipes), dtype=np.int32, count=n_pipes)
+    pipe_end = np.fromiter((intern(p.end) for p in pipes), dtype=np.int32, count=n_pipes)
+    n_nodes = len(index)
+
+    node_xy = np.full((n_nodes, 2), np.nan)
+    node_listed = np.zeros(n_nodes, dtype=bool)
+    coord_valid = np.asarray(coord_valid, dtype=bool)
+    coord_idx = np.asarray(coord_idx, dtype=np.int64)[coord_valid]
+    node_xy[coord_idx] = np.asarray(coord_xy).reshape(-1, 2)[coord_valid]
+    node_listed[coord_idx] = True
+
+    node_elevation = np.zeros(n_nodes)
+    node_base_demand = np.zeros(n_nodes)
+    node_pattern = np.full(n_nodes, "", dtype=object)
+    if junctions:
+        junction_idx = np.asarray(junction_idx, dtype=np.int64)
+        node_listed[junction_idx] = True
+        node_elevation[junction_idx] = [j.elevation for j in junctions]
+        node_base_demand[junction_idx] = [j.base_demand for j in junctions]
+        node_pattern[junction_idx] = [j.pattern or "" for j in junctions]
+
+    pipe_index = {p.id: i for i, p in enumerate(pipes)}
+
+    # 彎曲點依所屬管線穩定排序後組成 CSR
+    owner = np.fromiter((pipe_index.get(pid, -1) for pid in vertex_ids), dtype=np.int64, count=len(vertex_ids))
+    keep = np.asarray(vertex_valid, dtype=bool) & (owner >= 0)
+    owner = owner[keep]
+    order = np.argsort(owner, kind="stable")
+    vertex_xy = np.asarray(vertex_xy, dtype=np.float64).reshape(-1, 2)[keep][order]
+    vertex_offsets = np.zeros(n_pipes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=n_pipes), out=vertex_offsets[1:])
+
+    return Network(
+        node_ids=np.array(list(index), dtype=str),
+        node_xy=node_xy,
+        node_listed=node_listed,
+        node_elevation=node_elevation,
+        node_base_demand=node_base_demand,
+        node_pattern=node_pattern.astype(str),
+        pipe_ids=np.array([p.id for p in pipes], dtype=str),
+        pipe_start=pipe_start,
+        pipe_end=pipe_end,
+        pipe_length=np.array([p.length for p in pipes], dtype=np.float64),
+        pipe_diameter=np.array([p.diameter for p in pipes], dtype=np.float64),
+        pipe_roughness=np.array([p.roughness for p in pipes], dtype=np.float64),
+        vertex_offsets=vertex_offsets,
+        vertex_xy=vertex_xy,
+        crs=crs,
+    )
@@ -1,13 +1,34 @@
+import functools
 import json
-import re
-from pyproj import Transformer
 
-# 建立 Transformer 物件 (TWD97 to WGS84)
-transformer = Transformer.from_crs(
-    "+proj=tmerc +lat_0=0 +lon_0=121 +k=0.9999 +x_0=250000 +y_0=0 +ellps=GRS80 +units=m +no_defs",
-    "EPSG:4326",
-    always_xy=True
-)
+import numpy as np
+
+from inp_tokenizer import iter_inp_records
+from network_model import TWD97, WGS84, Network, build_network
+from profiling import span, traced
+
+TWD97_PROJ = "+proj=tmerc +lat_0=0 +lon_0=121 +k=0.9999 +x_0=250000 +y_0=0 +ellps=GRS80 +units=m +no_defs"
+
+# parse_inp 實際使用的區段，其餘區段由 tokenizer 直接略過
+PARSED_SECTIONS = ("JUNCTIONS", "PIPES", "VERTICES", "COORDINATES")
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer():
+    """建立 (並快取) TWD97 to WGS84 的 Transformer；第一次使用時才匯入 pyproj"""
+    from pyproj import Transformer
+    return Transformer.from_crs(
+        TWD97_PROJ,
+        "EPSG:4326",
+        always_xy=True
+    )
+
+
+def __getattr__(name):
+    # 相容原本的模組層級 transformer 物件
+    if name == "transformer":
+        return get_transformer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def convert_twd97_to_wgs84(x, y):
@@ -19,98 +40,206 @@ def convert_twd97_to_wgs84(x, y):
     :return: 包含 lat (緯度) 和 lng (經度) 的字典
     """
     try:
-        lon, lat = transformer.transform(x, y)
+        lon, lat = get_transformer().transform(x, y)
         return {"lat": lat, "lng": lon}
     except Exception as e:
         print(f"座標轉換錯誤: {e}")
         return None
 
 
-def parse_inp(file_path):
+def convert_twd97_to_wgs84_batch(xs, ys):
+    """
+    以單一次向量化呼叫將多個 TWD97 座標轉換為 WGS84
+
+    :param xs: TWD97 X 座標陣列
+    :param ys: TWD97 Y 座標陣列
+    :return: (lng, lat, valid) 三個 NumPy 陣列，valid 標記轉換結果是否為有限值
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if xs.size == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty.copy(), np.empty(0, dtype=bool)
+    lon, lat = get_transformer().transform(xs, ys, errcheck=False)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    return lon, lat, valid
+
+
+def _report_invalid(kind, ids, xs, ys, valid):
+    """逐點回報無法轉換的座標 (與 convert_twd97_to_wgs84 回傳 None 時相同)"""
+    for i in np.flatnonzero(~valid):
+        print(f"座標轉換錯誤: {kind} {ids[i]} ({xs[i]}, {ys[i]}) 轉換結果無效")
+
+
+@traced("parse_inp")
+def parse_inp_network(file_path, reproject=True, previous=None):
+    """
+    解析 EPANET INP 檔案為欄式 Network 物件 (JUNCTIONS、PIPES、VERTICES、COORDINATES)
+
+    檔案以 inp_tokenizer 串流讀取；座標會先收集成 NumPy 陣列，最後再一次向量化轉換成 WGS84。
+
+    :param file_path: INP 檔案路徑
+    :param reproject: 是否將座標轉換為 WGS84；False 時保留 TWD97 原始座標
+    :param previous: 同一檔案先前解析的 Network；指定時改由 inp_incremental.IncrementalParser
+                     解析 (不使用磁碟快取)，並回傳與 previous 的差異
+    :return: network_model.Network；指定 previous 時為 (Network, inp_incremental.NetworkDiff)
+    """
+    if previous is not None:
+        from inp_incremental import IncrementalParser  # inp_incremental 匯入本模組，在此才匯入
+        parser = IncrementalParser(file_path, reproject, cache_dir=None, previous=previous)
+        return parser.network, parser.last_diff
+
+    junctions = []
+    pipes = []
+    coord_ids, coord_x, coord_y = [], [], []
+    vertex_ids, vertex_x, vertex_y = [], [], []
+
+    for section, record in iter_inp_records(file_path, PARSED_SECTIONS):
+        if section == "COORDINATES":
+            coord_ids.append(record.id)
+            coord_x.append(record.x)
+            coord_y.append(record.y)
+        elif section == "JUNCTIONS":
+            junctions.append(record)
+        elif section == "PIPES":
+            pipes.append(record)
+        elif section == "VERTICES":
+            vertex_ids.append(record.id)
+            vertex_x.append(record.x)
+            vertex_y.append(record.y)
+
+    # 節點與彎曲點一起做單次向量化轉換
+    xs = np.array(coord_x + vertex_x, dtype=np.float64)
+    ys = np.array(coord_y + vertex_y, dtype=np.float64)
+    del coord_x, coord_y, vertex_x, vertex_y
+    with span("parse_inp.reproject", points=len(xs)):
+        if reproject:
+            lng, lat, valid = convert_twd97_to_wgs84_batch(xs, ys)
+            xy = np.column_stack((lng, lat))
+        else:
+            valid = np.isfinite(xs) & np.isfinite(ys)
+            xy = np.column_stack((xs, ys))
+
+    n_coords = len(coord_ids)
+    _report_invalid("節點", coord_ids, xs[:n_coords], ys[:n_coords], valid[:n_coords])
+    _report_invalid("彎曲點", vertex_ids, xs[n_coords:], ys[n_coords:], valid[n_coords:])
+
+    with span("parse_inp.build"):
+        return build_network(
+            coord_ids, xy[:n_coords], valid[:n_coords],
+            junctions, pipes,
+            vertex_ids, xy[n_coords:], valid[n_coords:],
+            crs=WGS84 if reproject else TWD97,
+        )
+
+
+def parse_inp(file_path, reproject=True, previous=None):
     """
     解析 EPANET INP 檔案，提取 JUNCTIONS、PIPES、VERTICES、COORDINATES
 
     :param file_path: INP 檔案路徑
-    :return: 字典格式的解析結果
+    :param reproject: 是否將座標轉換為 WGS84；False 時保留 TWD97 原始座標，
+                      節點以 "xy" ({"x", "y"}) 取代 "latlng"，path 亦為 {"x", "y"}
+    :param previous: 同一檔案先前解析的 Network (見 parse_inp_network)
+    :return: 字典格式的解析結果；指定 previous 時為 (dict, inp_incremental.NetworkDiff)
+    """
+    if previous is not None:
+        network, diff = parse_inp_network(file_path, reproject, previous)
+        return network.to_dict(), diff
+    return parse_inp_network(file_path, reproject).to_dict()
+
+
+def _json_encoder(indent, backend):
     """
-    nodes = {}
-    pipes = {}
-    vertices = {}
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    section = None
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith(";"):  # 跳過空行和註解
-            continue
-
-        if ";" in line:
-            line = line.split(";")[0].strip()  # 去掉行內註解
-
-        # 檢測新區段
-        if line.startswith("[") and line.endswith("]"):
-            section = line.strip("[]")
-            continue
-
-        parts = re.split(r"\s+", line)
-
-        # 解析節點座標 [COORDINATES]
-        if section == "COORDINATES" and len(parts) >= 3:
-            node_id, x, y = parts[0], float(parts[1]), float(parts[2])
-            converted = convert_twd97_to_wgs84(x, y)
-            if converted:
-                nodes[node_id] = {"latlng": converted, "elevation": 0, "base_demand": 0, "pattern": None}
-
-        # 解析節點 [JUNCTIONS]
-        elif section == "JUNCTIONS" and len(parts) >= 3:
-            node_id, elevation, base_demand = parts[0], float(parts[1]), float(parts[2])
-            pattern = parts[3] if len(parts) > 3 else None
-            if node_id not in nodes:
-                nodes[node_id] = {"latlng": None, "elevation": 0, "base_demand": 0, "pattern": None}
-            nodes[node_id].update({"elevation": elevation, "base_demand": base_demand, "pattern": pattern})
-
-        # 解析管線 [PIPES]
-        elif section == "PIPES" and len(parts) >= 6:
-            pipe_id, start_node, end_node = parts[0], parts[1], parts[2]
-            length, diameter, roughness = float(parts[3]), float(parts[4]), float(parts[5])
-            pipes[pipe_id] = {"start": start_node, "end": end_node, "length": length, "diameter": diameter,
-                              "roughness": roughness, "path": []}
-
-        # 解析管線彎曲點 [VERTICES]
-        elif section == "VERTICES" and len(parts) >= 3:
-            pipe_id, x, y = parts[0], float(parts[1]), float(parts[2])
-            converted = convert_twd97_to_wgs84(x, y)
-            if converted:
-                if pipe_id not in vertices:
-                    vertices[pipe_id] = []
-                vertices[pipe_id].append(converted)
-
-    # 將彎曲點資訊加入管線
-    for pipe_id, path_points in vertices.items():
-        if pipe_id in pipes:
-            pipes[pipe_id]["path"] = path_points
-
-    return {"nodes": nodes, "pipes": pipes}
-
-
-def save_to_json(data, output_file):
+    依 backend 與縮排選擇單一值的編碼函式 (回傳 str)
+
+    orjson 只支援無縮排與 2 格縮排，其他縮排會退回標準 json 模組。
+    """
+    if backend in ("auto", "orjson") and indent in (None, 2):
+        try:
+            import orjson
+        except ImportError:
+            if backend == "orjson":
+                raise
+        else:
+            option = orjson.OPT_INDENT_2 if indent == 2 else 0
+            return lambda value: orjson.dumps(value, option=option).decode("utf-8")
+    elif backend == "orjson":
+        raise ValueError("orjson 只支援 indent=None 或 indent=2")
+    if indent is None:
+        return lambda value: json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return lambda value: json.dumps(value, ensure_ascii=False, indent=indent)
+
+
+def _write_section(f, items, encode, indent, batch_size):
+    """串流寫出 {"id": value, ...}，輸出格式與 json.dump 相同"""
+    if indent is None:
+        item_sep, key_sep, pad, close = ",", ":", "", "}"
+    else:
+        pad = "\n" + " " * (2 * indent)
+        item_sep, key_sep, close = "," + pad, ": ", "\n" + " " * indent + "}"
+    f.write("{")
+    buf = []
+    first = True
+    for key, value in items:
+        text = encode(value)
+        if indent is not None:
+            text = text.replace("\n", pad)  # 巢狀兩層的縮排
+        buf.append((pad if first else item_sep) + json.dumps(key, ensure_ascii=False) + key_sep + text)
+        first = False
+        if len(buf) >= batch_size:
+            f.write("".join(buf))
+            buf.clear()
+    f.write("".join(buf))
+    f.write("}" if first else close)
+
+
+@traced("save_to_json")
+def save_to_json(data, output_file, indent=4, backend="auto", batch_size=1000):
     """
-    將解析結果儲存為 JSON 檔案
+    將解析結果以串流方式儲存為 JSON 檔案
+
+    節點與管線逐筆編碼後分批寫入，不會先建立整份巢狀 dict；
+    indent=4 時輸出與 json.dump(data, indent=4, ensure_ascii=False) 相同。
 
-    :param data: 解析後的資料 (dict)
+    :param data: 解析後的資料 (dict 或 Network)
     :param output_file: JSON 檔案名稱
+    :param indent: 縮排空白數，None 為不換行的緊湊格式
+    :param backend: "auto" (有安裝 orjson 且縮排相容時使用)、"orjson" 或 "json"
+    :param batch_size: 每累積幾筆寫入一次檔案
     """
+    if isinstance(data, Network):
+        sections = {"nodes": data.iter_nodes(), "pipes": data.iter_pipes()}
+    else:
+        sections = {key: value.items() for key, value in data.items()}
+    encode = _json_encoder(indent, backend)
+
     with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+        if indent is None:
+            pad, sep, key_sep, close = "", ",", ":", "}"
+        else:
+            pad = "\n" + " " * indent
+            sep, key_sep, close = "," + pad, ": ", "\n}"
+        f.write("{")
+        for i, (name, items) in enumerate(sections.items()):
+            f.write((pad if i == 0 else sep) + json.dumps(name) + key_sep)
+            _write_section(f, items, encode, indent, batch_size)
+        f.write(close if sections else "}")
     print(f"解析完成，結果已儲存至 {output_file}")
 
 
 if __name__ == "__main__":
+    from inp_cache import cached_parse_inp_network
+
     file_path = "0401-13-01-12.inp"  # 修改為你的 INP 檔案路徑
-    parsed_data = parse_inp(file_path)
+    parsed_data = cached_parse_inp_network(file_path)  # 內容未變時直接讀取快取
 
     # 儲存為 JSON
     output_file = "parsed_network.json"
     save_to_json(parsed_data, output_file)
+
+    # 給 readinpmap.html 直接載入的二進位資料包 (瀏覽器不需解析 INP 與轉換座標)
+    # from viewer_bundle import write_viewer_bundle
+    # write_viewer_bundle(parsed_data, "viewer_bundle")
@@ -1,65 +1,245 @@
+import functools
+import threading
 import zipfile
 import os
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from layer_export import EXTENSIONS, export_layers
+from profiling import traced
+
+# geopandas、shapely、pyproj、matplotlib 與 tkinter 都在第一次使用時才匯入，
+# 匯入此模組 (例如 process pool 的 worker) 不需要數秒的啟動時間
 
-# 加入 tkinter 的檔案對話框
-import tkinter as tk
-from tkinter import filedialog
 
 def extract_shp(zip_path, extract_path):
-    """解壓縮 SHP 壓縮檔"""
+    """解壓縮 SHP 壓縮檔 (load_shapefiles 已可直接讀取 ZIP，通常不需要)"""
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         zip_ref.extractall(extract_path)
 
-def load_shapefiles(directory):
+# 主要使用的圖層
+MAIN_LAYERS = ("pipe.shp", "valve.shp", "hydrant.shp", "manhole.shp")
+DEFAULT_SOURCE_CRS = "EPSG:3826"  # 沒有 crs 的圖層視為 TWD97 TM2
+TARGET_CRS = "EPSG:4326"
+
+
+def _layer_name(name):
+    """圖層名稱正規化：不分大小寫，可省略 .shp"""
+    name = name.lower()
+    return name if name.endswith(".shp") else name + ".shp"
+
+
+def _layer_key(name):
+    """圖層名稱 (list_shapefiles 的 key) 的檔名部分，例如 'a/pipe.shp' -> 'pipe.shp'"""
+    return os.path.basename(name).lower()
+
+
+def list_shapefiles(source):
     """
-    讀取指定目錄中的 SHP 檔案，並以 dict 形式回傳：
+    列出 ZIP 檔或目錄中的 SHP 檔案 (副檔名不分大小寫)
+
+    圖層名稱一律為小寫檔名 (例如 'PIPE.SHP' -> 'pipe.shp')；ZIP 內不同子目錄有同名的 SHP 時，
+    這些圖層改以 ZIP 內的路徑加上小寫檔名 (例如 'a/pipe.shp') 為名稱。
+
+    :param source: SHP 壓縮檔 (.zip) 或目錄
+    :return: {'pipe.shp': GDAL 可讀取的路徑, ...}；ZIP 內的檔案以 /vsizip/ 虛擬路徑表示
+    """
+    if os.path.isdir(source):
+        members = sorted(f for f in os.listdir(source) if f.lower().endswith(".shp"))
+        paths = [os.path.join(source, f) for f in members]
+    elif zipfile.is_zipfile(source):
+        zip_path = os.path.abspath(source)
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            members = [n for n in zip_ref.namelist() if n.lower().endswith(".shp")]
+        paths = [f"/vsizip/{zip_path}/{m}" for m in members]
+    else:
+        raise ValueError(f"{source} 不是 ZIP 檔或目錄")
+
+    names = [_layer_key(m) for m in members]
+    duplicated = {name for name in names if names.count(name) > 1}
+    if duplicated:
+        print(f"[WARN] 有同名圖層，改以完整路徑命名: {', '.join(sorted(duplicated))}")
+        # 同一目錄內只差大小寫的檔案，小寫後仍會重複，這時保留原始路徑
+        keys = [os.path.join(os.path.dirname(m), name) if name in duplicated else name
+                for m, name in zip(members, names)]
+        names = [m if keys.count(key) > 1 else key for m, key in zip(members, keys)]
+    return dict(zip(names, paths))
+
+
+def _read_layer(file_path, read_kwargs):
+    """讀取單一圖層 (放在模組層級，供 process pool 使用)"""
+    import geopandas as gpd
+    return gpd.read_file(file_path, **read_kwargs)
+
+
+@traced("shp.load")
+def load_shapefiles(source, layers=None, max_workers=None, executor="thread", engine=None, use_arrow=False,
+                    columns=None, bbox=None, rows=None, where=None):
+    """
+    讀取 ZIP 檔 (不解壓縮，直接經由 GDAL /vsizip/) 或目錄中的 SHP 檔案，並以 dict 形式回傳：
     {
       'pipe.shp': GeoDataFrame,
       'valve.shp': GeoDataFrame,
       ...
     }
+
+    各圖層以 thread / process pool 同時讀取；pyogrio 讀檔時會釋放 GIL，thread 通常就足夠。
+
+    :param source: SHP 壓縮檔 (.zip) 或目錄
+    :param layers: 只讀取指定的圖層 (例如 MAIN_LAYERS 或 ["pipe", "valve"])，None 表示全部
+    :param max_workers: 同時讀取的圖層數，None 為 CPU 核心數，1 表示依序讀取
+    :param executor: "thread" 或 "process"
+    :param engine: gpd.read_file 的 engine ("pyogrio" / "fiona")，None 為 GeoPandas 預設
+    :param use_arrow: 使用 pyogrio 的 Arrow 讀取路徑 (會強制 engine="pyogrio")
+    :param columns: 只讀取的欄位；list 套用到所有圖層，dict 則為 {圖層: [欄位]}
+    :param bbox: (minx, miny, maxx, maxy) 範圍篩選，座標為圖層原始座標系統
+    :param rows: 讀取的列數或 slice
+    :param where: SQL WHERE 條件 (需 pyogrio)
+    """
+    available = list_shapefiles(source)
+    if layers is not None:
+        wanted = {_layer_name(name) for name in layers}
+        available = {name: path for name, path in available.items() if _layer_key(name) in wanted}
+        missing = wanted - {_layer_key(name) for name in available}
+        if missing:
+            print(f"[WARN] 找不到圖層: {', '.join(sorted(missing))}")
+
+    base_kwargs = {}
+    if use_arrow:
+        engine = "pyogrio"
+        base_kwargs["use_arrow"] = True
+    if engine is not None:
+        base_kwargs["engine"] = engine
+    for key, value in (("bbox", bbox), ("rows", rows), ("where", where)):
+        if value is not None:
+            base_kwargs[key] = value
+
+    jobs = {}
+    for shp_file, file_path in available.items():
+        read_kwargs = dict(base_kwargs)
+        layer_columns = columns.get(shp_file, columns.get(_layer_key(shp_file))) if isinstance(columns, dict) else columns
+        if layer_columns is not None:
+            read_kwargs["columns"] = list(layer_columns)
+        jobs[shp_file] = (file_path, read_kwargs)
+
+    workers = min(max_workers or os.cpu_count() or 1, len(jobs)) if jobs else 1
+    if workers <= 1:
+        return {name: _read_layer(*job) for name, job in jobs.items()}
+
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        futures = {name: pool.submit(_read_layer, *job) for name, job in jobs.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(src_crs, dst_crs):
+    """取得 (並快取) pyproj Transformer；src_crs / dst_crs 為 CRS 字串 (例如 WKT)"""
+    from pyproj import Transformer
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+@traced("shp.reproject")
+def reproject_layer(gdf, target_crs=TARGET_CRS, default_crs=DEFAULT_SOURCE_CRS):
     """
-    shp_files = [f for f in os.listdir(directory) if f.endswith(".shp")]
-    shapefiles = {}
-    for shp_file in shp_files:
-        file_path = os.path.join(directory, shp_file)
-        shapefiles[shp_file] = gpd.read_file(file_path)
-    return shapefiles
+    將圖層轉換到 target_crs，回傳新的 GeoDataFrame (不修改傳入的資料)
+
+    :param gdf: GeoDataFrame
+    :param target_crs: 目標座標系統
+    :param default_crs: 圖層沒有 crs 時假設的座標系統 (EPSG:3826, TWD97 TM2)
+    """
+    import geopandas as gpd
+    import shapely
+    from pyproj import CRS
+
+    src = CRS.from_user_input(gdf.crs if gdf.crs is not None else default_crs)
+    dst = CRS.from_user_input(target_crs)
+    if src == dst:
+        return gdf.set_crs(dst, allow_override=True)
+
+    transformer = get_transformer(src.to_wkt(), dst.to_wkt())
 
+    def _transform(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack((x, y, coords[:, 2:]))  # Z 值 (若有) 保持不變
+
+    geoms = np.asarray(gdf.geometry.values)
+    geoms = shapely.transform(geoms, _transform, include_z=bool(shapely.has_z(geoms).any()))
+    return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=dst))
+
+
+class LayerCache:
+    """
+    圖層快取：每個圖層只轉換一次到 WGS84，並由繪圖、個別輸出與合併輸出共用
+
+    原始的 GeoDataFrame 不會被修改。
+    """
+
+    def __init__(self, shapefiles, target_crs=TARGET_CRS, default_crs=DEFAULT_SOURCE_CRS):
+        self.shapefiles = shapefiles
+        self.target_crs = target_crs
+        self.default_crs = default_crs
+        self.reprojections = 0  # 實際執行轉換的次數
+        self._reprojected = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.shapefiles
+
+    def names(self):
+        return list(self.shapefiles)
+
+    def get(self, name):
+        """取得轉換後的圖層；不存在時回傳空的 GeoDataFrame"""
+        gdf = self.shapefiles.get(name)
+        if gdf is None or gdf.empty:
+            import geopandas as gpd
+            return gpd.GeoDataFrame()
+        with self._lock:
+            if name not in self._reprojected:
+                self._reprojected[name] = reproject_layer(gdf, self.target_crs, self.default_crs)
+                self.reprojections += 1
+            return self._reprojected[name]
+
+    def items(self, names=None):
+        """逐一產出 (圖層名稱, 轉換後的 GeoDataFrame)，略過空圖層"""
+        for name in (self.names() if names is None else names):
+            gdf = self.get(name)
+            if not gdf.empty:
+                yield name, gdf
+
+
+def as_layer_cache(shapefiles):
+    """dict 會包成 LayerCache；已經是 LayerCache 則直接回傳"""
+    return shapefiles if isinstance(shapefiles, LayerCache) else LayerCache(shapefiles)
+
+
+@traced("shp.plot")
 def plot_shapefiles(shapefiles, output_path="map.png"):
     """
     讀取多個 GeoDataFrame，轉成 WGS84 後繪圖，輸出 PNG。
+
+    :param shapefiles: load_shapefiles 的結果或 LayerCache
     """
-    # 取得各層 GeoDataFrame
-    gdf_pipe = shapefiles.get("pipe.shp", gpd.GeoDataFrame())
-    gdf_valve = shapefiles.get("valve.shp", gpd.GeoDataFrame())
-    gdf_hydrant = shapefiles.get("hydrant.shp", gpd.GeoDataFrame())
-    gdf_manhole = shapefiles.get("manhole.shp", gpd.GeoDataFrame())
-
-    # 設定預設 CRS= EPSG:3826 (TWD97 TM2)，再轉 WGS84
-    def to_wgs84(gdf):
-        if gdf.crs is None:
-            gdf.set_crs("EPSG:3826", inplace=True)
-        return gdf.to_crs("EPSG:4326")
-
-    if not gdf_pipe.empty:    gdf_pipe = to_wgs84(gdf_pipe)
-    if not gdf_valve.empty:   gdf_valve = to_wgs84(gdf_valve)
-    if not gdf_hydrant.empty: gdf_hydrant = to_wgs84(gdf_hydrant)
-    if not gdf_manhole.empty: gdf_manhole = to_wgs84(gdf_manhole)
-
-    # 繪圖
+    import matplotlib.pyplot as plt
+
+    layers = as_layer_cache(shapefiles)
+
+    # 各層的繪圖樣式；同名圖層 (例如 'a/pipe.shp'、'b/pipe.shp') 以相同樣式繪製
+    styles = {
+        "pipe.shp": dict(color="blue", linewidth=0.5, label="Pipes"),
+        "valve.shp": dict(color="red", markersize=10, label="Valves", marker="o"),
+        "hydrant.shp": dict(color="green", markersize=10, label="Hydrants", marker="s"),
+        "manhole.shp": dict(color="orange", markersize=10, label="Manholes", marker="^"),
+    }
+
+    # 繪圖 (EPSG:3826 -> WGS84，已轉換過的 GeoDataFrame 直接共用)
     fig, ax = plt.subplots(figsize=(10, 10))
-    if not gdf_pipe.empty:
-        gdf_pipe.plot(ax=ax, color="blue", linewidth=0.5, label="Pipes")
-    if not gdf_valve.empty:
-        gdf_valve.plot(ax=ax, color="red", markersize=10, label="Valves", marker="o")
-    if not gdf_hydrant.empty:
-        gdf_hydrant.plot(ax=ax, color="green", markersize=10, label="Hydrants", marker="s")
-    if not gdf_manhole.empty:
-        gdf_manhole.plot(ax=ax, color="orange", markersize=10, label="Manholes", marker="^")
+    for layer, style in styles.items():
+        names = [n for n in layers.names() if _layer_key(n) == layer]
+        for i, (_, gdf) in enumerate(layers.items(names)):
+            gdf.plot(ax=ax, **(style if i == 0 else dict(style, label="_nolegend_")))
 
     plt.legend()
     plt.title("Water Pipe Network (WGS84) with Valves, Hydrants, and Manholes")
@@ -69,58 +249,50 @@ def plot_shapefiles(shapefiles, output_path="map.png"):
     plt.close()
     print(f"[INFO] map saved to {output_path}")
 
-def save_individual_geojson(shapefiles, output_dir="geojson_output"):
+@traced("shp.save_individual")
+def save_individual_geojson(shapefiles, output_dir="geojson_output", fmt="geojson", precision=6):
     """
-    各 shp 存成各自的 .geojson
+    各 shp 逐批串流存成各自的檔案 (預設 .geojson)
+
+    :param shapefiles: load_shapefiles 的結果或 LayerCache
+    :param fmt: "geojson"、"geojsonl"、"fgb" 或 "parquet"
+    :param precision: 座標小數位數 (WGS84 取 6 位約 0.1 m)，None 表示不處理
     """
+    layers = as_layer_cache(shapefiles)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for shp_name, gdf in shapefiles.items():
-        if gdf.empty:
-            continue
-        if gdf.crs is None:
-            gdf.set_crs("EPSG:3826", inplace=True)
-        gdf_4326 = gdf.to_crs("EPSG:4326")
-
-        out_name = os.path.splitext(shp_name)[0] + ".geojson"
+    for shp_name, gdf_4326 in layers.items():
+        out_name = os.path.splitext(shp_name)[0] + EXTENSIONS[fmt]
         out_path = os.path.join(output_dir, out_name)
-        gdf_4326.to_file(out_path, driver="GeoJSON")
+        export_layers([(shp_name, gdf_4326)], out_path, fmt, precision=precision, source_column=False)
         print(f"[INFO] saved {out_path}")
 
-def merge_all_to_single_geojson(shapefiles, out_file="all_in_one.geojson"):
+@traced("shp.merge")
+def merge_all_to_single_geojson(shapefiles, out_file="all_in_one.geojson", precision=6):
     """
-    將所有 shp（可能有不同屬性、幾何型態）合併到一個 GeoDataFrame 中，
-    然後一次輸出成單一 GeoJSON。
+    將所有 shp（可能有不同屬性、幾何型態）逐圖層、逐批串流寫入單一檔案，
+    每個圖徵以 src_layer 欄位記錄來源，不會先合併成一個 GeoDataFrame。
+
+    :param shapefiles: load_shapefiles 的結果或 LayerCache
+    :param out_file: 輸出路徑；依副檔名輸出 .geojson、.geojsonl、.fgb (FlatGeobuf) 或 .parquet (GeoParquet)
+    :param precision: 座標小數位數，None 表示不處理
     """
-    frames = []
-    for shp_name, gdf in shapefiles.items():
-        if shp_name not in ["pipe.shp", "valve.shp", "hydrant.shp", "manhole.shp"]:
-            continue
-        if gdf.empty:
-            continue
-        # 若尚未有 crs，就先設 EPSG:3826
-        if gdf.crs is None:
-            gdf.set_crs("EPSG:3826", inplace=True)
-        # 轉為 WGS84
-        gdf_4326 = gdf.to_crs("EPSG:4326")
-        # 給個欄位紀錄這筆來源
-        gdf_4326["src_layer"] = shp_name
-        frames.append(gdf_4326)
-
-    if len(frames) == 0:
+    layers = as_layer_cache(shapefiles)
+    names = [n for n in layers.names() if _layer_key(n) in MAIN_LAYERS]
+    merged = [name for name, _ in layers.items(names)]
+    if len(merged) == 0:
         print("[WARN] no valid shapefiles to merge.")
         return
 
-    # 利用 pandas 的 concat 合併
-    combined_gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True, sort=False),
-                                    crs="EPSG:4326")
-    # 輸出
-    combined_gdf.to_file(out_file, driver="GeoJSON")
-    print(f"[INFO] Merged {len(frames)} shapefiles into {out_file}")
+    count = export_layers(layers.items(merged), out_file, precision=precision)
+    print(f"[INFO] Merged {len(merged)} shapefiles ({count} features) into {out_file}")
 
-if __name__ == "__main__":
+def main():
     # 使用 tkinter 讓使用者選擇 zip 檔
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # 隱藏主視窗
     zip_path = filedialog.askopenfilename(
@@ -129,22 +301,24 @@ if __name__ == "__main__":
     )
     if not zip_path:
         print("[ERROR] 使用者未選擇檔案，程式結束。")
-        exit()
-
-    extract_path = "shp_files"
-    shp_folder = os.path.join(extract_path, "SHP")
-
-    # 1. 解壓縮
-    extract_shp(zip_path, extract_path)
+        return
 
-    # 2. 讀取 SHP
-    shapefiles = load_shapefiles(shp_folder)
+    # 1. 直接從 ZIP 讀取 SHP (不解壓縮到磁碟)，各圖層只轉換一次座標並共用
+    shapefiles = LayerCache(load_shapefiles(zip_path))
 
-    # 3. 繪製並輸出
+    # 2. 繪製並輸出
     plot_shapefiles(shapefiles, "map.png")
 
-    # 4. 各別輸出 GeoJSON（可選）
+    # 3. 各別輸出 GeoJSON（可選）
     save_individual_geojson(shapefiles, "geojson_output")
 
-    # 5. 整合為單一檔
+    # 4. 整合為單一檔
     # merge_all_to_single_geojson(shapefiles, "all_in_one.geojson")
+
+    # 5. 產生分級圖磚，讓 readinpmap.html 只載入畫面內的範圍（大範圍時取代 map.png）
+    # from map_tiles import generate_tiles, shapefile_sources
+    # generate_tiles(shapefile_sources(shapefiles), "tiles", fmt="png")
+
+
+if __name__ == "__main__":
+    main()
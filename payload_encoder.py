@@ -0,0 +1,362 @@
+import csv
+import gzip
+import json
+import os
+
+import numpy as np
+
+from network_model import WGS84
+
+PAYLOAD_FORMAT = "network-compact-v1"
+BYTES_PER_TOKEN = 4  # 粗估：英數 JSON 平均約 4 bytes / token
+# 依序嘗試的 Douglas–Peucker 容許誤差 (以量化後的座標單位計)
+SIMPLIFY_TOLERANCES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def default_precision(crs):
+    """WGS84 取小數 5 位 (約 1 m)，TWD97 (公尺) 取整數"""
+    return 5 if crs == WGS84 else 0
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Douglas–Peucker 折線簡化
+
+    :param points: (n, 2) 座標陣列
+    :param tolerance: 容許的最大垂直距離
+    :return: 要保留的點之布林遮罩 (首尾點一定保留)
+    """
+    return dp_importance(points) > tolerance
+
+
+def dp_importance(points):
+    """
+    各點在 Douglas–Peucker 中的重要度：容許誤差小於此值時該點會被保留
+
+    一個點只有在它所有上層的分割點都被保留時才會被考慮，所以重要度取
+    自身距離與上層重要度的較小值；任何容許誤差的簡化結果都等於 importance > tolerance，
+    只需計算一次即可比較多個容許誤差。
+
+    :param points: (n, 2) 座標陣列
+    :return: 長度 n 的陣列 (首尾點為 inf)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return _lines_importance(points, np.array([0, len(points)]))
+
+
+def _lines_importance(xy, offsets):
+    """
+    同時對多條折線 (xy[offsets[i]:offsets[i + 1]]) 計算 Douglas–Peucker 重要度
+
+    所有折線同一層的分割一起以陣列運算處理，迴圈次數只取決於最深的分割層數。
+    """
+    importance = np.zeros(len(xy))
+    lengths = np.diff(offsets)
+    nonempty = lengths > 0
+    importance[offsets[:-1][nonempty]] = np.inf
+    importance[offsets[1:][nonempty] - 1] = np.inf
+
+    first = offsets[:-1][lengths > 2].astype(np.int64)
+    last = offsets[1:][lengths > 2].astype(np.int64) - 1
+    parent = np.full(len(first), np.inf)
+    while len(first):
+        inner = last - first - 1
+        starts = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        seg = np.repeat(np.arange(len(first)), inner)
+        idx = np.arange(int(inner.sum())) - starts[seg] + first[seg] + 1
+
+        a, b = xy[first], xy[last]
+        d = (b - a)[seg]
+        p = xy[idx] - a[seg]
+        norm = np.hypot(d[:, 0], d[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dist = np.where(norm == 0, np.hypot(p[:, 0], p[:, 1]),
+                            np.abs(d[:, 0] * p[:, 1] - d[:, 1] * p[:, 0]) / norm)
+
+        # 每段距離最大的第一個點 (與逐段 argmax 相同)
+        peak = np.maximum.reduceat(dist, starts)
+        hit = np.flatnonzero(dist == peak[seg])
+        _, pos = np.unique(seg[hit], return_index=True)
+        mid = idx[hit[pos]]
+        value = np.minimum(peak, parent)
+        importance[mid] = value
+
+        first = np.concatenate((first, mid))
+        last = np.concatenate((mid, last))
+        parent = np.concatenate((value, value))
+        more = last - first >= 2
+        first, last, parent = first[more], last[more], parent[more]
+    return importance
+
+
+def vertex_importance(network, node_q, vertex_q):
+    """
+    對每條管線 (起點 + 彎曲點 + 終點) 計算彎曲點的 Douglas–Peucker 重要度
+
+    :param network: Network
+    :param node_q: 量化後的節點座標
+    :param vertex_q: 量化後的彎曲點座標
+    :return: 長度為 n_vertices 的陣列；importance > tolerance 即為該容許誤差下保留的彎曲點
+    """
+    start = node_q[network.pipe_start]
+    end = node_q[network.pipe_end]
+    has_start = np.isfinite(start).all(axis=1)
+    has_end = np.isfinite(end).all(axis=1)
+    counts = np.diff(network.vertex_offsets)
+    offsets = np.concatenate(([0], np.cumsum(counts + has_start + has_end)))
+
+    # 組成扁平的折線陣列 (沒有座標的起迄點略過)
+    xy = np.empty((int(offsets[-1]), 2))
+    head = offsets[:-1][has_start]
+    tail = offsets[1:][has_end] - 1
+    xy[head] = start[has_start]
+    xy[tail] = end[has_end]
+    inner = np.ones(len(xy), dtype=bool)
+    inner[head] = inner[tail] = False
+    xy[inner] = vertex_q
+    return _lines_importance(xy, offsets)[inner]
+
+
+def simplify_vertices(network, node_q, vertex_q, tolerance):
+    """
+    對每條管線 (起點 + 彎曲點 + 終點) 做 Douglas–Peucker，回傳彎曲點的保留遮罩
+
+    :param network: Network
+    :param node_q: 量化後的節點座標
+    :param vertex_q: 量化後的彎曲點座標
+    :param tolerance: 容許誤差 (量化單位)
+    :return: 長度為 n_vertices 的布林遮罩
+    """
+    return vertex_importance(network, node_q, vertex_q) > tolerance
+
+
+def _quantize(xy, scale):
+    """量化座標；NaN 保持為 NaN (以 float 保存)"""
+    return np.round(np.asarray(xy, dtype=np.float64) * scale)
+
+
+def _delta_arrays(network, node_q, vertex_q, keep):
+    """
+    差分編碼的陣列形式
+
+    :return: (deltas (保留點數 × 2) int64, 每條管線的保留點數)
+    """
+    counts = np.diff(network.vertex_offsets)
+    owner = np.repeat(np.arange(network.n_pipes), counts)[keep]
+    pts = vertex_q[keep]
+    counts = np.bincount(owner, minlength=network.n_pipes)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    prev = np.empty_like(pts)
+    prev[1:] = pts[:-1]
+    first = offsets[:-1][counts > 0]
+    start = node_q[network.pipe_start[counts > 0]]
+    prev[first] = np.where(np.isfinite(start), start, 0)  # 起點無座標時第一個點為絕對座標
+    return (pts - prev).astype(np.int64), counts
+
+
+def _delta_paths(network, node_q, vertex_q, keep):
+    """
+    將彎曲點轉為差分編碼：每條管線第一個點相對於起點節點，其後相對於前一點
+
+    :return: 每條管線一個 [dx0, dy0, dx1, dy1, ...] 整數列表
+    """
+    deltas, counts = _delta_arrays(network, node_q, vertex_q, keep)
+    deltas = deltas.reshape(-1).tolist()
+    flat_offsets = (np.concatenate(([0], np.cumsum(counts))) * 2).tolist()
+    return [deltas[flat_offsets[i]:flat_offsets[i + 1]] for i in range(network.n_pipes)]
+
+
+def _path_bytes(network, node_q, vertex_q, keep):
+    """
+    不實際編碼，計算 "path" 欄位在緊湊 JSON 中的大小 (bytes)：,"path":[[dx,dy,...],[],...]
+    """
+    deltas, counts = _delta_arrays(network, node_q, vertex_q, keep)
+    magnitude = np.abs(deltas.reshape(-1))
+    digits = np.ones(len(magnitude), dtype=np.int64)
+    nonzero = magnitude > 0
+    digits[nonzero] = np.floor(np.log10(magnitude[nonzero])).astype(np.int64) + 1
+    digits += deltas.reshape(-1) < 0  # 負號
+    n_values = counts * 2
+    commas = np.maximum(n_values - 1, 0).sum() + max(network.n_pipes - 1, 0)
+    return len(',"path":[]') + 2 * network.n_pipes + int(digits.sum()) + int(commas)
+
+
+def _int_or_none(values):
+    return [None if v != v else int(v) for v in values.tolist()]
+
+
+def build_payload(network, precision=None, geometry="full", tolerance=None, value_digits=3, importance=None):
+    """
+    建立精簡的欄式 payload dict
+
+    :param network: network_model.Network
+    :param precision: 座標量化的小數位數，None 依座標系統決定
+    :param geometry: "full" (保留彎曲點)、"simplified" (Douglas–Peucker) 或 "none" (只保留節點座標)
+    :param tolerance: geometry="simplified" 時的容許誤差 (量化單位)
+    :param value_digits: 長度、管徑等數值保留的小數位數
+    :param importance: 預先計算的 vertex_importance (比較多個容許誤差時避免重複計算)
+    :return: dict
+    """
+    precision = default_precision(network.crs) if precision is None else precision
+    scale = 10 ** precision
+    node_q = _quantize(network.node_xy, scale)
+
+    payload = {
+        "format": PAYLOAD_FORMAT,
+        "crs": network.crs,
+        "scale": scale,
+        "geometry": geometry if geometry != "simplified" else f"simplified:{tolerance}",
+        "nodes": {
+            "id": network.node_ids.tolist(),
+            "x": _int_or_none(node_q[:, 0]),
+            "y": _int_or_none(node_q[:, 1]),
+            "elevation": np.round(network.node_elevation, value_digits).tolist(),
+            "base_demand": np.round(network.node_base_demand, value_digits).tolist(),
+        },
+        "pipes": {
+            "id": network.pipe_ids.tolist(),
+            "start": network.pipe_start.tolist(),
+            "end": network.pipe_end.tolist(),
+            "length": np.round(network.pipe_length, value_digits).tolist(),
+            "diameter": np.round(network.pipe_diameter, value_digits).tolist(),
+            "roughness": np.round(network.pipe_roughness, value_digits).tolist(),
+        },
+    }
+    if geometry != "none":
+        vertex_q = _quantize(network.vertex_xy, scale)
+        if geometry == "simplified":
+            if importance is None:
+                importance = vertex_importance(network, node_q, vertex_q)
+            keep = importance > tolerance
+        else:
+            keep = np.ones(len(vertex_q), dtype=bool)
+        payload["pipes"]["path"] = _delta_paths(network, node_q, vertex_q, keep)
+    return payload
+
+
+def encode_payload(payload, compress=False):
+    """將 payload 編碼為緊湊 JSON bytes (可選 gzip)"""
+    data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return gzip.compress(data, compresslevel=9) if compress else data
+
+
+def encode_network(network, max_bytes=None, max_tokens=None, compress=False, precision=None):
+    """
+    編碼管網，並在超過大小 / token 預算時自動簡化幾何
+
+    依序考慮：完整幾何 → 逐步加大容許誤差的 Douglas–Peucker → 移除彎曲點。
+    先編碼不含彎曲點的版本作為基準 (它仍超過預算時直接回傳並警告)；
+    Douglas–Peucker 的重要度只計算一次，未壓縮時各容許誤差的大小以陣列運算直接算出，
+    壓縮時則以二分搜尋挑選容許誤差，最後只編碼選中的版本。
+
+    :param network: network_model.Network
+    :param max_bytes: 編碼後的大小上限
+    :param max_tokens: token 上限 (以 BYTES_PER_TOKEN 換算為 bytes，只適用未壓縮的 JSON)
+    :param compress: 是否 gzip
+    :param precision: 座標量化的小數位數
+    :return: (bytes, payload 的 geometry 描述)
+    """
+    budget = max_bytes
+    if max_tokens is not None:
+        token_bytes = max_tokens * BYTES_PER_TOKEN
+        budget = token_bytes if budget is None else min(budget, token_bytes)
+
+    if budget is None:
+        payload = build_payload(network, precision)
+        return encode_payload(payload, compress), payload["geometry"]
+
+    bare = build_payload(network, precision, "none")
+    bare_data = encode_payload(bare, compress)
+    if len(bare_data) > budget:
+        print(f"[WARN] 最小的 payload ({len(bare_data)} bytes) 仍超過預算 {budget} bytes")
+        return bare_data, bare["geometry"]
+
+    scale = bare["scale"]
+    node_q = _quantize(network.node_xy, scale)
+    vertex_q = _quantize(network.vertex_xy, scale)
+
+    def encoded(geometry, tol=None, importance=None):
+        payload = build_payload(network, precision, geometry, tol, importance=importance)
+        return encode_payload(payload, compress), payload["geometry"]
+
+    if compress:
+        data, geometry = encoded("full")
+        if len(data) <= budget:
+            return data, geometry
+        importance = vertex_importance(network, node_q, vertex_q)
+        # 大小隨容許誤差遞減：二分搜尋第一個符合預算的容許誤差
+        lo, hi, best = 0, len(SIMPLIFY_TOLERANCES) - 1, None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            data, geometry = encoded("simplified", SIMPLIFY_TOLERANCES[mid], importance)
+            if len(data) <= budget:
+                best, hi = (data, geometry), mid - 1
+            else:
+                lo = mid + 1
+        return best if best is not None else (bare_data, bare["geometry"])
+
+    # 未壓縮：大小 = 不含 path 的基準 + path 欄位 (只有 geometry 字串長度不同)
+    base = len(bare_data) - len(json.dumps(bare["geometry"]))
+
+    def size(keep, geometry):
+        return base + len(json.dumps(geometry)) + _path_bytes(network, node_q, vertex_q, keep)
+
+    if size(np.ones(len(vertex_q), dtype=bool), "full") <= budget:
+        return encoded("full")
+    importance = vertex_importance(network, node_q, vertex_q)
+    for tol in SIMPLIFY_TOLERANCES:
+        if size(importance > tol, f"simplified:{tol}") <= budget:
+            return encoded("simplified", tol, importance)
+    return bare_data, bare["geometry"]
+
+
+def _write_csv(path, columns):
+    names = list(columns)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(columns[n] for n in names)))
+
+
+def write_payload(network, output_path, fmt="json", max_bytes=None, max_tokens=None, precision=None):
+    """
+    將管網寫成給 LLM 分析用的精簡檔案
+
+    :param network: network_model.Network
+    :param output_path: 輸出路徑；csv / parquet 會以此為前綴輸出 _nodes 與 _pipes 兩個檔案
+    :param fmt: "json"、"json.gz"、"csv" 或 "parquet" (需要 pyarrow)
+    :param max_bytes: json / json.gz 的大小上限
+    :param max_tokens: json 的 token 上限
+    :param precision: 座標量化的小數位數
+    :return: 寫出的檔案路徑列表
+    """
+    if fmt in ("json", "json.gz"):
+        data, geometry = encode_network(network, max_bytes, max_tokens, fmt == "json.gz", precision)
+        with open(output_path, "wb") as f:
+            f.write(data)
+        print(f"[INFO] payload ({geometry}, {len(data)} bytes) saved to {output_path}")
+        return [output_path]
+
+    payload = build_payload(network, precision)
+    nodes, pipes = payload["nodes"], payload["pipes"]
+    # 表格格式中 path 以空白分隔的差分整數表示
+    pipes["path"] = [" ".join(map(str, p)) for p in pipes["path"]]
+    stem = os.path.splitext(output_path)[0]
+    if fmt == "csv":
+        paths = [f"{stem}_nodes.csv", f"{stem}_pipes.csv"]
+        _write_csv(paths[0], nodes)
+        _write_csv(paths[1], pipes)
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("parquet 輸出需要安裝 pyarrow") from e
+        paths = [f"{stem}_nodes.parquet", f"{stem}_pipes.parquet"]
+        pq.write_table(pa.table(nodes), paths[0], compression="zstd")
+        pq.write_table(pa.table(pipes), paths[1], compression="zstd")
+    else:
+        raise ValueError(f"未知的格式: {fmt}")
+    print(f"[INFO] payload saved to {', '.join(paths)} (scale={payload['scale']})")
+    return paths
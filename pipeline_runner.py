@@ -0,0 +1,495 @@
+"""
+批次處理輸入目錄中的 INP 檔與 SHP 壓縮檔 (不需要 tkinter 或寫死的檔名)
+
+每個輸入依序經過 parse → reproject → export → analysis (選擇性) 四個階段；
+各階段有自己的 thread / process pool 與有界佇列，下游佇列滿時上游會停下來等待 (backpressure)，
+記憶體中同時存在的工作數因此有上限。
+
+處理紀錄 (manifest) 以 SQLite 保存，鍵為檔案內容的 SHA-256：內容相同的輸入 (即使改名或重新複製)
+已經成功處理過就會略過；處理失敗的輸入下次執行時會重試。
+
+使用方式：
+    python pipeline_runner.py drop_dir --output-dir pipeline_output
+    python pipeline_runner.py drop_dir --watch --interval 5 --analysis
+    python pipeline_runner.py drop_dir --parse-workers 4 --parse-executor process --queue-size 2
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from inp_cache import DEFAULT_CACHE_DIR, file_sha256
+from leak_engine import DEFAULT_FACTOR
+from profiling import span
+
+DEFAULT_MANIFEST_PATH = ".pipeline_manifest.sqlite"
+DEFAULT_OUTPUT_DIR = "pipeline_output"
+INPUT_KINDS = {".inp": "inp", ".zip": "shp"}
+STAGES = ("parse", "reproject", "export", "analysis")
+
+_STOP = object()  # 佇列結束標記
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inputs (
+    content_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    outputs TEXT,
+    error TEXT,
+    started REAL,
+    finished REAL
+);
+"""
+
+
+class Manifest:
+    """
+    已處理輸入的 SQLite 紀錄 (status 為 running / done / failed)
+
+    只應在建立它的 thread 中使用 (Pipeline 由主 thread 讀寫)。
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        with self.conn:
+            # 上次執行中斷時停在 running 的輸入視為失敗，會再處理一次
+            self.conn.execute("UPDATE inputs SET status = 'failed', error = 'interrupted' WHERE status = 'running'")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def status(self, content_hash):
+        row = self.conn.execute("SELECT status FROM inputs WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def start(self, job):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, 'running', NULL, NULL, ?, NULL)",
+                (job.content_hash, job.path, job.kind, time.time()),
+            )
+
+    def finish(self, job):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE inputs SET status = ?, outputs = ?, error = ?, finished = ? WHERE content_hash = ?",
+                ("failed" if job.error else "done", json.dumps(job.outputs, ensure_ascii=False), job.error,
+                 time.time(), job.content_hash),
+            )
+
+    def rows(self):
+        """[(content_hash, path, kind, status, error), ...]，依開始時間排序"""
+        return self.conn.execute(
+            "SELECT content_hash, path, kind, status, error FROM inputs ORDER BY started"
+        ).fetchall()
+
+
+class Job:
+    """單一輸入在各階段之間傳遞的狀態 (需可 pickle，供 process pool 使用)"""
+
+    def __init__(self, path, kind, content_hash, output_dir, options):
+        self.path = path
+        self.kind = kind
+        self.content_hash = content_hash
+        self.output_dir = output_dir
+        self.options = options
+        self.data = None  # 目前階段的中間結果 (Network 或 {圖層: GeoDataFrame})
+        self.outputs = {}  # 階段名稱 -> 輸出路徑
+        self.error = None
+
+    def __repr__(self):
+        return f"Job({os.path.basename(self.path)!r}, kind={self.kind!r}, hash={self.content_hash[:12]})"
+
+
+# ---- 各階段的工作 (模組層級函式，供 process pool 使用) ----
+
+def parse_stage(job):
+    """INP 經由 inp_cache 解析 (座標轉換也在此完成並一起快取)；SHP 直接從 ZIP 讀取各圖層"""
+    with span("pipeline.parse", file=os.path.basename(job.path), kind=job.kind):
+        if job.kind == "inp":
+            from inp_cache import cached_parse_inp_network
+            job.data = cached_parse_inp_network(job.path, reproject=True, cache_dir=job.options["cache_dir"],
+                                                mmap=False)
+        else:
+            from parse_shp import load_shapefiles
+            job.data = load_shapefiles(job.path, max_workers=1)
+    return job
+
+
+def reproject_stage(job):
+    """將 SHP 各圖層轉換為 WGS84 (回傳一般 dict，LayerCache 含 lock 無法 pickle)"""
+    with span("pipeline.reproject", file=os.path.basename(job.path)):
+        from parse_shp import LayerCache
+        layers = LayerCache(job.data)
+        job.data = {name: layers.get(name) for name in layers.names()}
+    return job
+
+
+def export_stage(job):
+    """INP 輸出 JSON (與選擇性的 viewer_bundle 資料包)；SHP 輸出各圖層檔案與合併後的單一檔案"""
+    with span("pipeline.export", file=os.path.basename(job.path), kind=job.kind):
+        os.makedirs(job.output_dir, exist_ok=True)
+        if job.kind == "inp":
+            from parse_inp import save_to_json
+            out_file = os.path.join(job.output_dir, "parsed_network.json")
+            save_to_json(job.data, out_file, indent=job.options["indent"])
+            job.outputs["export"] = [out_file]
+            if job.options["viewer_bundle"]:
+                from viewer_bundle import write_viewer_bundle
+                job.outputs["export"] += write_viewer_bundle(job.data, os.path.join(job.output_dir, "viewer_bundle"))
+        else:
+            from layer_export import EXTENSIONS
+            from parse_shp import LayerCache, merge_all_to_single_geojson, save_individual_geojson
+            fmt = job.options["shp_format"]
+            layers = LayerCache(job.data)  # 已是 WGS84，不會再轉換
+            layer_dir = os.path.join(job.output_dir, "layers")
+            merged = os.path.join(job.output_dir, "all_in_one" + EXTENSIONS[fmt])
+            save_individual_geojson(layers, layer_dir, fmt=fmt)
+            merge_all_to_single_geojson(layers, merged)
+            job.outputs["export"] = [layer_dir, merged]
+    return job
+
+
+def analysis_stage(job):
+    """
+    以 leak_engine 列出基本需水量偏高的節點，輸出摘要 JSON
+
+    單一 INP 只有一個時段，無法計算變化量，因此輸出的是需水量異常 (demand_outlier) 報告而非漏水判斷。
+    """
+    with span("pipeline.analysis", file=os.path.basename(job.path)):
+        from leak_engine import detect_demand_outliers
+        report = detect_demand_outliers(job.data, factor=job.options["factor"])
+        out_file = os.path.join(job.output_dir, "demand_outliers.json")
+        with open(out_file, "w", encoding="utf-8") as f:
+            json.dump(report.summary(top=job.options["top"]), f, ensure_ascii=False, indent=2)
+        job.outputs["analysis"] = [out_file]
+    return job
+
+
+STAGE_FUNCS = {
+    "parse": (parse_stage, ("inp", "shp")),
+    "reproject": (reproject_stage, ("shp",)),
+    "export": (export_stage, ("inp", "shp")),
+    "analysis": (analysis_stage, ("inp",)),
+}
+
+
+class Stage:
+    """
+    一個處理階段：由專屬的 dispatcher thread 從 inbox 取出工作送進 pool
+
+    同時執行的工作數不超過 workers；完成的結果以阻塞的 put 送往下游佇列，
+    下游滿了就不再取新的工作，壓力因此一路傳回上游。
+    """
+
+    def __init__(self, name, func, kinds, workers=1, executor="thread", queue_size=4):
+        """
+        :param name: 階段名稱
+        :param func: 處理單一 Job 的函式 (process pool 時必須是模組層級函式)
+        :param kinds: 需要此階段的輸入種類，其他種類直接轉送下游
+        :param workers: pool 大小
+        :param executor: "thread" 或 "process"
+        :param queue_size: inbox 的容量
+        """
+        self.name = name
+        self.func = func
+        self.kinds = kinds
+        self.workers = max(int(workers), 1)
+        self.executor = executor
+        self.inbox = queue.Queue(maxsize=max(int(queue_size), 1))
+        self.outbox = None
+        self.errors = None
+        self.processed = 0
+        self._thread = None
+
+    def start(self, outbox, errors):
+        """
+        :param outbox: 下游佇列 (下一個階段的 inbox 或最終結果佇列)
+        :param errors: 失敗的 Job 送往此佇列
+        """
+        self.outbox = outbox
+        self.errors = errors
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _fail(self, job, error):
+        job.data = None
+        job.error = f"{self.name}: {type(error).__name__}: {error}"
+        self.errors.put(job)
+
+    def _forward(self, future, job):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._fail(job, e)
+            return
+        self.processed += 1
+        self.outbox.put(result)
+
+    def _drain(self, pending, return_when, timeout=None):
+        done, _ = wait(pending, timeout=timeout, return_when=return_when)
+        for future in done:
+            self._forward(future, pending.pop(future))
+
+    def _run(self):
+        pool_cls = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        pending = {}  # future -> Job
+        try:
+            with pool_cls(max_workers=self.workers) as pool:
+                while True:
+                    try:
+                        # 有工作執行中時定期醒來，把已完成的結果先送往下游
+                        job = self.inbox.get(timeout=0.05) if pending else self.inbox.get()
+                    except queue.Empty:
+                        self._drain(pending, FIRST_COMPLETED, timeout=0)
+                        continue
+                    if job is _STOP:
+                        break
+                    if job.kind not in self.kinds:
+                        self.outbox.put(job)
+                        continue
+                    while len(pending) >= self.workers:
+                        self._drain(pending, FIRST_COMPLETED)
+                    try:
+                        pending[pool.submit(self.func, job)] = job
+                    except Exception as e:
+                        # pool 已無法使用 (例如 worker process 被強制結束而 BrokenProcessPool)：
+                        # 這個工作記為失敗，繼續消化 inbox 直到 _STOP
+                        self._fail(job, e)
+                if pending:
+                    self._drain(pending, ALL_COMPLETED)
+        finally:
+            # 無論如何都要通知下游，否則 Pipeline.wait() 會一直等下去
+            self.outbox.put(_STOP)
+
+
+def scan_inputs(input_dir, settle=2.0):
+    """
+    列出輸入目錄中的 INP 檔與 ZIP 檔 (依檔名排序)
+
+    :param settle: 最後修改時間在 settle 秒內的檔案視為仍在寫入，暫不處理
+    :return: [(路徑, kind, os.stat_result), ...]
+    """
+    now = time.time()
+    found = []
+    for entry in sorted(os.scandir(input_dir), key=lambda e: e.name):
+        kind = INPUT_KINDS.get(os.path.splitext(entry.name)[1].lower())
+        if kind is None or not entry.is_file():
+            continue
+        stat = entry.stat()
+        if now - stat.st_mtime < settle:
+            continue
+        found.append((entry.path, kind, stat))
+    return found
+
+
+class Pipeline:
+    """
+    串接各階段並以 manifest 略過已處理的輸入
+
+    使用方式：
+        with Pipeline(output_dir="out", analysis=True) as pipeline:
+            pipeline.run_once("drop_dir")
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, manifest_path=DEFAULT_MANIFEST_PATH, analysis=False,
+                 workers=None, executors=None, queue_size=4, options=None):
+        """
+        :param output_dir: 輸出根目錄 (每個輸入一個 <檔名>-<雜湊前 12 碼> 子目錄)
+        :param manifest_path: manifest SQLite 檔案路徑
+        :param analysis: 是否執行 analysis 階段
+        :param workers: {階段名稱: pool 大小}，未指定的為 1
+        :param executors: {階段名稱: "thread" 或 "process"}，未指定的為 "thread"
+        :param queue_size: 各階段 inbox 的容量
+        :param options: 傳給各階段的設定 (cache_dir、indent、shp_format、viewer_bundle、factor、top)
+        """
+        self.output_dir = output_dir
+        self.manifest = Manifest(manifest_path)
+        self.options = dict({"cache_dir": DEFAULT_CACHE_DIR, "indent": 4, "shp_format": "geojson",
+                             "viewer_bundle": False, "factor": DEFAULT_FACTOR, "top": 50}, **(options or {}))
+        workers = workers or {}
+        executors = executors or {}
+        names = [name for name in STAGES if analysis or name != "analysis"]
+        self.stages = [Stage(name, *STAGE_FUNCS[name], workers=workers.get(name, 1),
+                             executor=executors.get(name, "thread"), queue_size=queue_size) for name in names]
+        self.results = queue.Queue()  # 最後一個階段的輸出與各階段的失敗 (不設上限，由主 thread 消化)
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "skipped": 0}
+        self._seen = {}  # 路徑 -> (大小, 修改時間)，避免每次掃描都重新計算雜湊
+        self._in_flight = {}  # content_hash -> Job
+        self._started = False
+
+    def close(self):
+        if self._started:
+            self.stages[0].inbox.put(_STOP)
+            self._collect(timeout=None)
+            for stage in self.stages:
+                stage.join()
+            self._started = False
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self):
+        for stage, downstream in zip(self.stages, self.stages[1:]):
+            stage.start(downstream.inbox, self.results)
+        self.stages[-1].start(self.results, self.results)
+        self._started = True
+
+    def _finish(self, job):
+        job.data = None
+        self._in_flight.pop(job.content_hash, None)
+        self.manifest.finish(job)
+        if job.error:
+            self.counts["failed"] += 1
+            print(f"[ERROR] {job.path}: {job.error}")
+        else:
+            self.counts["done"] += 1
+            print(f"[INFO] done {job.path} -> {job.output_dir}")
+
+    def _collect(self, timeout=0):
+        """
+        消化結果佇列
+
+        :param timeout: 最多等待第一筆結果的秒數；0 表示不等待，None 表示等到最後一個階段結束
+        """
+        block = timeout != 0
+        while True:
+            try:
+                item = self.results.get(timeout=timeout) if block else self.results.get_nowait()
+            except queue.Empty:
+                return
+            if item is _STOP:
+                return
+            self._finish(item)
+            if timeout is not None:
+                block = False
+
+    def submit(self, path, kind):
+        """
+        送出一個輸入 (內容已處理過或處理中則略過)；第一個階段的佇列滿時會阻塞
+
+        :return: Job 或 None (略過時)
+        """
+        content_hash = file_sha256(path)
+        if content_hash in self._in_flight or self.manifest.status(content_hash) == "done":
+            self.counts["skipped"] += 1
+            return None
+        stem = os.path.splitext(os.path.basename(path))[0]
+        job = Job(os.path.abspath(path), kind, content_hash,
+                  os.path.join(self.output_dir, f"{stem}-{content_hash[:12]}"), self.options)
+        if not self._started:
+            self._start()
+        self.manifest.start(job)
+        self._in_flight[content_hash] = job
+        self.counts["submitted"] += 1
+        inbox = self.stages[0].inbox
+        while True:
+            try:
+                inbox.put(job, timeout=0.1)
+                break
+            except queue.Full:
+                self._collect()  # 等待期間持續寫入已完成的結果
+        self._collect()
+        return job
+
+    def scan(self, input_dir, settle=2.0):
+        """掃描一次輸入目錄並送出新的 (或內容已變更的) 檔案，回傳送出的 Job 數"""
+        submitted = 0
+        for path, kind, stat in scan_inputs(input_dir, settle):
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(path) == signature:
+                continue
+            self._seen[path] = signature
+            if self.submit(path, kind) is not None:
+                submitted += 1
+        return submitted
+
+    def wait(self):
+        """等待所有已送出的工作完成"""
+        while self._in_flight:
+            self._collect(timeout=0.1)
+
+    def run_once(self, input_dir, settle=0.0):
+        """處理目錄中目前所有的輸入後返回"""
+        self.scan(input_dir, settle)
+        self.wait()
+        return dict(self.counts)
+
+    def watch(self, input_dir, interval=5.0, settle=2.0):
+        """持續監看輸入目錄 (Ctrl+C 結束，會等待處理中的工作完成)"""
+        print(f"[INFO] watching {input_dir} (every {interval:g} s)")
+        try:
+            while True:
+                self.scan(input_dir, settle)
+                deadline = time.time() + interval
+                while time.time() < deadline:
+                    self._collect(timeout=min(0.5, max(deadline - time.time(), 0.01)))
+        except KeyboardInterrupt:
+            print("[INFO] stopping, waiting for running jobs...")
+        self.wait()
+        return dict(self.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="放置 INP 檔與 SHP 壓縮檔的目錄")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH, help="manifest SQLite 檔案路徑")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="inp_cache 快取目錄")
+    parser.add_argument("--watch", action="store_true", help="持續監看目錄，而不是處理一次就結束")
+    parser.add_argument("--interval", type=float, default=5.0, help="監看時的掃描間隔 (秒)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="監看時，修改時間在此秒數內的檔案視為仍在寫入而暫不處理")
+    parser.add_argument("--queue-size", type=int, default=4, help="各階段佇列的容量")
+    parser.add_argument("--analysis", action="store_true",
+                        help="INP 另外以 leak_engine 列出基本需水量偏高的節點 (demand_outliers.json)")
+    parser.add_argument("--factor", type=float, default=DEFAULT_FACTOR, help="analysis 中超過平均值幾倍視為異常")
+    parser.add_argument("--shp-format", default="geojson", choices=["geojson", "geojsonl", "fgb", "parquet"])
+    parser.add_argument("--indent", type=int, default=4, help="INP JSON 縮排，負數表示緊湊格式")
+    parser.add_argument("--viewer-bundle", action="store_true",
+                        help="INP 另外輸出給 readinpmap.html 載入的二進位資料包 (viewer_bundle.py)")
+    for name in STAGES:
+        parser.add_argument(f"--{name}-workers", type=int, default=1, help=f"{name} 階段的 pool 大小")
+        parser.add_argument(f"--{name}-executor", default="thread", choices=["thread", "process"])
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        print(f"[ERROR] 找不到輸入目錄: {args.input_dir}")
+        return
+
+    options = {"cache_dir": args.cache_dir, "indent": args.indent if args.indent >= 0 else None,
+               "shp_format": args.shp_format, "viewer_bundle": args.viewer_bundle, "factor": args.factor}
+    workers = {name: getattr(args, f"{name}_workers") for name in STAGES}
+    executors = {name: getattr(args, f"{name}_executor") for name in STAGES}
+    with Pipeline(args.output_dir, args.manifest, args.analysis, workers, executors, args.queue_size,
+                  options) as pipeline:
+        if args.watch:
+            counts = pipeline.watch(args.input_dir, args.interval, args.settle)
+        else:
+            counts = pipeline.run_once(args.input_dir)
+    print(f"[INFO] submitted {counts['submitted']}, done {counts['done']}, failed {counts['failed']}, "
+          f"skipped {counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
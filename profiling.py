@@ -0,0 +1,256 @@
+"""
+各流程階段的計時 (span) 與選擇性的 cProfile 分析
+
+預設停用；停用時 span() 直接回傳共用的空 context manager，幾乎沒有額外負擔。
+
+啟用方式：
+    - 環境變數：LEAK_PROFILE=trace.json (程式結束時輸出)，
+      LEAK_PROFILE_FORMAT=chrome|json (預設依檔名判斷，含 "trace" 時為 Chrome trace)，
+      LEAK_PROFILE_STAGE=parse_inp (以 cProfile 分析指定名稱的 span，
+      結果存成與輸出檔同目錄的 <名稱>.<pid>.<序號>.prof，可用 snakeviz / pstats 查看)
+    - 程式：profiling.enable(profile_stage="save_to_json")
+
+使用方式：
+    with span("parse_inp", file=path):
+        ...
+
+    @traced("download_file")
+    def download_file(...):
+        ...
+
+輸出：
+    export_json(path)          # {"spans": [...], "summary": {名稱: {count, total, mean, max}}}
+    export_chrome_trace(path)  # chrome://tracing 或 https://ui.perfetto.dev 可開啟
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_profile_stage = None
+_profile_dir = "."
+_spans = []  # 已結束的 span (dict)
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_parent = contextvars.ContextVar("profiling_parent", default=None)
+
+
+class _NoopSpan:
+    """停用時使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """一段計時區間；以 context manager 使用，可用 set() 補上屬性"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self._token = None
+        self._profiler = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _parent.get()
+        self.parent = parent.name if parent is not None else None
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self._token = _parent.set(self)
+        if _profile_stage == self.name:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.disable()
+            path = os.path.join(_profile_dir, f"{self.name}.{os.getpid()}.{len(_spans)}.prof")
+            self._profiler.dump_stats(path)
+            self.attrs["profile"] = path
+        _parent.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _append(self.name, self.start, end - self.start, self.attrs, self.parent, self.depth)
+        return False
+
+
+def _append(name, start, duration, attrs, parent=None, depth=0):
+    record = {
+        "name": name,
+        "start": start - _origin,
+        "duration": duration,
+        "parent": parent,
+        "depth": depth,
+        "thread": threading.get_ident(),
+        "attrs": attrs,
+    }
+    with _lock:
+        _spans.append(record)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(profile_stage=None, profile_dir="."):
+    """
+    開始記錄 span
+
+    :param profile_stage: 以 cProfile 分析此名稱的 span (None 表示不分析)
+    :param profile_dir: .prof 檔輸出目錄
+    """
+    global _enabled, _profile_stage, _profile_dir
+    _enabled = True
+    _profile_stage = profile_stage
+    _profile_dir = profile_dir
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """清除已記錄的 span"""
+    with _lock:
+        _spans.clear()
+
+
+def span(name, **attrs):
+    """
+    建立計時區間 (停用時回傳共用的空 context manager)
+
+    :param name: 階段名稱
+    :param attrs: 附加屬性 (會寫入輸出)
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def record(name, start, duration, **attrs):
+    """
+    直接記錄一段已知起訖的區間 (例如輪詢時觀察到的 Run 狀態)
+
+    :param start: time.perf_counter() 起點
+    :param duration: 秒數
+    """
+    if _enabled:
+        parent = _parent.get()
+        _append(name, start, duration, attrs, parent.name if parent is not None else None,
+                parent.depth + 1 if parent is not None else 0)
+
+
+def traced(name=None):
+    """函式裝飾器：每次呼叫包成一個 span (名稱預設為函式名稱)"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(label, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def spans():
+    """已記錄的 span 列表 (複本)"""
+    with _lock:
+        return list(_spans)
+
+
+def summary():
+    """
+    依名稱彙總
+
+    :return: {名稱: {"count", "total", "mean", "max"}}，依 total 由大到小排序
+    """
+    result = {}
+    for s in spans():
+        item = result.setdefault(s["name"], {"count": 0, "total": 0.0, "max": 0.0})
+        item["count"] += 1
+        item["total"] += s["duration"]
+        item["max"] = max(item["max"], s["duration"])
+    for item in result.values():
+        item["mean"] = item["total"] / item["count"]
+    return dict(sorted(result.items(), key=lambda kv: kv[1]["total"], reverse=True))
+
+
+def print_summary():
+    for name, item in summary().items():
+        print(f"{name:36s} {item['count']:6d} x  total {item['total']:9.3f} s  "
+              f"mean {item['mean']:9.4f} s  max {item['max']:9.3f} s")
+
+
+def export_json(path):
+    """輸出所有 span 與彙總 (JSON)"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"spans": spans(), "summary": summary()}, f, ensure_ascii=False, indent=2, default=str)
+
+
+def export_chrome_trace(path):
+    """輸出 Chrome trace event 格式 (complete events，時間單位為微秒)"""
+    pid = os.getpid()
+    events = [{
+        "name": s["name"],
+        "cat": s["name"].split(".")[0],
+        "ph": "X",
+        "ts": s["start"] * 1e6,
+        "dur": s["duration"] * 1e6,
+        "pid": pid,
+        "tid": s["thread"],
+        "args": s["attrs"],
+    } for s in spans()]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+
+
+def export(path, fmt=None):
+    """
+    依格式輸出
+
+    :param fmt: "json" 或 "chrome"；None 時檔名含 "trace" 為 chrome，否則為 json
+    """
+    fmt = fmt or ("chrome" if "trace" in os.path.basename(path).lower() else "json")
+    if fmt == "chrome":
+        export_chrome_trace(path)
+    elif fmt == "json":
+        export_json(path)
+    else:
+        raise ValueError(f"未知的格式: {fmt}")
+
+
+def _enable_from_env():
+    path = os.getenv("LEAK_PROFILE")
+    if not path:
+        return
+    enable(os.getenv("LEAK_PROFILE_STAGE") or None, os.path.dirname(os.path.abspath(path)))
+    atexit.register(export, path, os.getenv("LEAK_PROFILE_FORMAT") or None)
+
+
+_enable_from_env()
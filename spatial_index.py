@@ -0,0 +1,508 @@
+import numpy as np
+
+from network_model import WGS84
+from parse_inp import TWD97_PROJ
+
+TWD97_EPSG = "EPSG:3826"
+_KEY_SHIFT = np.int64(1 << 32)
+_DIRECT_CHUNK = 1 << 20  # 直接比較時每批的 (查詢點 × 點) 數
+
+
+def _cell_key(cx, cy):
+    return cx.astype(np.int64) * _KEY_SHIFT + cy.astype(np.int64)
+
+
+def _expand_ranges(starts, ends):
+    """把多個 [start, end) 範圍展開成 (所屬範圍索引, 位置) 兩個陣列"""
+    counts = ends - starts
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    pos = starts[owner] + (np.arange(total) - offsets[owner])
+    return owner, pos
+
+
+class GridIndex:
+    """
+    均勻網格空間索引 (CSR)：每個項目依其 bbox 登記到所覆蓋的 cell
+
+    cell 鍵值排序後以 searchsorted 查詢，所有查詢都是 NumPy 向量化運算。
+    """
+
+    def __init__(self, minx, miny, maxx, maxy, cell_size=None):
+        self.minx, self.miny = np.asarray(minx, dtype=np.float64), np.asarray(miny, dtype=np.float64)
+        self.maxx, self.maxy = np.asarray(maxx, dtype=np.float64), np.asarray(maxy, dtype=np.float64)
+        n = len(self.minx)
+        if n:
+            self.bounds = (self.minx.min(), self.miny.min(), self.maxx.max(), self.maxy.max())
+        else:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+        if cell_size is None:
+            width, height = self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1]
+            extent = np.median(np.maximum(self.maxx - self.minx, self.maxy - self.miny)) if n else 0.0
+            # 平均每個 cell 約 2 個項目，且不小於項目的典型大小
+            cell_size = max(np.sqrt(max(width * height, 1.0) / max(n, 1) * 2), extent, 1e-9)
+        self.cell_size = float(cell_size)
+        self.origin = self.bounds[:2]
+
+        cx0, cy0 = self._cell(self.minx, self.miny)
+        cx1, cy1 = self._cell(self.maxx, self.maxy)
+        w, h = cx1 - cx0 + 1, cy1 - cy0 + 1
+        counts = w * h
+        item, local = _expand_ranges(np.zeros(n, dtype=np.int64), counts.astype(np.int64))
+        keys = _cell_key(cx0[item] + local % w[item], cy0[item] + local // w[item])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        self.items = item[order]
+        self.keys, self.starts = np.unique(keys, return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys))
+
+    def __len__(self):
+        return len(self.minx)
+
+    def _cell(self, x, y):
+        cx = np.floor((np.asarray(x) - self.origin[0]) / self.cell_size).astype(np.int64)
+        cy = np.floor((np.asarray(y) - self.origin[1]) / self.cell_size).astype(np.int64)
+        return cx, cy
+
+    def candidates_in_cells(self, cx, cy):
+        """
+        查詢多個 cell 中登記的項目
+
+        :return: (第幾個 cell, 項目索引) 兩個陣列
+        """
+        keys = _cell_key(np.asarray(cx), np.asarray(cy))
+        if len(self.keys) == 0 or len(keys) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[pos] == keys
+        starts = np.where(found, self.starts[pos], 0)
+        ends = np.where(found, self.ends[pos], 0)
+        owner, at = _expand_ranges(starts, ends)
+        return owner, self.items[at]
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """
+        回傳 bbox 與查詢範圍相交的項目索引 (已排序、不重複)
+        """
+        cx0, cy0 = self._cell(minx, miny)
+        cx1, cy1 = self._cell(maxx, maxy)
+        n_cells = (int(cx1) - int(cx0) + 1) * (int(cy1) - int(cy0) + 1)
+        if n_cells > len(self.keys):
+            cand = np.arange(len(self))  # 查詢範圍比索引還大時直接全掃
+        else:
+            gx, gy = np.meshgrid(np.arange(cx0, cx1 + 1), np.arange(cy0, cy1 + 1))
+            _, cand = self.candidates_in_cells(gx.ravel(), gy.ravel())
+            cand = np.unique(cand)
+        hit = ((self.minx[cand] <= maxx) & (self.maxx[cand] >= minx) &
+               (self.miny[cand] <= maxy) & (self.maxy[cand] >= miny))
+        return cand[hit]
+
+
+def _point_segment_distance(px, py, ax, ay, bx, by):
+    """點到線段的距離 (向量化)"""
+    dx, dy = bx - ax, by - ay
+    denom = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(denom > 0, ((px - ax) * dx + (py - ay) * dy) / denom, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _ring_cells(cx, cy, r, extent):
+    """
+    每個中心 cell 周圍 Chebyshev 距離恰為 r 的 cell，只保留落在 extent 內者
+
+    :param extent: (cx0, cy0, cx1, cy1) 含端點的 cell 範圍
+    :return: (所屬中心索引, cell x, cell y)
+    """
+    x0, y0, x1, y1 = extent
+    if r == 0:
+        inside = np.flatnonzero((cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1))
+        return inside, cx[inside], cy[inside]
+    owners, xs, ys = [], [], []
+    # 上下兩列含角落，左右兩行不含角落
+    for fixed, lo, hi, glo, ghi, row in ((cy - r, cx - r, cx + r, x0, x1, True),
+                                         (cy + r, cx - r, cx + r, x0, x1, True),
+                                         (cx - r, cy - r + 1, cy + r - 1, y0, y1, False),
+                                         (cx + r, cy - r + 1, cy + r - 1, y0, y1, False)):
+        flo, fhi = (y0, y1) if row else (x0, x1)
+        lo, hi = np.maximum(lo, glo), np.minimum(hi, ghi)
+        hi = np.where((fixed >= flo) & (fixed <= fhi), np.maximum(hi, lo - 1), lo - 1)
+        owner, pos = _expand_ranges(lo, hi + 1)
+        owners.append(owner)
+        xs.append(pos if row else fixed[owner])
+        ys.append(fixed[owner] if row else pos)
+    return np.concatenate(owners), np.concatenate(xs), np.concatenate(ys)
+
+
+class PointIndex:
+    """點資料 (節點、閥門、消防栓...) 的網格索引，座標單位為公尺"""
+
+    def __init__(self, xy, cell_size=None):
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.valid = np.flatnonzero(np.isfinite(xy).all(axis=1))  # 有座標的點
+        self.xy = xy
+        pts = xy[self.valid]
+        self.grid = GridIndex(pts[:, 0], pts[:, 1], pts[:, 0], pts[:, 1], cell_size)
+
+    def bbox(self, minx, miny, maxx, maxy):
+        """回傳 bbox 內的點索引"""
+        return self.valid[self.grid.query_bbox(minx, miny, maxx, maxy)]
+
+    def within(self, x, y, radius):
+        """
+        回傳距離 (x, y) 不超過 radius 的點
+
+        :return: (點索引, 距離)，依距離排序
+        """
+        idx = self.bbox(x - radius, y - radius, x + radius, y + radius)
+        dist = np.hypot(self.xy[idx, 0] - x, self.xy[idx, 1] - y)
+        keep = dist <= radius
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
+
+    def nearest(self, x, y, k=1, max_distance=np.inf):
+        """
+        k 個最近的點 (逐步擴大搜尋半徑)
+
+        :return: (點索引, 距離)，依距離排序
+        """
+        k = min(k, len(self.valid))
+        radius = self.grid.cell_size
+        x0, y0, x1, y1 = self.grid.bounds
+        limit = min(max_distance, np.hypot(max(x1 - x0, abs(x - x0), abs(x - x1)),
+                                           max(y1 - y0, abs(y - y0), abs(y - y1))) + radius)
+        while True:
+            r = min(radius, limit)
+            idx, dist = self.within(x, y, r)
+            if len(idx) >= k or r >= limit:
+                return idx[:k], dist[:k]
+            radius *= 2
+
+    def nearest_many(self, xy, max_distance):
+        """
+        對多個查詢點一次找出 max_distance 內最近的點 (全向量化，適合大量 join)
+
+        以查詢點所在的 cell 為中心逐圈 (ring) 向外搜尋：第 r 圈的點距離至少 (r - 1) 個 cell，
+        已找到更近點的查詢點即停止；圈數不超過 max_distance 與網格資料範圍，
+        一圈的 cell 數超過點數時改為與所有點直接比較。
+
+        :param xy: (n, 2) 查詢點
+        :param max_distance: 最大距離 (可為 np.inf)
+        :return: (點索引, 距離)；找不到時索引為 -1、距離為 inf
+        """
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        n = len(xy)
+        best_idx = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf)
+        ok = np.flatnonzero(np.isfinite(xy).all(axis=1))
+        if len(ok) == 0 or len(self.valid) == 0:
+            return best_idx, best_dist
+        grid = self.grid
+        cell = grid.cell_size
+        qcx, qcy = grid._cell(xy[ok, 0], xy[ok, 1])
+        gx0, gy0 = grid._cell(grid.bounds[0], grid.bounds[1])
+        gx1, gy1 = grid._cell(grid.bounds[2], grid.bounds[3])
+        extent = (int(gx0), int(gy0), int(gx1), int(gy1))
+        # 到網格資料範圍最近 / 最遠的圈數：範圍外的圈不會有候選點
+        near = np.maximum.reduce([gx0 - qcx, qcx - gx1, gy0 - qcy, qcy - gy1, np.zeros_like(qcx)])
+        far = np.maximum.reduce([qcx - gx0, gx1 - qcx, qcy - gy0, gy1 - qcy])
+        reach = int(min(np.ceil(max_distance / cell), far.max()))
+
+        active = np.arange(len(ok))
+        r = int(near.min())
+        while r <= reach:
+            done = (far[active] < r) | (best_dist[ok[active]] <= (r - 1) * cell)
+            active = active[~done]
+            if len(active) == 0:
+                break
+            r = max(r, int(near[active].min()))
+            if r > reach:
+                break
+            if 8 * r > len(self.valid):
+                # 一圈的 cell 數已超過點數 (點很稀疏)：剩下的查詢點直接與所有點比較
+                self._nearest_direct(xy, ok[active], best_idx, best_dist)
+                break
+            owner, cx, cy = _ring_cells(qcx[active], qcy[active], r, extent)
+            q, item = grid.candidates_in_cells(cx, cy)
+            r += 1
+            if len(q) == 0:
+                continue
+            qi = ok[active[owner[q]]]
+            pts = self.valid[item]
+            dist = np.hypot(self.xy[pts, 0] - xy[qi, 0], self.xy[pts, 1] - xy[qi, 1])
+            # 依距離由大到小寫入，同一查詢點最後留下最小者
+            order = np.argsort(-dist, kind="stable")
+            qi, pts, dist = qi[order], pts[order], dist[order]
+            better = dist < best_dist[qi]
+            best_dist[qi[better]] = dist[better]
+            best_idx[qi[better]] = pts[better]
+        miss = best_dist > max_distance
+        best_idx[miss], best_dist[miss] = -1, np.inf
+        return best_idx, best_dist
+
+    def _nearest_direct(self, xy, query, best_idx, best_dist):
+        """對 query 中的查詢點與所有點逐一比較，結果寫回 best_idx / best_dist"""
+        pts = self.xy[self.valid]
+        step = max(1, _DIRECT_CHUNK // len(pts))
+        for start in range(0, len(query), step):
+            qi = query[start:start + step]
+            dist = np.hypot(pts[:, 0] - xy[qi, 0, None], pts[:, 1] - xy[qi, 1, None])
+            j = dist.argmin(axis=1)
+            dist = dist[np.arange(len(qi)), j]
+            better = dist < best_dist[qi]
+            best_dist[qi[better]] = dist[better]
+            best_idx[qi[better]] = self.valid[j[better]]
+
+
+class SegmentIndex:
+    """折線 (管線) 的網格索引：每個線段登記其所屬的折線編號 owner"""
+
+    def __init__(self, a, b, owner, cell_size=None):
+        self.a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+        self.b = np.asarray(b, dtype=np.float64).reshape(-1, 2)
+        self.owner = np.asarray(owner, dtype=np.int64)
+        self.grid = GridIndex(np.minimum(self.a[:, 0], self.b[:, 0]), np.minimum(self.a[:, 1], self.b[:, 1]),
+                              np.maximum(self.a[:, 0], self.b[:, 0]), np.maximum(self.a[:, 1], self.b[:, 1]),
+                              cell_size)
+
+    @classmethod
+    def from_polylines(cls, xy, offsets, cell_size=None):
+        """
+        由 CSR 格式的折線建立索引：第 i 條折線為 xy[offsets[i]:offsets[i + 1]]
+        """
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        counts = np.diff(offsets)
+        point_owner = np.repeat(np.arange(len(counts)), counts)
+        same = point_owner[:-1] == point_owner[1:]
+        finite = np.isfinite(xy).all(axis=1)
+        keep = same & finite[:-1] & finite[1:]
+        return cls(xy[:-1][keep], xy[1:][keep], point_owner[:-1][keep], cell_size)
+
+    def _distances(self, seg, x, y):
+        return _point_segment_distance(x, y, self.a[seg, 0], self.a[seg, 1], self.b[seg, 0], self.b[seg, 1])
+
+    def _per_owner(self, seg, dist):
+        """同一條折線只留下最短距離，依距離排序"""
+        order = np.lexsort((dist, self.owner[seg]))
+        owners, first = np.unique(self.owner[seg][order], return_index=True)
+        dist = dist[order][first]
+        by_dist = np.argsort(dist, kind="stable")
+        return owners[by_dist], dist[by_dist]
+
+    def bbox(self, minx, miny, maxx, maxy):
+        """回傳與 bbox 相交 (以線段 bbox 判斷) 的折線編號"""
+        return np.unique(self.owner[self.grid.query_bbox(minx, miny, maxx, maxy)])
+
+    def within(self, x, y, radius):
+        """
+        回傳距離 (x, y) 不超過 radius 的折線
+
+        :return: (折線編號, 最短距離)，依距離排序
+        """
+        seg = self.grid.query_bbox(x - radius, y - radius, x + radius, y + radius)
+        dist = self._distances(seg, x, y)
+        keep = dist <= radius
+        return self._per_owner(seg[keep], dist[keep])
+
+    def nearest(self, x, y, k=1, max_distance=np.inf):
+        """
+        k 條最近的折線
+
+        :return: (折線編號, 最短距離)
+        """
+        radius = self.grid.cell_size
+        x0, y0, x1, y1 = self.grid.bounds
+        limit = min(max_distance, np.hypot(max(x1 - x0, abs(x - x0), abs(x - x1)),
+                                           max(y1 - y0, abs(y - y0), abs(y - y1))) + radius)
+        while True:
+            r = min(radius, limit)
+            owners, dist = self.within(x, y, r)
+            if len(owners) >= k or r >= limit:
+                return owners[:k], dist[:k]
+            radius *= 2
+
+
+class NetworkSpatialIndex:
+    """
+    INP 管網 (network_model.Network) 的空間索引：節點以 PointIndex、管線折線以 SegmentIndex 建立
+
+    內部一律使用 TWD97 公尺座標，距離單位為公尺；查詢座標使用 Network 本身的座標系統
+    (WGS84 時為 lng, lat)。
+    """
+
+    def __init__(self, network, cell_size=None):
+        self.network = network
+        self.cell_size = cell_size
+        if network.crs == WGS84:
+            from pyproj import Transformer
+            self._to_metric = Transformer.from_crs("EPSG:4326", TWD97_PROJ, always_xy=True)
+        else:
+            self._to_metric = None
+        self.node_xy = self.to_metric(network.node_xy)
+        vertex_xy = self.to_metric(network.vertex_xy)
+        self.nodes = PointIndex(self.node_xy, cell_size)
+
+        # 每條管線的折線 = 起點節點 + 彎曲點 + 終點節點
+        counts = np.diff(network.vertex_offsets) + 2
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        line_xy = np.empty((int(offsets[-1]), 2))
+        line_xy[offsets[:-1]] = self.node_xy[network.pipe_start]
+        line_xy[offsets[1:] - 1] = self.node_xy[network.pipe_end]
+        owner = np.repeat(np.arange(network.n_pipes), counts - 2)
+        local = np.arange(len(owner)) - np.repeat(network.vertex_offsets[:-1], counts - 2)
+        line_xy[offsets[:-1][owner] + 1 + local] = vertex_xy
+        self.pipe_offsets = offsets
+        self.pipe_xy = line_xy
+        self.pipes = SegmentIndex.from_polylines(line_xy, offsets, cell_size)
+
+    def to_metric(self, xy):
+        """將 Network 座標轉為 TWD97 公尺座標"""
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        if self._to_metric is None or len(xy) == 0:
+            return xy.copy()
+        x, y = self._to_metric.transform(xy[:, 0], xy[:, 1], errcheck=False)
+        return np.column_stack((x, y))
+
+    def apply_diff(self, diff):
+        """
+        套用 inp_incremental.NetworkDiff：只有屬性變動時沿用現有索引，座標或拓撲變動時才重建
+
+        :param diff: NetworkDiff (diff.old 應為此索引目前的 Network)
+        :return: 對應 diff.new 的 NetworkSpatialIndex (可能是自己)
+        """
+        if not diff.geometry_changed and diff.same_order:
+            self.network = diff.new
+            return self
+        return NetworkSpatialIndex(diff.new, self.cell_size)
+
+    def _point(self, where):
+        """where 可以是節點 ID 或 Network 座標 (x, y)"""
+        if isinstance(where, str):
+            return self.node_xy[self.network.node_index[where]]
+        return self.to_metric([where])[0]
+
+    def _bbox(self, bbox):
+        corners = self.to_metric([(bbox[0], bbox[1]), (bbox[2], bbox[3]), (bbox[0], bbox[3]), (bbox[2], bbox[1])])
+        return corners[:, 0].min(), corners[:, 1].min(), corners[:, 0].max(), corners[:, 1].max()
+
+    def nodes_in_bbox(self, bbox):
+        """bbox = (minx, miny, maxx, maxy)，Network 座標；回傳節點 ID"""
+        return self.network.node_ids[self.nodes.bbox(*self._bbox(bbox))].tolist()
+
+    def pipes_in_bbox(self, bbox):
+        """bbox = (minx, miny, maxx, maxy)，Network 座標；回傳管線 ID"""
+        return self.network.pipe_ids[self.pipes.bbox(*self._bbox(bbox))].tolist()
+
+    def nodes_within(self, where, radius):
+        """距離 where (節點 ID 或座標) radius 公尺內的節點：[(節點 ID, 距離), ...]"""
+        idx, dist = self.nodes.within(*self._point(where), radius)
+        return list(zip(self.network.node_ids[idx].tolist(), dist.tolist()))
+
+    def pipes_within(self, where, radius):
+        """距離 where (節點 ID 或座標) radius 公尺內的管線：[(管線 ID, 距離), ...]"""
+        idx, dist = self.pipes.within(*self._point(where), radius)
+        return list(zip(self.network.pipe_ids[idx].tolist(), dist.tolist()))
+
+    def nearest_nodes(self, where, k=1):
+        """k 個最近的節點：[(節點 ID, 距離), ...]"""
+        idx, dist = self.nodes.nearest(*self._point(where), k)
+        return list(zip(self.network.node_ids[idx].tolist(), dist.tolist()))
+
+    def nearest_pipes(self, where, k=1):
+        """k 條最近的管線：[(管線 ID, 距離), ...]"""
+        idx, dist = self.pipes.nearest(*self._point(where), k)
+        return list(zip(self.network.pipe_ids[idx].tolist(), dist.tolist()))
+
+    def features_near_pipe(self, pipe_id, layer, radius):
+        """
+        與某條管線距離 radius 公尺內的圖層點 (例如可隔離此管線的閥門)
+
+        :param pipe_id: 管線 ID
+        :param layer: LayerSpatialIndex (點圖層)
+        :param radius: 距離 (公尺)
+        :return: [(圖層列索引, 距離), ...]，依距離排序 (圖層沒有點時為空列表)
+        """
+        if layer.points is None:
+            return []
+        i = self.network.pipe_index[pipe_id]
+        line = self.pipe_xy[self.pipe_offsets[i]:self.pipe_offsets[i + 1]]
+        line = line[np.isfinite(line).all(axis=1)]
+        if len(line) == 0:
+            return []
+        cand = layer.points.bbox(line[:, 0].min() - radius, line[:, 1].min() - radius,
+                                 line[:, 0].max() + radius, line[:, 1].max() + radius)
+        if len(line) == 1:
+            dist = np.hypot(layer.points.xy[cand, 0] - line[0, 0], layer.points.xy[cand, 1] - line[0, 1])
+        else:
+            px, py = layer.points.xy[cand, 0][:, None], layer.points.xy[cand, 1][:, None]
+            dist = _point_segment_distance(px, py, line[:-1, 0], line[:-1, 1], line[1:, 0], line[1:, 1]).min(axis=1)
+        keep = dist <= radius
+        rows, dist = layer.row[cand[keep]], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return list(zip(rows[order].tolist(), dist[order].tolist()))
+
+
+class LayerSpatialIndex:
+    """
+    SHP 圖層 (GeoDataFrame) 的空間索引，座標先轉成 TWD97 公尺
+
+    點圖層 (閥門、消防栓、人孔) 建立 points；線圖層 (管線) 建立 lines。
+    row 陣列記錄每個點 / 折線對應到 GeoDataFrame 的第幾列。
+    """
+
+    def __init__(self, gdf, cell_size=None):
+        import shapely
+        from parse_shp import reproject_layer
+
+        gdf = reproject_layer(gdf, TWD97_EPSG)
+        geoms = np.asarray(gdf.geometry.values)
+        parts, part_row = shapely.get_parts(geoms, return_index=True)
+        is_point = shapely.get_type_id(parts) == 0
+        self.gdf = gdf
+        self.points = self.lines = None
+
+        coords, idx = shapely.get_coordinates(parts[is_point], return_index=True)
+        self.row = part_row[is_point][idx]
+        if len(coords):
+            self.points = PointIndex(coords, cell_size)
+
+        lines = parts[~is_point]
+        if len(lines):
+            # 面圖層取外框，統一以折線處理
+            lines = np.where(shapely.get_type_id(lines) == 3, shapely.get_exterior_ring(lines), lines)
+            coords, idx = shapely.get_coordinates(lines, return_index=True)
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(idx, minlength=len(lines)))))
+            self.line_row = part_row[~is_point]
+            self.lines = SegmentIndex.from_polylines(coords, offsets, cell_size)
+
+    def within(self, x, y, radius):
+        """距離 TWD97 座標 (x, y) radius 公尺內的圖層列：[(列索引, 距離), ...]"""
+        result = []
+        if self.points is not None:
+            idx, dist = self.points.within(x, y, radius)
+            result += list(zip(self.row[idx].tolist(), dist.tolist()))
+        if self.lines is not None:
+            idx, dist = self.lines.within(x, y, radius)
+            result += list(zip(self.line_row[idx].tolist(), dist.tolist()))
+        return sorted(result, key=lambda r: r[1])
+
+
+def join_nodes_to_layer(network_index, layer, max_distance):
+    """
+    將 INP 節點對應到 max_distance 公尺內最近的 SHP 點 (例如閥門、消防栓)
+
+    :param network_index: NetworkSpatialIndex
+    :param layer: LayerSpatialIndex (點圖層)
+    :param max_distance: 最大距離 (公尺)
+    :return: [(節點 ID, 圖層列索引, 距離), ...]，只包含有對應到的節點
+    """
+    if layer.points is None:
+        return []
+    idx, dist = layer.points.nearest_many(network_index.node_xy, max_distance)
+    hit = np.flatnonzero(idx >= 0)
+    return list(zip(network_index.network.node_ids[hit].tolist(),
+                    layer.row[idx[hit]].tolist(), dist[hit].tolist()))
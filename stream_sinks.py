@@ -0,0 +1,247 @@
+"""
+Assistant 串流事件的緩衝輸出層
+
+EventHandler 不再對每個 delta 各自 print(flush=True)，而是把事件交給 StreamBuffer：
+連續的同類 delta 會合併成一筆紀錄，累積超過 flush_interval 秒或 max_chars 字元時才一次寫到各個 sink。
+
+Sink：
+    - TerminalSink：輸出到終端機 (依 verbosity 過濾)
+    - JsonlSink：每筆紀錄一行 JSON，保留事件時間，方便事後分析
+    - MemorySink：保存在記憶體中 (測試 / notebook 使用)
+
+每筆紀錄為 dict：{"event", "level", "t" (距串流開始秒數), ...}；合併的 delta 另有
+"text"、"deltas" (合併數量) 與 "t_end"。串流結束時會輸出一筆 "end" 紀錄，內含
+time-to-first-token 與總延遲等統計。
+"""
+import json
+import sys
+import time
+
+# verbosity 等級：紀錄的 level 小於等於 sink 的 verbosity 才會輸出
+QUIET = 0  # 只有錯誤與結束摘要
+NORMAL = 1  # 回覆文字、程式碼與輸出
+DEBUG = 2  # 所有事件 (run step、delta 數量等)
+LEVELS = {"quiet": QUIET, "normal": NORMAL, "debug": DEBUG}
+
+# 算作「第一個 token」的事件
+TOKEN_EVENTS = ("text_delta", "code_input")
+
+
+def _level(verbosity):
+    return LEVELS[verbosity] if isinstance(verbosity, str) else int(verbosity)
+
+
+class TerminalSink:
+    """依事件種類格式化後寫到終端機，每次 flush 只呼叫一次 write / flush"""
+
+    FORMATS = {
+        "text_created": "\nassistant > ",
+        "text_delta": "{text}",
+        "tool_call_created": "\nassistant > {type}\n",
+        "code_input": "{text}",
+        "code_output": "\n\noutput >\n{text}\n",
+        "image_file": "\nDEBUG: Detected image file (File ID: {file_id})\n",
+        "image_saved": "\n圖片已儲存: {path}\n",
+        "run_step_created": "DEBUG: Run step created: {type}\n",
+        "run_step_delta": "DEBUG: Run step delta x{deltas}\n",
+        "error": "\nERROR: {text}\n",
+        "end": "\n(stream {total:.3f}s, first token {ttft}, {n_events} events, {n_flushes} flushes)\n",
+    }
+
+    def __init__(self, stream=None, verbosity=NORMAL):
+        """
+        :param stream: 輸出串流，None 時為 sys.stdout
+        :param verbosity: QUIET / NORMAL / DEBUG 或 "quiet" / "normal" / "debug"
+        """
+        self.stream = stream or sys.stdout
+        self.verbosity = _level(verbosity)
+
+    def render(self, record):
+        fmt = self.FORMATS.get(record["event"])
+        if fmt is None:
+            return f"DEBUG: {record['event']}\n"
+        if record["event"] == "end":
+            ttft = record.get("ttft")
+            return fmt.format(**dict(record, ttft=f"{ttft:.3f}s" if ttft is not None else "-"))
+        return fmt.format(**record)
+
+    def write(self, records):
+        text = "".join(self.render(r) for r in records if r["level"] <= self.verbosity)
+        if text:
+            self.stream.write(text)
+            self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """每筆紀錄寫成一行 JSON"""
+
+    def __init__(self, path, verbosity=DEBUG):
+        """
+        :param path: 輸出檔案路徑 (附加寫入)
+        :param verbosity: 寫入的紀錄等級上限
+        """
+        self.path = path
+        self.verbosity = _level(verbosity)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        lines = [json.dumps(r, ensure_ascii=False, default=str) for r in records if r["level"] <= self.verbosity]
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class MemorySink:
+    """把紀錄保存在 records 列表中"""
+
+    def __init__(self, verbosity=DEBUG):
+        self.verbosity = _level(verbosity)
+        self.records = []
+        self.n_writes = 0
+
+    def write(self, records):
+        self.records.extend(r for r in records if r["level"] <= self.verbosity)
+        self.n_writes += 1
+
+    def close(self):
+        pass
+
+    def text(self, event="text_delta"):
+        """合併某類事件的所有文字"""
+        return "".join(r.get("text", "") for r in self.records if r["event"] == event)
+
+
+class StreamBuffer:
+    """
+    合併連續 delta 並依時間 / 大小批次寫到多個 sink，同時記錄事件時間
+
+    time-based flush 只在有新事件進來時檢查 (不另開執行緒)；串流結束時呼叫 close() 寫出剩餘內容。
+    """
+
+    def __init__(self, sinks, flush_interval=0.05, max_chars=4096, clock=time.perf_counter):
+        """
+        :param sinks: sink 列表 (需有 write(records) 與 close())
+        :param flush_interval: 距上次 flush 超過此秒數就 flush
+        :param max_chars: 緩衝文字超過此字元數就 flush
+        :param clock: 計時函式 (測試時可替換)
+        """
+        self.sinks = list(sinks)
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self.clock = clock
+        self.start = clock()
+        self._records = []
+        self._pending = None  # 正在合併的 delta 紀錄
+        self._pending_parts = []
+        self._chars = 0
+        self._last_flush = self.start
+        self.first_event = None
+        self.first_token = None
+        self.counts = {}
+        self.n_flushes = 0
+        self.closed = False
+
+    def _now(self):
+        return self.clock() - self.start
+
+    def _close_pending(self):
+        if self._pending is not None:
+            self._pending["text"] = "".join(self._pending_parts)
+            self._records.append(self._pending)
+            self._pending = None
+            self._pending_parts = []
+
+    def emit(self, event, level=NORMAL, **fields):
+        """記錄一個事件 (不合併)"""
+        t = self._now()
+        self._count(event, t)
+        self._close_pending()
+        self._records.append(dict(fields, event=event, level=level, t=round(t, 6)))
+        self._chars += len(fields.get("text") or "")
+        self._maybe_flush()
+
+    def delta(self, event, text="", level=NORMAL, key=None, **fields):
+        """
+        記錄一個 delta；與前一個同種類、同 key 的 delta 合併成一筆紀錄
+
+        合併後的紀錄取較低 (較常顯示) 的 level：DEBUG 的空 delta 後面接著一般文字時，
+        文字不會被併進只在 DEBUG 顯示的紀錄裡。
+
+        :param event: 事件種類，例如 "text_delta"、"code_input"
+        :param text: delta 文字
+        :param level: 紀錄等級
+        :param key: 區分不同來源的鍵 (例如 tool call 的 index)
+        """
+        t = self._now()
+        self._count(event, t)
+        if event in TOKEN_EVENTS and text and self.first_token is None:
+            self.first_token = t
+        pending = self._pending
+        if pending is None or pending["event"] != event or pending.get("key") != key:
+            self._close_pending()
+            pending = self._pending = dict(fields, event=event, level=level, t=round(t, 6), deltas=0)
+            if key is not None:
+                pending["key"] = key
+        pending["level"] = min(pending["level"], level)
+        pending["deltas"] += 1
+        pending["t_end"] = round(t, 6)
+        if text:
+            self._pending_parts.append(text)
+            self._chars += len(text)
+        self._maybe_flush()
+
+    def _count(self, event, t):
+        if self.first_event is None:
+            self.first_event = t
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    def _maybe_flush(self):
+        if self._chars >= self.max_chars or self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把目前累積的紀錄寫到所有 sink"""
+        self._close_pending()
+        self._last_flush = self.clock()
+        if not self._records:
+            return
+        records, self._records, self._chars = self._records, [], 0
+        self.n_flushes += 1
+        for sink in self.sinks:
+            sink.write(records)
+
+    def stats(self):
+        """
+        串流時間統計
+
+        :return: {"ttfe": 第一個事件, "ttft": 第一個 token, "total": 總延遲 (秒), "n_events", "counts"}
+        """
+        def r(t):
+            return round(t, 6) if t is not None else None
+
+        return {
+            "ttfe": r(self.first_event),
+            "ttft": r(self.first_token),
+            "total": r(self._now()),
+            "n_events": sum(self.counts.values()),
+            "n_flushes": self.n_flushes + 1,  # 含結束時的 flush
+            "counts": dict(self.counts),
+        }
+
+    def close(self):
+        """寫出剩餘內容與結束摘要，並關閉所有 sink (重複呼叫無作用)"""
+        if self.closed:
+            return
+        self.closed = True
+        self._close_pending()
+        self._records.append(dict(self.stats(), event="end", level=QUIET, t=round(self._now(), 6)))
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
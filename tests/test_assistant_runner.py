@@ -0,0 +1,149 @@
+"""
+以 fake_assistants_server 測試 assistant_runner.RunManager (不需連線 OpenAI)
+
+執行方式：
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import assistant_runner
+from assistant_runner import RunManager, create_async_client
+from fake_assistants_server import start_fake_server
+
+pytestmark = pytest.mark.filterwarnings("ignore:The Assistants API is deprecated:DeprecationWarning")
+
+
+@pytest.fixture
+def fake_server():
+    """啟動假伺服器的 factory：start(steps, final_status) -> server，測試結束時全部關閉"""
+    servers = []
+
+    def start(steps=3, final_status="completed"):
+        server = start_fake_server(steps=steps, final_status=final_status)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _runs(server):
+    """伺服器端紀錄的 run：{run_id: run dict}"""
+    return {run_id: entry["run"] for run_id, entry in server.RequestHandlerClass.state.runs.items()}
+
+
+async def _with_manager(server, func, **manager_kwargs):
+    client = create_async_client(api_key="test", base_url=server.base_url)
+    try:
+        return await func(RunManager(client, verbose=False, **manager_kwargs))
+    finally:
+        await client.close()
+
+
+def test_wait_polls_with_exponential_backoff(fake_server, monkeypatch):
+    server = fake_server(steps=5)
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def recording_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(assistant_runner.asyncio, "sleep", recording_sleep)
+
+    async def scenario(manager):
+        thread = await manager.client.beta.threads.create()
+        run = await manager.client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_test")
+        return await manager.wait(thread.id, run.id)
+
+    run = asyncio.run(_with_manager(server, scenario, initial_delay=0.01, backoff=2.0, max_delay=0.05))
+    assert run.status == "completed"
+    # 第 5 次查詢才結束：前 4 次之間各等待一次，間隔加倍且不超過 max_delay
+    assert delays == pytest.approx([0.01, 0.02, 0.04, 0.05])
+
+
+def test_wait_timeout_cancels_run(fake_server):
+    server = fake_server(steps=10 ** 6)
+
+    async def scenario(manager):
+        thread = await manager.client.beta.threads.create()
+        run = await manager.client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_test")
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.wait(thread.id, run.id, timeout=0.2)
+        return run.id
+
+    run_id = asyncio.run(_with_manager(server, scenario, initial_delay=0.01, max_delay=0.02))
+    assert _runs(server)[run_id]["status"] == "cancelled"
+
+
+def test_wait_without_cancel_on_timeout_leaves_run(fake_server):
+    server = fake_server(steps=10 ** 6)
+
+    async def scenario(manager):
+        thread = await manager.client.beta.threads.create()
+        run = await manager.client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_test")
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.wait(thread.id, run.id, timeout=0.1, cancel_on_timeout=False)
+        return run.id
+
+    run_id = asyncio.run(_with_manager(server, scenario, initial_delay=0.01, max_delay=0.02))
+    assert _runs(server)[run_id]["status"] == "in_progress"
+
+
+def test_run_many_returns_results_in_job_order(fake_server):
+    server = fake_server(steps=3)
+    jobs = [(f"asst_{i}", [{"role": "user", "content": f"job {i}"}]) for i in range(5)]
+
+    results = asyncio.run(_with_manager(server, lambda manager: manager.run_many(jobs),
+                                        initial_delay=0.01, max_delay=0.02, max_concurrency=2))
+    assert len(results) == len(jobs)
+    assert len({thread.id for thread, _ in results}) == len(jobs)
+    for (assistant_id, _), (thread, run) in zip(jobs, results):
+        assert run.status == "completed"
+        assert run.assistant_id == assistant_id
+        assert run.thread_id == thread.id
+
+
+def test_run_many_collects_timeouts_as_exceptions(fake_server):
+    server = fake_server(steps=10 ** 6)
+    jobs = [("asst_test", [{"role": "user", "content": "slow"}])] * 3
+
+    results = asyncio.run(_with_manager(server, lambda manager: manager.run_many(jobs, timeout=0.1),
+                                        initial_delay=0.01, max_delay=0.02))
+    assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+    assert {run["status"] for run in _runs(server).values()} == {"cancelled"}
+
+
+def test_stream_returns_final_run(fake_server):
+    server = fake_server(steps=3)
+
+    async def scenario(manager):
+        thread = await manager.client.beta.threads.create()
+        return await manager.stream(thread.id, "asst_test")
+
+    run = asyncio.run(_with_manager(server, scenario))
+    assert run.status == "completed"
+    assert _runs(server)[run.id]["status"] == "completed"
+
+
+def test_stream_timeout_cancels_run(fake_server):
+    server = fake_server(steps=10 ** 6)
+
+    async def scenario(manager):
+        thread = await manager.client.beta.threads.create()
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.stream(thread.id, "asst_test", timeout=0.2)
+
+    asyncio.run(_with_manager(server, scenario))
+    runs = _runs(server)
+    assert len(runs) == 1
+    assert [run["status"] for run in runs.values()] == ["cancelled"]
@@ -0,0 +1,78 @@
+"""
+image_extractor.DataUriExtractor：折行的 base64 與內容後面的文字
+
+執行方式：
+    python -m pytest tests
+"""
+import base64
+import hashlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_extractor import DataUriExtractor
+
+
+def _payload(n_bytes, seed=0):
+    data = hashlib.sha256(str(seed).encode()).digest() * (n_bytes // 32 + 1)
+    return data[:n_bytes], base64.b64encode(data[:n_bytes]).decode()
+
+
+def _wrap(b64, width=76, sep="\n"):
+    return sep.join(b64[i:i + width] for i in range(0, len(b64), width))
+
+
+def _extract(text, output_dir, step=None):
+    """依 step 切成多段 delta 餵入，回傳 [(圖片內容, ...)]"""
+    extractor = DataUriExtractor(str(output_dir))
+    step = step or len(text)
+    paths = []
+    for i in range(0, len(text), step):
+        paths += extractor.feed(text[i:i + step])
+    paths += extractor.close()
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return contents
+
+
+@pytest.mark.parametrize("step", [None, 1, 7, 100])
+def test_prose_after_unpadded_payload_is_not_decoded(tmp_path, step):
+    raw, b64 = _payload(768)  # 768 bytes -> 1024 個字元，沒有 padding
+    assert not b64.endswith("=")
+    text = f"data:image/png;base64,{b64}\n\nThe image shows the leak map.\n"
+    assert _extract(text, tmp_path, step) == [raw]
+
+
+@pytest.mark.parametrize("suffix", [" The image shows the leak map.", "\nThe image shows the leak map.",
+                                    "\n圖中標示了漏水區域。", "\n\n"])
+def test_wrapped_payload_ends_before_following_text(tmp_path, suffix):
+    raw, b64 = _payload(3000)
+    text = "見下圖\ndata:image/png;base64," + _wrap(b64) + suffix
+    assert _extract(text, tmp_path, step=13) == [raw]
+
+
+@pytest.mark.parametrize("step", [None, 1, 5, 64])
+def test_line_wrapped_payload_with_crlf_and_indent(tmp_path, step):
+    raw, b64 = _payload(3001)
+    text = "data:image/png;base64,\r\n    " + _wrap(b64, 64, "\r\n    ") + "\r\n\r\n說明"
+    assert _extract(text, tmp_path, step) == [raw]
+
+
+def test_short_last_line_closed_by_delimiter(tmp_path):
+    raw, b64 = _payload(3000)
+    wrapped = b64[:76] + "\n" + b64[76:-8] + "\n" + b64[-8:]  # 最後一行只有 8 個字元
+    text = f"![leak](data:image/png;base64,{wrapped}) 之後的文字"
+    assert _extract(text, tmp_path, step=3) == [raw]
+
+
+def test_second_image_after_short_word(tmp_path):
+    raw1, b64_1 = _payload(300, seed=1)
+    raw2, b64_2 = _payload(300, seed=2)
+    text = f"data:image/png;base64,{b64_1}\ndata:image/png;base64,{b64_2}\nend"
+    assert _extract(text, tmp_path, step=11) == [raw1, raw2]
@@ -0,0 +1,89 @@
+"""
+parse_inp_network(previous=...)：增量解析的 NetworkDiff 與空間索引的沿用
+
+執行方式：
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("pyproj")
+
+from inp_incremental import IncrementalParser
+from parse_inp import parse_inp, parse_inp_network
+from spatial_index import NetworkSpatialIndex
+
+INP = """[JUNCTIONS]
+;ID  Elev  Demand  Pattern
+J1   10    1.0
+J2   11    2.0
+J3   12    0.5
+
+[PIPES]
+;ID  Node1  Node2  Length  Diameter  Roughness
+P1   J1     J2     100     150       {p1}
+P2   J2     J3     120     100       100
+
+[COORDINATES]
+J1   250000  2650000
+J2   250100  2650000
+J3   250100  2650120
+
+[VERTICES]
+P2   250120  2650060
+
+[END]
+"""
+
+
+def _write(path, p1_roughness):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(INP.format(p1=p1_roughness))
+
+
+def test_roughness_edit_reports_one_pipe_and_keeps_index(tmp_path):
+    path = str(tmp_path / "network.inp")
+    _write(path, 130)
+    old = parse_inp_network(path)
+    index = NetworkSpatialIndex(old)
+
+    _write(path, 110)
+    new, diff = parse_inp_network(path, previous=old)
+    assert diff.modified_pipes == ["P1"]
+    assert diff.pipe_changes == {"roughness": ["P1"]}
+    assert not (diff.added_pipes or diff.removed_pipes or diff.modified_nodes)
+    assert new.pipe_roughness[new.pipe_index["P1"]] == 110
+
+    assert not diff.geometry_changed
+    assert index.apply_diff(diff) is index
+    assert index.network is new
+    assert [pipe for pipe, _ in index.nearest_pipes("J1")] == ["P1"]
+
+
+def test_update_reparses_only_the_edited_section(tmp_path):
+    path = str(tmp_path / "network.inp")
+    _write(path, 130)
+    parser = IncrementalParser(path, cache_dir=None)
+    index = NetworkSpatialIndex(parser.network)
+
+    _write(path, 110)
+    diff = parser.update()
+    assert diff.changed_sections == ["PIPES"]
+    assert parser.stats["parsed"] == ["PIPES"]
+    assert diff.modified_pipes == ["P1"]
+    assert index.apply_diff(diff) is index
+
+
+def test_parse_inp_with_previous_returns_dict_and_diff(tmp_path):
+    path = str(tmp_path / "network.inp")
+    _write(path, 130)
+    old = parse_inp_network(path)
+
+    data, diff = parse_inp(path, previous=old)
+    assert data == old.to_dict()
+    assert diff.is_empty
@@ -0,0 +1,50 @@
+"""
+layer_export：GeoJSON 串流輸出的屬性內容
+
+執行方式：
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+gpd = pytest.importorskip("geopandas")
+shapely = pytest.importorskip("shapely")
+
+from layer_export import export_layers
+
+
+def _layer():
+    return gpd.GeoDataFrame(
+        {"name": ["a b", "c d\u0085e", "plain"], "value": [0.123456789012345, 1234567.891234567, 2.0]},
+        geometry=[shapely.Point(121.0, 24.0), shapely.Point(121.1, 24.1), shapely.Point(121.2, 24.2)],
+        crs=4326,
+    )
+
+
+@pytest.mark.parametrize("fmt", ["geojson", "geojsonl"])
+def test_unicode_line_separators_keep_features_aligned(tmp_path, fmt):
+    gdf = _layer()
+    path = tmp_path / f"layer.{fmt}"
+    assert export_layers([("valve.shp", gdf)], str(path), fmt) == len(gdf)
+    text = path.read_text(encoding="utf-8")
+    if fmt == "geojson":
+        features = json.loads(text)["features"]
+    else:
+        features = [json.loads(line) for line in text.split("\n") if line]
+    assert [f["properties"]["name"] for f in features] == gdf["name"].tolist()
+    assert [f["geometry"]["coordinates"] for f in features] == [[121.0, 24.0], [121.1, 24.1], [121.2, 24.2]]
+    assert all(f["properties"]["src_layer"] == "valve.shp" for f in features)
+
+
+def test_float_attributes_keep_full_precision(tmp_path):
+    gdf = _layer()
+    path = tmp_path / "layer.geojson"
+    export_layers([("valve.shp", gdf)], str(path), source_column=False)
+    values = [f["properties"]["value"] for f in json.loads(path.read_text(encoding="utf-8"))["features"]]
+    assert values == pytest.approx(gdf["value"].tolist(), rel=1e-14, abs=0)
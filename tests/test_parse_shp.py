@@ -0,0 +1,65 @@
+"""
+parse_shp.list_shapefiles / load_shapefiles：ZIP 內的同名圖層與大小寫不同的檔名
+
+執行方式：
+    python -m pytest tests
+"""
+import os
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+gpd = pytest.importorskip("geopandas")
+shapely = pytest.importorskip("shapely")
+
+from parse_shp import MAIN_LAYERS, list_shapefiles, load_shapefiles
+
+SHP_PARTS = (".shp", ".shx", ".dbf", ".prj")
+
+
+def _write_zip(tmp_path, layers):
+    """layers：{ZIP 內的 .shp 路徑: 圖徵數}；每個圖層寫成 shapefile 後打包"""
+    zip_path = tmp_path / "network.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        for i, (member, n) in enumerate(layers.items()):
+            gdf = gpd.GeoDataFrame({"id": list(range(n))},
+                                   geometry=[shapely.Point(250000 + j, 2650000 + j) for j in range(n)],
+                                   crs="EPSG:3826")
+            out = tmp_path / f"layer{i}.shp"
+            gdf.to_file(out)
+            stem, _ = os.path.splitext(member)
+            ext_case = str.upper if member.endswith(".SHP") else str.lower
+            for part in SHP_PARTS:
+                zf.write(str(out)[:-4] + part, stem + ext_case(part))
+    return str(zip_path)
+
+
+def test_upper_case_names_are_lowered(tmp_path):
+    zip_path = _write_zip(tmp_path, {"PIPE.SHP": 2, "data/Valve.shp": 1})
+    assert sorted(list_shapefiles(zip_path)) == ["pipe.shp", "valve.shp"]
+
+    shapefiles = load_shapefiles(zip_path, layers=MAIN_LAYERS, max_workers=1)
+    assert {name: len(gdf) for name, gdf in shapefiles.items()} == {"pipe.shp": 2, "valve.shp": 1}
+
+
+def test_duplicate_basenames_are_kept_by_layer_filter(tmp_path, capsys):
+    zip_path = _write_zip(tmp_path, {"a/pipe.shp": 2, "b/PIPE.SHP": 3, "a/valve.shp": 1})
+    assert sorted(list_shapefiles(zip_path)) == ["a/pipe.shp", "b/pipe.shp", "valve.shp"]
+
+    shapefiles = load_shapefiles(zip_path, layers=["pipe"], max_workers=1)
+    assert {name: len(gdf) for name, gdf in shapefiles.items()} == {"a/pipe.shp": 2, "b/pipe.shp": 3}
+    assert "找不到圖層" not in capsys.readouterr().out
+
+
+def test_merge_includes_every_copy_of_main_layers(tmp_path):
+    from parse_shp import merge_all_to_single_geojson
+
+    zip_path = _write_zip(tmp_path, {"a/pipe.shp": 2, "b/PIPE.SHP": 3, "Other.shp": 4})
+    out = tmp_path / "merged.geojsonl"
+    merge_all_to_single_geojson(load_shapefiles(zip_path, max_workers=1), str(out))
+    with open(out, encoding="utf-8") as f:
+        assert sum(1 for line in f if line.strip()) == 5
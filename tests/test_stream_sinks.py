@@ -0,0 +1,50 @@
+"""
+stream_sinks.StreamBuffer：delta 合併與 verbosity 過濾
+
+執行方式：
+    python -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stream_sinks import DEBUG, NORMAL, MemorySink, StreamBuffer
+
+
+def _buffer(sink):
+    return StreamBuffer([sink], flush_interval=1e9, max_chars=1 << 20, clock=lambda: 0.0)
+
+
+def test_debug_empty_delta_does_not_hide_following_text():
+    sink = MemorySink(verbosity=NORMAL)
+    buffer = _buffer(sink)
+    buffer.delta("text_delta", level=DEBUG)
+    buffer.delta("text_delta", "hello")
+    buffer.delta("text_delta", level=DEBUG)
+    buffer.delta("text_delta", " world")
+    buffer.close()
+    assert sink.text() == "hello world"
+
+
+def test_consecutive_deltas_merge_into_one_record():
+    sink = MemorySink(verbosity=DEBUG)
+    buffer = _buffer(sink)
+    for part in ("a", "b", "c"):
+        buffer.delta("text_delta", part)
+    buffer.delta("code_input", "x = 1", key=0)
+    buffer.delta("code_input", "\n", key=0)
+    buffer.close()
+    text, code = [r for r in sink.records if r["event"] != "end"]
+    assert (text["text"], text["deltas"], text["level"]) == ("abc", 3, NORMAL)
+    assert (code["text"], code["deltas"], code["key"]) == ("x = 1\n", 2, 0)
+
+
+def test_debug_only_deltas_stay_hidden_at_normal_verbosity():
+    sink = MemorySink(verbosity=NORMAL)
+    buffer = _buffer(sink)
+    buffer.delta("run_step_delta", level=DEBUG)
+    buffer.delta("run_step_delta", level=DEBUG)
+    buffer.close()
+    assert [r["event"] for r in sink.records] == ["end"]
@@ -0,0 +1,178 @@
+"""
+將解析後的管網輸出成給 readinpmap.html / readinpmap - leak.html 直接載入的二進位資料包
+
+瀏覽器不再讀取 INP 文字、逐行解析並以 proj4 轉換座標，而是把 network.bin 整份讀成
+ArrayBuffer，依 index.json 記錄的位移建立 typed array (不複製、不解析)：
+    - node_xy / path_xy：Float32 交錯的 (lng, lat)，為相對於 origin 的差值
+      (直接存經緯度的 Float32 只有約 1 m 精度，差值可保留到公釐等級)；無座標的節點為 NaN
+    - path_offsets：Uint32，第 i 條管線的完整路徑 (起點 + 彎曲點 + 終點) 為
+      path_xy[2 * path_offsets[i]:2 * path_offsets[i + 1]]
+    - node_base_demand (熱力圖)、node_elevation、pipe_length / pipe_diameter / pipe_roughness：Float32
+    - pipe_start / pipe_end：Uint32 節點索引；node_listed：Uint8 (出現在 JUNCTIONS 或有效 COORDINATES)
+    - node_ids / pipe_ids / node_pattern：以換行分隔的 UTF-8 文字 (只在顯示 tooltip 時才解碼)
+
+所有數值皆為 little-endian，每個陣列的位移對齊 4 bytes。
+
+使用方式：
+    python viewer_bundle.py 0401-13-01-12.inp --output-dir viewer_bundle
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from network_model import WGS84
+
+BUNDLE_FORMAT = "network-bundle-v1"
+INDEX_FILE = "index.json"
+DATA_FILE = "network.bin"
+ALIGNMENT = 4
+DTYPES = {"float32": "<f4", "uint32": "<u4", "uint8": "u1"}
+
+
+def pipe_paths(network):
+    """
+    組出每條管線的完整路徑 (起點 + 彎曲點 + 終點)，沒有座標的起迄點會被略過
+
+    :param network: network_model.Network
+    :return: (path_xy (M, 2), path_offsets (管線數 + 1,))
+    """
+    start_ok = np.isfinite(network.node_xy[network.pipe_start]).all(axis=1)
+    end_ok = np.isfinite(network.node_xy[network.pipe_end]).all(axis=1)
+    counts = np.diff(network.vertex_offsets) + start_ok + end_ok
+    path_offsets = np.zeros(network.n_pipes + 1, dtype=np.int64)
+    np.cumsum(counts, out=path_offsets[1:])
+
+    path_xy = np.empty((int(path_offsets[-1]), 2))
+    first = path_offsets[:-1]
+    last = path_offsets[1:] - 1
+    path_xy[first[start_ok]] = network.node_xy[network.pipe_start[start_ok]]
+    path_xy[last[end_ok]] = network.node_xy[network.pipe_end[end_ok]]
+    inner = np.ones(len(path_xy), dtype=bool)
+    inner[first[start_ok]] = False
+    inner[last[end_ok]] = False
+    path_xy[inner] = network.vertex_xy
+    return path_xy, path_offsets
+
+
+def _bounds(*arrays):
+    xy = np.concatenate([a.reshape(-1, 2) for a in arrays])
+    xy = xy[np.isfinite(xy).all(axis=1)]
+    if len(xy) == 0:
+        return None
+    return [float(v) for v in (*xy.min(axis=0), *xy.max(axis=0))]
+
+
+def _text(values):
+    return np.frombuffer("\n".join(np.asarray(values, dtype=str).tolist()).encode("utf-8"), dtype=np.uint8)
+
+
+def build_bundle(network):
+    """
+    :param network: network_model.Network (座標需為 WGS84)
+    :return: (index dict, {陣列名稱: (dtype 名稱, ndarray)})
+    """
+    if network.crs != WGS84:
+        raise ValueError("viewer bundle 需要 WGS84 座標 (parse 時 reproject=True)")
+
+    path_xy, path_offsets = pipe_paths(network)
+    if len(path_xy) > np.iinfo(np.uint32).max:
+        raise ValueError("路徑點數超過 Uint32 上限")
+    bounds = _bounds(network.node_xy, path_xy)
+    origin = np.array(bounds[:2] if bounds else [0.0, 0.0])
+
+    arrays = {
+        "node_xy": ("float32", network.node_xy - origin),
+        "node_listed": ("uint8", network.node_listed),
+        "node_base_demand": ("float32", network.node_base_demand),
+        "node_elevation": ("float32", network.node_elevation),
+        "pipe_start": ("uint32", network.pipe_start),
+        "pipe_end": ("uint32", network.pipe_end),
+        "pipe_length": ("float32", network.pipe_length),
+        "pipe_diameter": ("float32", network.pipe_diameter),
+        "pipe_roughness": ("float32", network.pipe_roughness),
+        "path_offsets": ("uint32", path_offsets),
+        "path_xy": ("float32", path_xy - origin),
+        "node_ids": ("uint8", _text(network.node_ids)),
+        "pipe_ids": ("uint8", _text(network.pipe_ids)),
+        "node_pattern": ("uint8", _text(network.node_pattern)),
+    }
+    index = {
+        "format": BUNDLE_FORMAT,
+        "crs": network.crs,
+        "origin": origin.tolist(),
+        "bounds": bounds,
+        "counts": {"nodes": int(network.n_nodes), "pipes": int(network.n_pipes), "path_points": len(path_xy)},
+        "text": {"node_ids": int(network.n_nodes), "pipe_ids": int(network.n_pipes),
+                 "node_pattern": int(network.n_nodes)},  # 文字陣列名稱 -> 元素數
+    }
+    return index, arrays
+
+
+def write_viewer_bundle(network, output_dir="viewer_bundle"):
+    """
+    將管網寫成 index.json + network.bin
+
+    :param network: network_model.Network (座標需為 WGS84)
+    :param output_dir: 輸出目錄
+    :return: [index.json 路徑, network.bin 路徑]
+    """
+    index, arrays = build_bundle(network)
+    os.makedirs(output_dir, exist_ok=True)
+    data_path = os.path.join(output_dir, DATA_FILE)
+    index_path = os.path.join(output_dir, INDEX_FILE)
+
+    entries = {}
+    offset = 0
+    with open(data_path, "wb") as f:
+        for name, (dtype, values) in arrays.items():
+            pad = -offset % ALIGNMENT
+            f.write(b"\0" * pad)
+            offset += pad
+            data = np.ascontiguousarray(values, dtype=DTYPES[dtype]).reshape(-1)
+            f.write(data.tobytes())
+            entries[name] = {"dtype": dtype, "offset": offset, "length": int(data.size)}
+            offset += data.nbytes
+    index["data"] = DATA_FILE
+    index["bytes"] = offset
+    index["arrays"] = entries
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    print(f"[INFO] viewer bundle ({offset} bytes) saved to {output_dir}")
+    return [index_path, data_path]
+
+
+def load_viewer_bundle(output_dir="viewer_bundle"):
+    """
+    讀回 write_viewer_bundle 的輸出 (與瀏覽器相同的方式，數值陣列不複製)
+
+    :return: (index dict, {陣列名稱: ndarray 或 str 列表})；座標為相對於 index["origin"] 的差值
+    """
+    with open(os.path.join(output_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"不支援的格式: {index.get('format')}")
+    buffer = np.memmap(os.path.join(output_dir, index["data"]), dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, entry in index["arrays"].items():
+        dtype = np.dtype(DTYPES[entry["dtype"]])
+        values = np.frombuffer(buffer, dtype=dtype, count=entry["length"], offset=entry["offset"])
+        if name in index["text"]:
+            values = bytes(values).decode("utf-8").split("\n") if index["text"][name] else []
+        arrays[name] = values
+    return index, arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inp_file", help="INP 檔案路徑")
+    parser.add_argument("--output-dir", default="viewer_bundle")
+    args = parser.parse_args()
+
+    from inp_cache import cached_parse_inp_network
+    write_viewer_bundle(cached_parse_inp_network(args.inp_file), args.output_dir)
+
+
+if __name__ == "__main__":
+    main()